@@ -0,0 +1,14 @@
+from django.contrib import admin
+
+from .models import Job
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = (
+        'id', 'name', 'lane', 'priority', 'status',
+        'attempts', 'run_at', 'finished_at',)
+    list_filter = ('status', 'lane',)
+    search_fields = ('=name', '=idempotency_key',)
+    readonly_fields = ('created_at', 'locked_by', 'locked_at',)
+    show_full_result_count = False
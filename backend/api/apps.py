@@ -1,5 +1,17 @@
 from django.apps import AppConfig
+from django.utils.module_loading import autodiscover_modules
 
 
 class ApiConfig(AppConfig):
     name = 'api'
+
+    def ready(self):
+        # web workers enqueue jobs too, so the registry is filled here
+        autodiscover_modules('tasks')
+        # DRF imports the throttle while building APIView, which the
+        # metrics view needs in turn
+        from . import signals  # noqa: F401
+        from . import metrics, throttling
+        from .db import pool
+        metrics.register('throttling', throttling.stats)
+        metrics.register('db_pool', pool.stats)
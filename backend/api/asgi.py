@@ -0,0 +1,351 @@
+import asyncio
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from asgiref.wsgi import WsgiToAsgi
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.handlers.exception import (convert_exception_to_response,
+                                            response_for_exception)
+from django.core.handlers.wsgi import WSGIRequest
+from django.core.paginator import InvalidPage
+from django.db import close_old_connections
+from django.urls import Resolver404, resolve
+from django.utils.module_loading import import_string
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+
+from . import invalidation, profiling, throttling, warmup
+from .fast_serializers import recipe_cards
+from .pagination import CountPaginator
+from .querylog import log_queries
+from .views import IngredientViewSet, RecipeViewSet, TagViewSet
+
+
+def build_environ(scope, body):
+    """WSGI environ for an ASGI HTTP scope, as Django's request expects."""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get(
+            'root_path', ''
+        ).encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f'HTTP/{scope.get("http_version", "1.1")}',
+        'REMOTE_ADDR': client[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', ()):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = f'HTTP_{name}'
+        value = value.decode('latin-1')
+        if name in environ:
+            value = f'{environ[name]},{value}'
+        environ[name] = value
+    return environ
+
+
+def load_middleware(get_response):
+    """``settings.MIDDLEWARE`` chain around ``get_response``, built the
+    way Django's handler builds it."""
+    handler = convert_exception_to_response(get_response)
+    for path in reversed(settings.MIDDLEWARE):
+        try:
+            middleware = import_string(path)(handler)
+        except MiddlewareNotUsed:
+            continue
+        handler = convert_exception_to_response(middleware)
+    return handler
+
+
+class DatabaseExecutor:
+    """Thread pool running ORM calls for the event loop.
+
+    Every call ends with ``close_old_connections``, which hands the
+    connection back to the pool of ``api.db.postgresql``, so
+    ``DB_THREADS`` bounds the connections async reads hold at once.
+    """
+
+    def __init__(self, threads):
+        self.pool = ThreadPoolExecutor(
+            max_workers=threads, thread_name_prefix='async-db'
+        )
+
+    def run(self, request, func, *args):
+        return asyncio.get_running_loop().run_in_executor(
+            self.pool, self.call, request, func, args
+        )
+
+    @staticmethod
+    def call(request, func, args):
+        try:
+            with log_queries(request):
+                return func(*args)
+        finally:
+            close_old_connections()
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False)
+
+
+class AsyncReadApplication:
+    """ASGI application serving hot read endpoints natively.
+
+    GET and HEAD requests for the recipe list and detail, tags and the
+    ingredient search run on the event loop. The viewsets still do
+    authentication, filtering and serialization, while their ORM calls
+    go to ``DatabaseExecutor``, with independent queries in parallel:
+    the page rows next to the count, then tags next to ingredients of
+    cards missing from ``recipe_cards``. The middleware chain is applied
+    to the finished response, so its view hooks are taken care of here:
+    the in-flight limit of ``api.throttling`` is checked before the view
+    runs, and requests to profile go to the WSGI application, whose
+    middleware profiles them whole. Token bucket throttling runs in the
+    view itself.
+
+    Everything else, writes and the browsable API included, goes to the
+    regular WSGI application in a thread.
+    """
+
+    def __init__(self, wsgi_application):
+        self.wsgi = WsgiToAsgi(wsgi_application)
+        self.executor = DatabaseExecutor(settings.ASYNC_READS['DB_THREADS'])
+        self.middleware = load_middleware(
+            lambda request: request.async_response
+        )
+        self.routes = {
+            (RecipeViewSet, 'list'): self.paginated_list,
+            (RecipeViewSet, 'retrieve'): self.retrieve,
+            (TagViewSet, 'list'): self.plain_list,
+            (IngredientViewSet, 'list'): self.plain_list,
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        route = self.get_route(scope)
+        if route is None:
+            return await self.wsgi(scope, receive, send)
+        body = b''
+        more_body = True
+        while more_body:
+            message = await receive()
+            body += message.get('body', b'')
+            more_body = message.get('more_body', False)
+        request = WSGIRequest(build_environ(scope, body))
+        request.resolver_match = route
+        if profiling.should_profile(request, settings.PROFILING_SAMPLE_RATE):
+            return await self.wsgi(
+                self.profiled_scope(scope), self.replay(body), send
+            )
+        release, rejected = throttling.admit(request)
+        try:
+            try:
+                request.async_response = (
+                    await self.dispatch(request, route)
+                    if rejected is None else rejected
+                )
+                response = await self.executor.run(
+                    request, self.middleware, request
+                )
+            except Exception as exc:
+                response = response_for_exception(request, exc)
+            await self.send_response(
+                response, send, scope['method'] == 'HEAD'
+            )
+        finally:
+            if release is not None:
+                release.close()
+
+    @staticmethod
+    def profiled_scope(scope):
+        """The scope with a fresh profiling token, so the WSGI
+        middleware profiles a sampled request too."""
+        headers = [
+            (name, value) for name, value in scope.get('headers', ())
+            if name.lower() != b'x-profile'
+        ]
+        headers.append((b'x-profile', profiling.make_token().encode()))
+        return {**scope, 'headers': headers}
+
+    @staticmethod
+    def replay(body):
+        async def receive():
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+        return receive
+
+    def get_route(self, scope):
+        if scope['type'] != 'http' or scope['method'] not in ('GET', 'HEAD'):
+            return None
+        accept = dict(scope.get('headers', ())).get(b'accept', b'')
+        if b'text/html' in accept or b'format=' in scope.get(
+            'query_string', b''
+        ):
+            return None
+        try:
+            match = resolve(scope['path'])
+        except Resolver404:
+            return None
+        view = match.func
+        actions = getattr(view, 'actions', {})
+        if (getattr(view, 'cls', None), actions.get('get')) not in self.routes:
+            return None
+        return match
+
+    async def dispatch(self, request, match):
+        func = match.func
+        handler = self.routes[(func.cls, func.actions['get'])]
+        view = func.cls(**func.initkwargs)
+        view.action_map = {'head': func.actions['get'], **func.actions}
+        for method, action in view.action_map.items():
+            setattr(view, method, getattr(view, action))
+        view.args = match.args
+        view.kwargs = match.kwargs
+        view.headers = view.default_response_headers
+        request = view.request = view.initialize_request(request)
+
+        def db(func, *args):
+            return self.executor.run(request, func, *args)
+
+        try:
+            await db(view.initial, request)
+            response = await handler(view, request, db)
+        except Exception as exc:
+            response = view.handle_exception(exc)
+        response = view.finalize_response(request, response)
+        if hasattr(response, 'render'):
+            response.render()
+        return response
+
+    async def paginated_list(self, view, request, db):
+        queryset = await db(lambda: view.filter_queryset(
+            view.get_queryset()
+        ))
+        pagination = view.paginator
+        page_size = pagination.get_page_size(request)
+        number = request.query_params.get(pagination.page_query_param, 1)
+        try:
+            offset = (int(number) - 1) * page_size
+        except (TypeError, ValueError):
+            offset = -1
+        rows = None
+        if offset >= 0:
+            count, rows = await asyncio.gather(
+                db(pagination.get_count, queryset),
+                db(list, queryset[offset:offset + page_size + 1]),
+            )
+        else:
+            count = await db(pagination.get_count, queryset)
+        paginator = CountPaginator(
+            queryset, page_size, count_func=lambda queryset: count
+        )
+        if number in pagination.last_page_strings:
+            number = paginator.num_pages
+        try:
+            number = paginator.validate_number(number)
+        except InvalidPage as exc:
+            raise NotFound(pagination.invalid_page_message.format(
+                page_number=number, message=str(exc)
+            ))
+        if rows is None:
+            offset = (number - 1) * page_size
+            rows = await db(list, queryset[offset:offset + page_size + 1])
+        pagination.request = request
+        pagination.page = paginator.make_page(rows, number)
+        rows = pagination.page.object_list
+        etag = view.get_etag(rows, request.get_full_path(), paginator.count)
+        response = view.not_modified(etag, None)
+        if response is None:
+            response = pagination.get_paginated_response(
+                await self.represent_recipes(view, rows, db)
+            )
+        return view.set_validators(response, etag, None)
+
+    async def retrieve(self, view, request, db):
+        instance = await db(view.get_object)
+        etag = view.get_etag([instance], request.get_full_path())
+        last_modified = view.get_last_modified(instance)
+        response = view.not_modified(etag, last_modified)
+        if response is None:
+            data = await self.represent_recipes(view, [instance], db)
+            response = Response(data[0])
+        return view.set_validators(response, etag, last_modified)
+
+    async def plain_list(self, view, request, db):
+        return Response(await db(lambda: view.get_serializer(
+            view.filter_queryset(view.get_queryset()), many=True
+        ).data))
+
+    async def represent_recipes(self, view, rows, db):
+        """``RecipeReadFastSerializer.prefetch`` with the tag and
+        ingredient queries running side by side."""
+        serializer = view.get_serializer(rows, many=True).child
+        cached = serializer.selected_fields is None
+        keys = {row['id']: serializer.card_key(row) for row in rows}
+        cards = {}
+        if cached:
+            cards = await db(recipe_cards.get_many, keys.values())
+        missing = [row for row in rows if keys[row['id']] not in cards]
+        if missing:
+            recipe_ids = [row['id'] for row in missing]
+            tags, ingredients = await asyncio.gather(
+                db(serializer.load_tags, recipe_ids),
+                db(serializer.load_ingredients, recipe_ids),
+            )
+            built = {
+                keys[row['id']]: card for row, card in zip(
+                    missing, serializer.make_cards(missing, tags, ingredients)
+                )
+            }
+            if cached:
+                await db(recipe_cards.set_many, built)
+            cards.update(built)
+        related = {'cards': cards, 'keys': keys}
+        return [serializer.represent(row, related) for row in rows]
+
+    async def send_response(self, response, send, head=False):
+        headers = [
+            (name.encode('latin-1'), value.encode('latin-1'))
+            for name, value in response.items()
+        ]
+        for cookie in response.cookies.values():
+            headers.append(
+                (b'set-cookie', cookie.output(header='').strip().encode())
+            )
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': headers,
+        })
+        await send({
+            'type': 'http.response.body',
+            'body': b'' if head else response.content,
+        })
+        response.close()
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await asyncio.get_running_loop().run_in_executor(
+                    None, warmup.run
+                )
+                invalidation.listener.start()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                invalidation.listener.stop()
+                self.executor.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
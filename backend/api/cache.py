@@ -0,0 +1,98 @@
+import threading
+from collections import OrderedDict
+
+from django.core.cache import caches
+
+
+class LRUCache:
+    """Thread-safe in-process LRU limited by the number of entries."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_many(self, keys):
+        found = {}
+        with self.lock:
+            for key in keys:
+                if key in self.data:
+                    self.data.move_to_end(key)
+                    found[key] = self.data[key]
+        return found
+
+    def set_many(self, mapping):
+        if self.maxsize <= 0:
+            return
+        with self.lock:
+            for key, value in mapping.items():
+                self.data[key] = value
+                self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def discard(self, match):
+        """Drop the entries whose key ``match`` accepts."""
+        with self.lock:
+            for key in [key for key in self.data if match(key)]:
+                del self.data[key]
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+
+class TwoTierCache:
+    """In-process LRU in front of a shared Django cache.
+
+    Values must never change for a key, put a version into the key
+    instead - the local tier is not invalidated across workers.
+    """
+
+    def __init__(self, alias=None, local_maxsize=1000, timeout=None):
+        self.alias = alias
+        self.timeout = timeout
+        self.local = LRUCache(local_maxsize)
+        self.lock = threading.Lock()
+        self.hits = {'local': 0, 'shared': 0, 'miss': 0}
+
+    @property
+    def shared(self):
+        return caches[self.alias] if self.alias else None
+
+    def get_many(self, keys):
+        keys = list(keys)
+        found = self.local.get_many(keys)
+        local = len(found)
+        missing = [key for key in keys if key not in found]
+        if missing and self.shared is not None:
+            shared = self.shared.get_many(missing)
+            self.local.set_many(shared)
+            found.update(shared)
+        with self.lock:
+            self.hits['local'] += local
+            self.hits['shared'] += len(found) - local
+            self.hits['miss'] += len(keys) - len(found)
+        return found
+
+    def set_many(self, mapping):
+        self.local.set_many(mapping)
+        if self.shared is not None:
+            self.shared.set_many(mapping, self.timeout)
+
+    def clear(self):
+        self.local.clear()
+
+    def stats(self):
+        with self.lock:
+            hits = dict(self.hits)
+        total = sum(hits.values())
+        return {
+            **hits,
+            'local_size': len(self.local.data),
+            'local_maxsize': self.local.maxsize,
+            'hit_rate': (
+                (hits['local'] + hits['shared']) / total
+                if total else None
+            ),
+        }
@@ -0,0 +1,176 @@
+import os
+import threading
+import time
+from collections import Counter, deque
+from functools import partial
+
+from django.conf import settings
+
+
+class PoolTimeoutError(Exception):
+    pass
+
+
+class ConnectionPool:
+    """Bounded pool of DB-API connections shared by the threads of a
+    process.
+
+    At most ``SIZE`` connections are open, a thread that finds none
+    free waits up to ``TIMEOUT`` seconds. A connection idle for
+    ``CHECK_AFTER`` seconds is pinged on checkout and replaced when the
+    ping fails, one older than ``MAX_AGE`` is closed on checkin.
+    """
+
+    def __init__(self, size, timeout, max_age, check_after):
+        self.size = size
+        self.timeout = timeout
+        self.max_age = max_age
+        self.check_after = check_after
+        self.condition = threading.Condition()
+        # (connection, created, returned), the last returned on the right
+        self.idle = deque()
+        self.in_use = 0
+        self.counter = Counter()
+
+    def checkout(self, connect):
+        """Return ``(connection, created)``, opening a connection with
+        ``connect()`` when no idle one is usable."""
+        deadline = time.monotonic() + self.timeout
+        with self.condition:
+            self.counter['checkouts'] += 1
+            if not self.idle and self.in_use >= self.size:
+                self.counter['waits'] += 1
+            while not self.idle and self.in_use >= self.size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.counter['timeouts'] += 1
+                    raise PoolTimeoutError(
+                        f'No free connection in {self.timeout}s, '
+                        f'{self.size} in use.'
+                    )
+                self.condition.wait(remaining)
+            self.in_use += 1
+            entry = self.idle.pop() if self.idle else None
+        try:
+            if entry is not None:
+                connection, created, returned = entry
+                if self.usable(connection, returned):
+                    return connection, created
+                self.discard(connection)
+                self.incr('reconnects')
+            connection = connect()
+            self.incr('connects')
+            return connection, time.monotonic()
+        except BaseException:
+            self.release()
+            raise
+
+    def usable(self, connection, returned):
+        if time.monotonic() - returned < self.check_after:
+            return True
+        self.incr('checks')
+        try:
+            cursor = connection.cursor()
+            cursor.execute('SELECT 1')
+            cursor.close()
+        except Exception:
+            return False
+        return True
+
+    def checkin(self, connection, created):
+        now = time.monotonic()
+        try:
+            # whatever the last user left open must not leak to the next
+            connection.rollback()
+        except Exception:
+            self.discard(connection)
+        else:
+            if now - created >= self.max_age:
+                self.discard(connection)
+            else:
+                with self.condition:
+                    self.idle.append((connection, created, now))
+        self.release()
+
+    def discard(self, connection):
+        self.incr('discards')
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def incr(self, name):
+        with self.condition:
+            self.counter[name] += 1
+
+    def release(self):
+        with self.condition:
+            self.in_use -= 1
+            self.condition.notify()
+
+    def stats(self):
+        with self.condition:
+            return {
+                **self.counter,
+                'size': self.size,
+                'in_use': self.in_use,
+                'idle': len(self.idle),
+            }
+
+
+# one pool per alias in each process, a forked worker never reuses the
+# connections of its parent
+pools = {}
+pools_lock = threading.Lock()
+
+
+def get_pool(alias):
+    key = (alias, os.getpid())
+    with pools_lock:
+        if key not in pools:
+            options = settings.DATABASE_POOL
+            pools[key] = ConnectionPool(
+                size=options['SIZE'],
+                timeout=options['TIMEOUT'],
+                max_age=options['MAX_AGE'],
+                check_after=options['CHECK_AFTER'],
+            )
+        return pools[key]
+
+
+def stats():
+    return {
+        alias: pool.stats()
+        for (alias, pid), pool in list(pools.items())
+        if pid == os.getpid()
+    }
+
+
+class PooledDatabaseWrapperMixin:
+    """Takes connections from ``get_pool`` and gives them back on close.
+
+    With ``CONN_MAX_AGE = 0`` Django closes the connection at the end of
+    every request, which now returns it to the pool instead of tearing
+    it down. A connection closed inside ``atomic`` is dropped, Django
+    keeps referring to it until the block exits.
+    """
+
+    def get_new_connection(self, conn_params):
+        try:
+            connection, self.pool_created = get_pool(self.alias).checkout(
+                partial(super().get_new_connection, conn_params)
+            )
+        except PoolTimeoutError as exc:
+            raise self.Database.OperationalError(str(exc))
+        return connection
+
+    def _close(self):
+        if self.connection is None:
+            return
+        with self.wrap_database_errors:
+            pool = get_pool(self.alias)
+            if self.in_atomic_block:
+                pool.discard(self.connection)
+                pool.release()
+            else:
+                pool.checkin(self.connection, self.pool_created)
@@ -0,0 +1,363 @@
+from collections import defaultdict
+from itertools import chain
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.utils.functional import cached_property
+from recipe.models import Recipe, RecipeIngredient
+from rest_framework import serializers
+from user.models import Subscribe
+
+from . import invalidation, metrics
+from .cache import TwoTierCache
+
+recipe_cards = TwoTierCache(
+    alias=settings.RECIPE_CARD_CACHE['ALIAS'],
+    local_maxsize=settings.RECIPE_CARD_CACHE['LOCAL_MAXSIZE'],
+    timeout=settings.RECIPE_CARD_CACHE['TIMEOUT'],
+)
+metrics.register('recipe_card_cache', recipe_cards.stats)
+
+
+def card_key_prefix(recipe_id):
+    return f'recipe-card:1:{recipe_id}:'
+
+
+def evict_recipe_cards(recipe_ids):
+    """Drop outdated cards of changed recipes from the local tier.
+
+    Card keys carry ``updated_at``, so an outdated card is never served,
+    but it would keep its LRU slot until pushed out.
+    """
+    if recipe_ids is None:
+        recipe_cards.clear()
+        return
+    prefixes = tuple(map(card_key_prefix, recipe_ids))
+    recipe_cards.local.discard(lambda key: key.startswith(prefixes))
+
+
+def clear_recipe_cards(keys):
+    # tag and ingredient changes touch their recipes without events
+    recipe_cards.clear()
+
+
+invalidation.subscribe('recipe', evict_recipe_cards)
+invalidation.subscribe('tag', clear_recipe_cards)
+invalidation.subscribe('ingredient', clear_recipe_cards)
+
+
+def split_param(value):
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+class FlatListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        rows = list(data)
+        related = self.child.prefetch(rows)
+        return [self.child.represent(row, related) for row in rows]
+
+
+class FlatSerializer(serializers.BaseSerializer):
+    """Read-only serializer working from ``.values()`` rows.
+
+    Related data for a whole page is loaded in ``prefetch`` with one
+    query per relation, ``represent`` then only builds plain dicts.
+    The output matches the ModelSerializer it replaces field for field.
+
+    ``field_sources`` maps every output field to the columns it is built
+    from. ``?fields=a,b`` and ``?omit=c`` narrow the output; columns and
+    relations behind dropped fields are not selected or loaded at all.
+    """
+    field_sources = {}
+    required_values = ()
+
+    class Meta:
+        list_serializer_class = FlatListSerializer
+
+    @classmethod
+    def select_fields(cls, request):
+        """Requested output fields, None when all of them are wanted."""
+        params = getattr(request, 'query_params', {})
+        fields = split_param(params.get('fields', ''))
+        omit = split_param(params.get('omit', ''))
+        if not fields and not omit:
+            return None
+        return (fields or set(cls.field_sources)) & (
+            set(cls.field_sources) - omit
+        )
+
+    @classmethod
+    def get_values_fields(cls, selected=None):
+        sources = (
+            columns for field, columns in cls.field_sources.items()
+            if selected is None or field in selected
+        )
+        return tuple(dict.fromkeys(chain(cls.required_values, *sources)))
+
+    @cached_property
+    def selected_fields(self):
+        return self.select_fields(self.context.get('request'))
+
+    def wants(self, field):
+        return self.selected_fields is None or field in self.selected_fields
+
+    def narrow(self, data):
+        if self.selected_fields is None:
+            return data
+        return {
+            field: value for field, value in data.items()
+            if field in self.selected_fields
+        }
+
+    def prefetch(self, rows):
+        return {}
+
+    def represent(self, row, related):
+        raise NotImplementedError
+
+    def to_representation(self, row):
+        return self.represent(row, self.prefetch([row]))
+
+    def get_subscribed(self, user_ids):
+        user = self.context['request'].user
+        if not user.is_authenticated:
+            return set()
+        return set(Subscribe.objects.filter(
+            follower=user,
+            following_id__in=user_ids
+        ).values_list('following_id', flat=True))
+
+    def image_url(self, name, request=None):
+        if not name:
+            return None
+        url = default_storage.url(name)
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+
+class UserListFastSerializer(FlatSerializer):
+    field_sources = {
+        'email': ('email',),
+        'id': ('id',),
+        'username': ('username',),
+        'first_name': ('first_name',),
+        'last_name': ('last_name',),
+        'is_subscribed': (),
+    }
+    required_values = ('id',)
+
+    def prefetch(self, rows):
+        if not self.wants('is_subscribed'):
+            return {'subscribed': set()}
+        return {
+            'subscribed': self.get_subscribed([row['id'] for row in rows])
+        }
+
+    def represent(self, row, related):
+        return self.narrow({
+            'email': row.get('email'),
+            'id': row['id'],
+            'username': row.get('username'),
+            'first_name': row.get('first_name'),
+            'last_name': row.get('last_name'),
+            'is_subscribed': row['id'] in related['subscribed'],
+        })
+
+
+class RecipeInfoFastSerializer(FlatSerializer):
+    field_sources = {
+        'id': ('id',),
+        'name': ('name',),
+        'image': ('image',),
+        'cooking_time': ('cooking_time',),
+    }
+
+    def represent(self, row, related):
+        return {
+            'id': row['id'],
+            'name': row['name'],
+            'image': self.image_url(
+                row['image'], self.context.get('request')
+            ),
+            'cooking_time': row['cooking_time'],
+        }
+
+
+class RecipeReadFastSerializer(FlatSerializer):
+    field_sources = {
+        'id': ('id',),
+        'tags': (),
+        'author': (
+            'author_id', 'author__email', 'author__username',
+            'author__first_name', 'author__last_name', 'is_subscribed',
+        ),
+        'ingredients': (),
+        'is_favorited': ('is_favorited',),
+        'is_in_shopping_cart': ('is_in_shopping_cart',),
+        'name': ('name',),
+        'image': ('image',),
+        'text': ('text',),
+        'cooking_time': ('cooking_time',),
+    }
+    required_values = ('id', 'updated_at')
+
+    def card_key(self, row):
+        return f'{card_key_prefix(row["id"])}{row["updated_at"].timestamp()}'
+
+    def prefetch(self, rows):
+        """Take user-independent cards from ``recipe_cards``, build the
+        missing ones with one query per relation.
+
+        Narrowed requests build partial cards and leave the cache alone.
+        """
+        keys = {row['id']: self.card_key(row) for row in rows}
+        if self.selected_fields is not None:
+            cards = dict(zip(keys.values(), self.build_cards(rows)))
+            return {'cards': cards, 'keys': keys}
+        cards = recipe_cards.get_many(keys.values())
+        missing = [row for row in rows if keys[row['id']] not in cards]
+        if missing:
+            built = {
+                keys[row['id']]: card
+                for row, card in zip(missing, self.build_cards(missing))
+            }
+            recipe_cards.set_many(built)
+            cards.update(built)
+        return {'cards': cards, 'keys': keys}
+
+    def build_cards(self, rows):
+        recipe_ids = [row['id'] for row in rows]
+        return self.make_cards(
+            rows, self.load_tags(recipe_ids),
+            self.load_ingredients(recipe_ids),
+        )
+
+    def load_tags(self, recipe_ids):
+        tags = defaultdict(list)
+        if self.wants('tags'):
+            for recipe_id, *tag in Recipe.tags.through.objects.filter(
+                recipe_id__in=recipe_ids
+            ).order_by('id').values_list(
+                'recipe_id', 'tag_id', 'tag__name', 'tag__color', 'tag__slug'
+            ):
+                tags[recipe_id].append(tag)
+        return tags
+
+    def load_ingredients(self, recipe_ids):
+        ingredients = defaultdict(list)
+        if self.wants('ingredients'):
+            for recipe_id, *ingredient in RecipeIngredient.objects.filter(
+                recipe_id__in=recipe_ids
+            ).order_by('id').values_list(
+                'recipe_id', 'ingredient_id', 'ingredient__name',
+                'ingredient__measurement_unit__name', 'amount'
+            ):
+                ingredients[recipe_id].append(ingredient)
+        return ingredients
+
+    def make_cards(self, rows, tags, ingredients):
+        return [
+            {
+                'id': row['id'],
+                'tags': [
+                    {'id': pk, 'name': name, 'color': color, 'slug': slug}
+                    for pk, name, color, slug in tags[row['id']]
+                ],
+                'author': {
+                    'email': row.get('author__email'),
+                    'id': row.get('author_id'),
+                    'username': row.get('author__username'),
+                    'first_name': row.get('author__first_name'),
+                    'last_name': row.get('author__last_name'),
+                },
+                'ingredients': [
+                    {
+                        'id': pk,
+                        'name': name,
+                        'measurement_unit': measurement_unit,
+                        'amount': amount,
+                    }
+                    for pk, name, measurement_unit, amount
+                    in ingredients[row['id']]
+                ],
+                'name': row.get('name'),
+                'image': self.image_url(row.get('image')),
+                'text': row.get('text'),
+                'cooking_time': row.get('cooking_time'),
+            }
+            for row in rows
+        ]
+
+    def represent(self, row, related):
+        card = related['cards'][related['keys'][row['id']]]
+        request = self.context.get('request')
+        return self.narrow({
+            'id': card['id'],
+            'tags': card['tags'],
+            'author': {
+                **card['author'],
+                'is_subscribed': bool(row.get('is_subscribed')),
+            },
+            'ingredients': card['ingredients'],
+            'is_favorited': bool(row.get('is_favorited')),
+            'is_in_shopping_cart': bool(row.get('is_in_shopping_cart')),
+            'name': card['name'],
+            'image': (
+                request.build_absolute_uri(card['image'])
+                if request is not None and card['image'] else card['image']
+            ),
+            'text': card['text'],
+            'cooking_time': card['cooking_time'],
+        })
+
+
+class FollowsFastSerializer(FlatSerializer):
+    field_sources = {
+        'id': ('following_id',),
+        'email': ('following__email',),
+        'username': ('following__username',),
+        'first_name': ('following__first_name',),
+        'last_name': ('following__last_name',),
+        'is_subscribed': ('is_subscribed',),
+        'recipes': (),
+        'recipes_count': ('recipes_count',),
+    }
+    required_values = ('following_id',)
+
+    def prefetch(self, rows):
+        recipes = defaultdict(list)
+        if not self.wants('recipes'):
+            return {'recipes': recipes}
+        limit = self.context['request'].GET.get('recipes_limit')
+        for recipe in Recipe.objects.filter(
+            author_id__in=[row['following_id'] for row in rows]
+        ).values(
+            'author_id', *RecipeInfoFastSerializer.get_values_fields()
+        ):
+            recipes[recipe['author_id']].append(recipe)
+        if limit:
+            for author_id in recipes:
+                recipes[author_id] = recipes[author_id][:int(limit)]
+        return {'recipes': recipes}
+
+    def represent(self, row, related):
+        return self.narrow({
+            'id': row['following_id'],
+            'email': row.get('following__email'),
+            'username': row.get('following__username'),
+            'first_name': row.get('following__first_name'),
+            'last_name': row.get('following__last_name'),
+            'is_subscribed': bool(row.get('is_subscribed')),
+            'recipes': [
+                {
+                    'id': recipe['id'],
+                    'name': recipe['name'],
+                    'image': self.image_url(recipe['image']),
+                    'cooking_time': recipe['cooking_time'],
+                }
+                for recipe in related['recipes'][row['following_id']]
+            ],
+            'recipes_count': row.get('recipes_count'),
+        })
@@ -1,17 +1,37 @@
+import operator
+from functools import reduce
+
 import django_filters as filters
-from recipe.models import Ingredient, Recipe
-from user.models import User
+from django import forms
+from django.db import connections
+from django.db.models import Q
+from recipe.models import Ingredient, Recipe, Tag
+from rest_framework.filters import SearchFilter
+
+# pg_trgm cannot use its index for shorter patterns
+TRIGRAM_LENGTH = 3
+
+
+class IdFilter(filters.NumberFilter):
+    """Compares the key column to an integer without loading the row,
+    an unknown id gives an empty list."""
+    field_class = forms.IntegerField
 
 
 class RecipeFilter(filters.FilterSet):
-    author = filters.ModelChoiceFilter(queryset=User.objects.all())
+    author = IdFilter(field_name='author_id')
     is_in_shopping_cart = filters.BooleanFilter(
         widget=filters.widgets.BooleanWidget(),
     )
     is_favorited = filters.BooleanFilter(
         widget=filters.widgets.BooleanWidget()
     )
-    tags = filters.AllValuesMultipleFilter(field_name='tags__slug')
+    # checked against the tags table, not the slugs of all recipes
+    tags = filters.ModelMultipleChoiceFilter(
+        field_name='tags__slug',
+        to_field_name='slug',
+        queryset=Tag.objects.all(),
+    )
 
     class Meta:
         model = Recipe
@@ -24,3 +44,35 @@ class IngredientFilter(filters.FilterSet):
     class Meta:
         model = Ingredient
         fields = ('name',)
+
+
+def search(queryset, fields, terms):
+    """Rows where every term matches one of ``fields``.
+
+    On PostgreSQL a term of ``TRIGRAM_LENGTH`` characters or more
+    matches anywhere in a field, served by the trigram indexes, a
+    shorter one matches a prefix, served by the ``text_pattern_ops``
+    ones. Other databases only match prefixes.
+    """
+    vendor = connections[queryset.db].vendor
+    for term in terms:
+        lookup = 'istartswith'
+        if vendor == 'postgresql' and len(term) >= TRIGRAM_LENGTH:
+            lookup = 'icontains'
+        queryset = queryset.filter(reduce(operator.or_, (
+            Q(**{f'{field}__{lookup}': term}) for field in fields
+        )))
+    return queryset
+
+
+class IndexedSearchFilter(SearchFilter):
+    """``search`` parameter over the ``search_fields`` of the view, with
+    the lookups ``search`` picks for the indexes instead of the prefixes
+    of ``search_fields``."""
+
+    def filter_queryset(self, request, queryset, view):
+        fields = self.get_search_fields(view, request)
+        terms = self.get_search_terms(request)
+        if not fields or not terms:
+            return queryset
+        return search(queryset, fields, terms)
@@ -0,0 +1,128 @@
+import base64
+import hashlib
+import os
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.utils.encoding import force_bytes
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from . import metrics
+
+
+class HashingBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Сервер перегружен, повторите попытку позже.'
+    default_code = 'hashing_busy'
+
+    def __init__(self, wait):
+        super().__init__()
+        self.wait = wait
+
+
+class HashPool:
+    """Bounded process pool for key derivation.
+
+    At most ``WORKERS`` hashes run at once and ``QUEUE`` more may wait,
+    a caller that finds no free slot within ``TIMEOUT`` seconds gets
+    ``HashingBusy`` (503 with Retry-After) instead of piling up. The
+    pool is started lazily in each process, so it is never shared
+    across a fork; ``start`` spawns it ahead of the first request.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counter = Counter()
+        self.executor = None
+        self.slots = None
+        self.pid = None
+
+    def get_executor(self):
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        with self.lock:
+            if self.executor is None or self.pid != os.getpid():
+                options = settings.PASSWORD_HASHING
+                self.executor = ProcessPoolExecutor(
+                    max_workers=options['WORKERS'],
+                    mp_context=multiprocessing.get_context('spawn'),
+                )
+                self.slots = threading.BoundedSemaphore(
+                    options['WORKERS'] + options['QUEUE']
+                )
+                self.pid = os.getpid()
+            return self.executor, self.slots
+
+    def reset(self, executor):
+        with self.lock:
+            if self.executor is executor:
+                self.executor = None
+        executor.shutdown(wait=False)
+
+    def start(self):
+        if settings.PASSWORD_HASHING['WORKERS']:
+            executor, _ = self.get_executor()
+            executor.submit(os.getpid).result()
+
+    def run(self, func, *args):
+        from concurrent.futures.process import BrokenProcessPool
+        options = settings.PASSWORD_HASHING
+        if not options['WORKERS']:
+            self.incr('inline')
+            return func(*args)
+        executor, slots = self.get_executor()
+        if not slots.acquire(timeout=options['TIMEOUT']):
+            self.incr('rejected')
+            raise HashingBusy(wait=options['TIMEOUT'])
+        try:
+            result = executor.submit(func, *args).result()
+        except BrokenProcessPool:
+            self.incr('broken')
+            self.reset(executor)
+            result = func(*args)
+        finally:
+            slots.release()
+        self.incr('pooled')
+        return result
+
+    def incr(self, name):
+        with self.lock:
+            self.counter[name] += 1
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counter)
+
+
+hash_pool = HashPool()
+metrics.register('password_hashing', hash_pool.stats)
+
+
+class PooledPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """PBKDF2-SHA256 computed in ``hash_pool``.
+
+    Hashes stay compatible with Django's ``pbkdf2_sha256``. The cost
+    comes from ``PASSWORD_HASHING['ITERATIONS']``; when it changes,
+    Django re-hashes the password on the next successful login.
+    """
+
+    @property
+    def iterations(self):
+        return settings.PASSWORD_HASHING['ITERATIONS']
+
+    def encode(self, password, salt, iterations=None):
+        assert password is not None
+        assert salt and '$' not in salt
+        iterations = iterations or self.iterations
+        hash = hash_pool.run(
+            hashlib.pbkdf2_hmac,
+            self.digest().name,
+            force_bytes(password),
+            force_bytes(salt),
+            iterations,
+        )
+        hash = base64.b64encode(hash).decode('ascii').strip()
+        return '%s$%d$%s$%s' % (self.algorithm, iterations, salt, hash)
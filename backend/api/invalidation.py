@@ -0,0 +1,234 @@
+import logging
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import (DEFAULT_DB_ALIAS, DatabaseError, close_old_connections,
+                       connection, connections, transaction)
+from django.db.models import Max
+from django.utils import timezone
+
+from . import metrics
+from .models import Invalidation
+
+logger = logging.getLogger(__name__)
+
+# topic -> callables taking the set of changed keys, None for all of them
+handlers = defaultdict(list)
+
+
+def subscribe(topic, handler):
+    handlers[topic].append(handler)
+
+
+class Batch:
+    """Events of one transaction, sent once it commits."""
+
+    def __init__(self, using):
+        self.using = using
+        self.topics = defaultdict(set)
+
+    def add(self, topic, key):
+        self.topics[topic].add(str(key))
+
+    def pending(self, db):
+        # the hook is dropped when its (savepoint) block rolls back
+        return any(func == self.send for _, func in db.run_on_commit)
+
+    def send(self):
+        send(self.topics, self.using)
+
+
+def publish(topic, key='', using=DEFAULT_DB_ALIAS):
+    """Announce that ``key`` of ``topic`` changed, an empty key stands
+    for the whole topic.
+
+    Inside a transaction the event waits for the commit, so no worker
+    reloads data that is not visible yet, and events of the transaction
+    go out in one insert.
+    """
+    if not settings.INVALIDATION['ENABLED']:
+        return
+    db = connections[using]
+    if not db.in_atomic_block:
+        send({topic: {str(key)}}, using)
+        return
+    batch = getattr(db, 'invalidation_batch', None)
+    if batch is None or not batch.pending(db):
+        batch = db.invalidation_batch = Batch(using)
+        transaction.on_commit(batch.send, using)
+    batch.add(topic, key)
+
+
+def send(topics, using=DEFAULT_DB_ALIAS):
+    now = timezone.now()
+    events = []
+    for topic, keys in topics.items():
+        if '' in keys or len(keys) > settings.INVALIDATION['MAX_KEYS']:
+            keys = {''}
+        events.extend(
+            Invalidation(topic=topic, key=key, created_at=now)
+            for key in keys
+        )
+    try:
+        Invalidation.objects.using(using).bulk_create(events)
+    except DatabaseError:
+        # the data is committed already, failing the request won't help
+        logger.exception('Invalidation of %s not sent', list(topics))
+        listener.incr('send_errors')
+        return
+    listener.incr('sent', len(events))
+    listener.wake.set()
+
+
+def prune():
+    """Delete events every worker has applied long ago. The last one is
+    kept for new workers to start from its version."""
+    last = Invalidation.objects.aggregate(version=Max('id'))['version']
+    return Invalidation.objects.filter(
+        id__lt=last or 0,
+        created_at__lt=timezone.now() - timedelta(
+            seconds=settings.INVALIDATION['RETENTION']
+        ),
+    ).delete()[0]
+
+
+class Listener:
+    """Applies the events of the bus in this process.
+
+    Events are read in version order every ``POLL_INTERVAL`` seconds, or
+    at once after this process has sent some. A missing version holds
+    the later ones back for up to ``GAP_TIMEOUT`` seconds in case it is
+    still committing, then it is skipped. ``versions`` holds the last
+    applied version per topic, the same in every worker that caught up,
+    so it can be put into shared cache keys.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.stopping = threading.Event()
+        self.thread = None
+        self.pid = None
+        self.version = None
+        self.versions = {}
+        self.gap_since = None
+        self.counter = Counter()
+        self.topics = Counter()
+        self.lag = {'last': None, 'max': 0.0, 'total': 0.0}
+
+    def start(self):
+        """Start the listener thread once per process."""
+        if not settings.INVALIDATION['ENABLED'] or self.pid == os.getpid():
+            return
+        self.pid = os.getpid()
+        self.stopping.clear()
+        self.thread = threading.Thread(
+            target=self.loop, name='invalidation', daemon=True
+        )
+        self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        self.wake.set()
+
+    def loop(self):
+        try:
+            while not self.stopping.is_set():
+                self.wake.clear()
+                close_old_connections()
+                try:
+                    self.poll()
+                except DatabaseError as exc:
+                    logger.warning('Invalidation poll failed: %r', exc)
+                    self.incr('poll_errors')
+                self.wake.wait(settings.INVALIDATION['POLL_INTERVAL'])
+        finally:
+            connection.close()
+
+    def poll(self):
+        """Apply the committed events, return how many."""
+        if self.version is None:
+            # caches of a new process are empty, history is of no use,
+            # but the versions must match those of the other workers
+            self.versions = dict(Invalidation.objects.values_list(
+                'topic'
+            ).annotate(version=Max('id')).order_by())
+            self.version = max(self.versions.values(), default=0)
+            return 0
+        options = settings.INVALIDATION
+        self.incr('polls')
+        rows = Invalidation.objects.filter(
+            id__gt=self.version
+        ).order_by('id').values_list(
+            'id', 'topic', 'key', 'created_at'
+        )[:options['BATCH_SIZE']]
+        changed = defaultdict(set)
+        lags = []
+        for version, topic, key, created_at in rows:
+            if version != self.version + 1:
+                if self.gap_since is None:
+                    self.gap_since = time.monotonic()
+                if time.monotonic() - self.gap_since < options[
+                    'GAP_TIMEOUT'
+                ]:
+                    break
+                self.incr('skipped', version - self.version - 1)
+            self.gap_since = None
+            self.version = version
+            self.versions[topic] = version
+            changed[topic].add(key)
+            lags.append((timezone.now() - created_at).total_seconds())
+        for topic, keys in changed.items():
+            self.apply(topic, None if '' in keys else keys)
+        self.record(changed, lags)
+        return len(lags)
+
+    def apply(self, topic, keys):
+        for handler in handlers[topic]:
+            try:
+                handler(keys)
+            except Exception:
+                logger.exception('Invalidation handler %r failed', handler)
+                self.incr('handler_errors')
+
+    def record(self, changed, lags):
+        with self.lock:
+            self.counter['applied'] += len(lags)
+            for topic, keys in changed.items():
+                self.topics[topic] += len(keys)
+            if lags:
+                self.lag['last'] = lags[-1]
+                self.lag['max'] = max(self.lag['max'], *lags)
+                self.lag['total'] += sum(lags)
+
+    def incr(self, name, value=1):
+        with self.lock:
+            self.counter[name] += value
+
+    def __call__(self):
+        with self.lock:
+            applied = self.counter['applied']
+            return {
+                **self.counter,
+                'running': bool(self.thread and self.thread.is_alive()),
+                'version': self.version,
+                'topics': dict(self.topics),
+                'lag_seconds': {
+                    'last': self.lag['last'],
+                    'max': self.lag['max'],
+                    'avg': self.lag['total'] / applied if applied else None,
+                },
+            }
+
+
+listener = Listener()
+metrics.register('invalidation', listener)
+
+
+def version(*topics):
+    """Last version applied here of any of ``topics``."""
+    return max(listener.versions.get(topic, 0) for topic in topics)
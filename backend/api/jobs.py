@@ -0,0 +1,283 @@
+import json
+import logging
+import os
+import random
+import socket
+import threading
+import traceback
+import zlib
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import (DatabaseError, close_old_connections, connection,
+                       transaction)
+from django.db.models import F, Func, IntegerField, OuterRef, Subquery
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+JobSpec = namedtuple('JobSpec', 'func lane max_attempts concurrency every')
+
+registry = {}
+
+
+def job(name, lane=Job.LANE_DEFAULT, max_attempts=5, concurrency=None,
+        every=None):
+    """Register a function as a background job.
+
+    ``concurrency`` caps how many jobs with this name run at once across
+    all workers. Jobs with ``every`` (seconds) are periodic: workers
+    queue them once per interval without arguments. Job functions take
+    JSON-serializable keyword arguments and must be safe to run again
+    after a failure.
+    """
+    def decorator(func):
+        registry[name] = JobSpec(
+            func, lane, max_attempts, concurrency, every
+        )
+        return func
+    return decorator
+
+
+def enqueue(name, payload=None, key=None, lane=None, priority=0,
+            delay=None):
+    """Queue a job and return it.
+
+    With ``key`` the job is created at most once: enqueueing the same
+    key again returns the existing job instead of adding a new one. A
+    failed job is queued again with fresh attempts, so a key does not
+    block the work for good.
+    """
+    spec = registry[name]
+    new_job = Job(
+        name=name,
+        payload=json.dumps(payload or {}),
+        lane=lane or spec.lane,
+        priority=priority,
+        max_attempts=spec.max_attempts,
+        idempotency_key=key,
+        run_at=timezone.now() + (delay or timedelta()),
+    )
+    if key is None:
+        new_job.save()
+        return new_job
+    Job.objects.bulk_create([new_job], ignore_conflicts=True)
+    Job.objects.filter(idempotency_key=key, status=Job.FAILED).update(
+        status=Job.QUEUED,
+        payload=new_job.payload,
+        attempts=0,
+        run_at=new_job.run_at,
+        finished_at=None,
+    )
+    return Job.objects.get(idempotency_key=key)
+
+
+def schedule_next(name):
+    """Queue the next run of a periodic job.
+
+    The idempotency key names the interval, so every worker may call
+    this and the run is still queued once.
+    """
+    every = registry[name].every
+    now = timezone.now()
+    slot = int(now.timestamp() // every) + 1
+    run_at = datetime.fromtimestamp(slot * every, tz=now.tzinfo)
+    return enqueue(name, key=f'{name}:{slot}', delay=run_at - now)
+
+
+def backoff(attempts):
+    delay = min(
+        settings.JOBS_RETRY_BACKOFF * 2 ** (attempts - 1),
+        settings.JOBS_RETRY_BACKOFF_MAX,
+    )
+    return timedelta(seconds=delay * random.uniform(1, 1.1))
+
+
+class Worker:
+    """Polls the job table and runs jobs in ``concurrency`` threads.
+
+    Jobs are claimed with a conditional UPDATE, so any number of workers
+    can share one database, SQLite included. A heartbeat refreshes the
+    lock of running jobs every ``JOBS_HEARTBEAT_INTERVAL`` seconds, jobs
+    whose worker died are put back in the queue once their lock is
+    ``JOBS_LOCK_TIMEOUT`` seconds old.
+    """
+
+    def __init__(self, lanes, concurrency=1, poll_interval=1, burst=False):
+        self.lanes = lanes
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.burst = burst
+        self.name = f'{socket.gethostname()}:{os.getpid()}'
+        self.stopping = threading.Event()
+
+    def run(self):
+        for name, spec in registry.items():
+            if spec.every:
+                schedule_next(name)
+        threads = [
+            threading.Thread(target=self.loop, daemon=True)
+            for _ in range(self.concurrency)
+        ]
+        heartbeat = threading.Thread(target=self.heartbeat, daemon=True)
+        heartbeat.start()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(self.poll_interval)
+        self.stopping.set()
+        heartbeat.join()
+
+    def stop(self, *args):
+        self.stopping.set()
+
+    def loop(self):
+        try:
+            while not self.stopping.is_set():
+                close_old_connections()
+                self.requeue_stale()
+                claimed = self.claim()
+                if claimed is not None:
+                    self.execute(claimed)
+                elif self.burst:
+                    return
+                else:
+                    self.stopping.wait(self.poll_interval)
+        finally:
+            connection.close()
+
+    def heartbeat(self):
+        """Keep ``locked_at`` of the jobs this worker runs fresh, so only
+        jobs of dead workers go stale, however long a job takes."""
+        try:
+            while not self.stopping.wait(settings.JOBS_HEARTBEAT_INTERVAL):
+                close_old_connections()
+                try:
+                    self.touch_running()
+                except DatabaseError as exc:
+                    logger.warning('Job heartbeat failed: %r', exc)
+        finally:
+            connection.close()
+
+    def touch_running(self):
+        return Job.objects.filter(
+            status=Job.RUNNING, locked_by=self.name
+        ).update(locked_at=timezone.now())
+
+    def requeue_stale(self):
+        """Take back jobs of workers that died or hung.
+
+        Such a job never reaches the failure branch of ``execute``, so
+        its attempts are checked here: used up ones fail, the others
+        are queued again after the usual backoff.
+        """
+        now = timezone.now()
+        stale = Job.objects.filter(
+            status=Job.RUNNING,
+            locked_at__lt=now - timedelta(seconds=settings.JOBS_LOCK_TIMEOUT),
+        )
+        failed = list(stale.filter(
+            attempts__gte=F('max_attempts')
+        ).values_list('id', 'name'))
+        if failed:
+            Job.objects.filter(
+                id__in=[job_id for job_id, _ in failed]
+            ).update(
+                status=Job.FAILED,
+                finished_at=now,
+                last_error=(
+                    'Блокировка истекла: обработчик не отвечал дольше '
+                    f'{settings.JOBS_LOCK_TIMEOUT} с.'
+                ),
+                locked_by='',
+                locked_at=None,
+            )
+        for name in {name for _, name in failed}:
+            spec = registry.get(name)
+            if spec is not None and spec.every:
+                schedule_next(name)
+        for job_id, attempts in stale.values_list('id', 'attempts'):
+            # the filter again, a heartbeat may have come in meanwhile
+            stale.filter(id=job_id).update(
+                status=Job.QUEUED,
+                run_at=now + backoff(attempts),
+                locked_by='',
+                locked_at=None,
+            )
+
+    def claim(self):
+        for lane in self.lanes:
+            candidates = Job.objects.filter(
+                status=Job.QUEUED,
+                lane=lane,
+                run_at__lte=timezone.now(),
+            ).order_by('-priority', 'run_at').values_list('id', 'name')
+            for job_id, name in candidates[:20]:
+                if self.claim_one(job_id, name):
+                    return Job.objects.get(id=job_id)
+        return None
+
+    def claim_one(self, job_id, name):
+        """Mark the job running if it is still queued and, for jobs with
+        ``concurrency``, fewer of its name run.
+
+        Both are checked by the UPDATE itself. SQLite runs one write at a
+        time; on PostgreSQL an advisory lock per name makes the claims of
+        one name take turns, so each counts the runs the previous one
+        committed.
+        """
+        spec = registry.get(name)
+        claimed = Job.objects.filter(id=job_id, status=Job.QUEUED)
+        with transaction.atomic():
+            if spec is not None and spec.concurrency:
+                if connection.vendor == 'postgresql':
+                    with connection.cursor() as cursor:
+                        cursor.execute(
+                            'SELECT pg_advisory_xact_lock(%s)',
+                            [zlib.crc32(f'job:{name}'.encode())],
+                        )
+                claimed = claimed.annotate(running=Subquery(
+                    Job.objects.filter(
+                        name=OuterRef('name'), status=Job.RUNNING
+                    ).order_by().annotate(
+                        count=Func('id', function='COUNT')
+                    ).values('count'),
+                    output_field=IntegerField(),
+                )).filter(running__lt=spec.concurrency)
+            return claimed.update(
+                status=Job.RUNNING,
+                locked_by=self.name,
+                locked_at=timezone.now(),
+                attempts=F('attempts') + 1,
+            )
+
+    def execute(self, current):
+        spec = registry.get(current.name)
+        try:
+            if spec is None:
+                raise LookupError(f'Неизвестная задача {current.name}')
+            spec.func(**json.loads(current.payload))
+        except Exception:
+            logger.exception('Job %s failed', current)
+            current.last_error = traceback.format_exc()
+            if spec is None or current.attempts >= current.max_attempts:
+                current.status = Job.FAILED
+                current.finished_at = timezone.now()
+            else:
+                current.status = Job.QUEUED
+                current.run_at = timezone.now() + backoff(current.attempts)
+        else:
+            current.status = Job.DONE
+            current.finished_at = timezone.now()
+        current.locked_by = ''
+        current.locked_at = None
+        current.save(update_fields=(
+            'status', 'run_at', 'finished_at', 'last_error',
+            'locked_by', 'locked_at',
+        ))
+        if spec is not None and spec.every and current.finished_at:
+            schedule_next(current.name)
@@ -0,0 +1,105 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from api.asgi import AsyncReadApplication, build_environ
+from django.core.management.base import BaseCommand
+from django.core.wsgi import get_wsgi_application
+from recipe.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает число запросов в секунду одного воркера '
+        'под WSGI и под ASGI.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*')
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument(
+            '--threads', type=int, default=4,
+            help='Потоков WSGI-воркера, как у gunicorn --threads.'
+        )
+        parser.add_argument(
+            '--concurrency', type=int, default=16,
+            help='Одновременных запросов к ASGI-воркеру.'
+        )
+        parser.add_argument('--token', default='')
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or self.default_paths()
+        headers = [(b'host', b'localhost'), (b'accept', b'application/json')]
+        if options['token']:
+            headers.append(
+                (b'authorization', f'Token {options["token"]}'.encode())
+            )
+        wsgi = get_wsgi_application()
+        asgi = AsyncReadApplication(wsgi)
+        for path in paths:
+            url = urlsplit(path)
+            scope = {
+                'type': 'http',
+                'method': 'GET',
+                'path': url.path,
+                'query_string': url.query.encode(),
+                'headers': headers,
+                'scheme': 'http',
+                'server': ('localhost', 80),
+            }
+            wsgi_rate = self.measure_wsgi(
+                wsgi, scope, options['requests'], options['threads']
+            )
+            asgi_rate = asyncio.run(self.measure_asgi(
+                asgi, scope, options['requests'], options['concurrency']
+            ))
+            self.stdout.write(
+                f'{path}: wsgi {wsgi_rate:.0f} req/s, '
+                f'asgi {asgi_rate:.0f} req/s, '
+                f'x{asgi_rate / wsgi_rate:.2f}'
+            )
+        asgi.executor.shutdown()
+
+    def default_paths(self):
+        paths = [
+            '/api/recipes/', '/api/recipes/?limit=24',
+            '/api/tags/', '/api/ingredients/?name=а',
+        ]
+        recipe = Recipe.objects.values_list('id', flat=True).first()
+        if recipe is not None:
+            paths.append(f'/api/recipes/{recipe}/')
+        return paths
+
+    def measure_wsgi(self, wsgi, scope, requests, threads):
+        def call(_):
+            response = wsgi(build_environ(scope, b''), start_response)
+            try:
+                b''.join(response)
+            finally:
+                response.close()
+
+        def start_response(status, headers, exc_info=None):
+            pass
+
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            started = time.perf_counter()
+            list(pool.map(call, range(requests)))
+        return requests / (time.perf_counter() - started)
+
+    async def measure_asgi(self, asgi, scope, requests, concurrency):
+        slots = asyncio.Semaphore(concurrency)
+
+        async def receive():
+            return {'type': 'http.request', 'body': b''}
+
+        async def send(message):
+            pass
+
+        async def call():
+            async with slots:
+                await asgi(scope, receive, send)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(call() for _ in range(requests)))
+        return requests / (time.perf_counter() - started)
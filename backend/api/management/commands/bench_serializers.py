@@ -0,0 +1,70 @@
+import time
+
+from api.fast_serializers import (RecipeReadFastSerializer,
+                                  UserListFastSerializer)
+from api.serializers import RecipeReadSerializer, UserListSerializer
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import models
+from django.db.models.expressions import Value
+from recipe.models import Recipe
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает скорость обычных и быстрых сериализаторов чтения.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        request = Request(APIRequestFactory().get('/api/'))
+        recipes = Recipe.objects.annotate(
+            is_favorited=Value(False, output_field=models.BooleanField()),
+            is_in_shopping_cart=Value(
+                False, output_field=models.BooleanField()
+            ),
+        ).select_related('author')[:options['rows']]
+        users = User.objects.all()[:options['rows']]
+        cases = (
+            ('recipes', recipes, RecipeReadSerializer,
+             RecipeReadFastSerializer),
+            ('users', users, UserListSerializer, UserListFastSerializer),
+        )
+        for name, queryset, serializer, fast_serializer in cases:
+            rows = len(queryset)
+            if not rows:
+                self.stdout.write(f'{name}: нет данных')
+                continue
+            slow_json, slow = self.measure(
+                serializer, list(queryset), request, options['repeat']
+            )
+            fast_json, fast = self.measure(
+                fast_serializer,
+                list(queryset.values(*fast_serializer.get_values_fields())),
+                request,
+                options['repeat'],
+            )
+            self.stdout.write(
+                f'{name}: {rows} rows, '
+                f'drf {slow / rows * 1e6:.1f} us/row, '
+                f'fast {fast / rows * 1e6:.1f} us/row, '
+                f'x{slow / fast:.1f}, '
+                f'identical={slow_json == fast_json}'
+            )
+
+    def measure(self, serializer, instances, request, repeat):
+        best = None
+        for _ in range(repeat):
+            started = time.process_time()
+            data = serializer(
+                instances, many=True, context={'request': request}
+            ).data
+            elapsed = time.process_time() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return JSONRenderer().render(data), best
@@ -0,0 +1,121 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from collections import defaultdict
+from itertools import islice
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from recipe.models import Ingredient, Recipe, RecipeIngredient, Tag
+
+
+def images_directory(path):
+    return f'{os.path.splitext(path)[0]}_images'
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгружает рецепты в JSON Lines, изображения складывает '
+        'в соседний каталог под именами по хешу содержимого.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument(
+            '--images',
+            help='Каталог изображений, по умолчанию <path>_images.',
+        )
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        images = options['images'] or images_directory(options['path'])
+        os.makedirs(images, exist_ok=True)
+        chunk_size = options['chunk_size']
+        started = time.perf_counter()
+        self.stats = defaultdict(int)
+        with open(options['path'], 'w', encoding='utf-8') as output:
+            for tag in Tag.objects.order_by('id').values(
+                'id', 'name', 'slug', 'color'
+            ).iterator(chunk_size=chunk_size):
+                self.write(output, {'type': 'tag', **tag})
+            for ingredient in Ingredient.objects.order_by('id').values(
+                'id', 'name', 'measurement_unit__name'
+            ).iterator(chunk_size=chunk_size):
+                self.write(output, {
+                    'type': 'ingredient',
+                    'id': ingredient['id'],
+                    'name': ingredient['name'],
+                    'measurement_unit': ingredient['measurement_unit__name'],
+                })
+            recipes = Recipe.objects.order_by('id').values(
+                'id', 'name', 'image', 'text', 'cooking_time',
+                'pub_date', 'author__email',
+            ).iterator(chunk_size=chunk_size)
+            while True:
+                chunk = list(islice(recipes, chunk_size))
+                if not chunk:
+                    break
+                self.write_recipes(output, chunk, images)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'{self.stats["recipe"]} recipes, {self.stats["tag"]} tags, '
+            f'{self.stats["ingredient"]} ingredients in {elapsed:.1f}s, '
+            f'{self.stats["recipe"] / elapsed:.0f} recipes/s; '
+            f'{self.stats["image"]} images, '
+            f'{self.stats["image_bytes"] / 2 ** 20:.1f} MB new'
+        )
+
+    def write(self, output, record):
+        output.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.stats[record['type']] += 1
+
+    def write_recipes(self, output, chunk, images):
+        recipe_ids = [recipe['id'] for recipe in chunk]
+        tags = defaultdict(list)
+        for recipe_id, tag_id in Recipe.tags.through.objects.filter(
+            recipe_id__in=recipe_ids
+        ).order_by('id').values_list('recipe_id', 'tag_id'):
+            tags[recipe_id].append(tag_id)
+        ingredients = defaultdict(list)
+        for recipe_id, *ingredient in RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids
+        ).order_by('id').values_list('recipe_id', 'ingredient_id', 'amount'):
+            ingredients[recipe_id].append(ingredient)
+        for recipe in chunk:
+            self.write(output, {
+                'type': 'recipe',
+                'id': recipe['id'],
+                'author': recipe['author__email'],
+                'name': recipe['name'],
+                'text': recipe['text'],
+                'cooking_time': recipe['cooking_time'],
+                'pub_date': recipe['pub_date'].isoformat(),
+                'image': self.export_image(recipe['image'], images),
+                'tags': tags[recipe['id']],
+                'ingredients': ingredients[recipe['id']],
+            })
+
+    def export_image(self, name, images):
+        """Copy the image under ``<sha256><ext>``, hashing while copying
+        so the file is read once and never held in memory."""
+        if not name or not default_storage.exists(name):
+            return None
+        digest = hashlib.sha256()
+        target = tempfile.NamedTemporaryFile(dir=images, delete=False)
+        with default_storage.open(name) as source, target:
+            for block in source.chunks():
+                digest.update(block)
+                target.write(block)
+        extension = os.path.splitext(name)[1].lower()
+        filename = f'{digest.hexdigest()}{extension}'
+        path = os.path.join(images, filename)
+        if os.path.exists(path):
+            os.remove(target.name)
+        else:
+            shutil.move(target.name, path)
+            self.stats['image_bytes'] += os.path.getsize(path)
+        self.stats['image'] += 1
+        return filename
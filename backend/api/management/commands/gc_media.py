@@ -0,0 +1,77 @@
+import os
+import time
+from itertools import islice
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from recipe.models import Recipe
+
+RECIPE_IMAGES = Recipe._meta.get_field('image').upload_to
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет изображения рецептов, на которые не ссылается '
+        'ни один рецепт.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--min-age', type=int, default=24 * 60 * 60,
+            help='Не трогать файлы моложе стольких секунд: рецепт '
+                 'с только что загруженным изображением может быть '
+                 'ещё не сохранён.',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, что было бы удалено.',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            directory = default_storage.path(RECIPE_IMAGES)
+        except NotImplementedError:
+            raise CommandError('Хранилище файлов не локальное.')
+        if not os.path.isdir(directory):
+            return
+        self.dry_run = options['dry_run']
+        self.checked = self.deleted = self.deleted_bytes = 0
+        deadline = time.time() - options['min_age']
+        with os.scandir(directory) as entries:
+            files = (
+                entry for entry in entries
+                if entry.is_file() and entry.stat().st_mtime < deadline
+            )
+            while True:
+                batch = list(islice(files, options['batch_size']))
+                if not batch:
+                    break
+                self.collect(batch)
+        self.stdout.write(
+            f'{self.checked} files checked, {self.deleted} orphaned, '
+            f'{self.deleted_bytes / 2 ** 20:.1f} MB '
+            f'{"to delete" if self.dry_run else "deleted"}'
+        )
+
+    def collect(self, batch):
+        self.checked += len(batch)
+        orphans = self.orphans(batch)
+        if orphans and not self.dry_run:
+            # a recipe may have picked up the file since the first look,
+            # e.g. import_recipes reuses images by content hash
+            orphans = self.orphans(orphans)
+        for entry in orphans:
+            self.deleted += 1
+            self.deleted_bytes += entry.stat().st_size
+            if not self.dry_run:
+                default_storage.delete(f'{RECIPE_IMAGES}{entry.name}')
+
+    def orphans(self, entries):
+        names = {f'{RECIPE_IMAGES}{entry.name}': entry for entry in entries}
+        referenced = set(Recipe.objects.filter(
+            image__in=names
+        ).values_list('image', flat=True))
+        return [
+            entry for name, entry in names.items() if name not in referenced
+        ]
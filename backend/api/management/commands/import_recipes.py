@@ -0,0 +1,241 @@
+import json
+import os
+import time
+from collections import defaultdict
+
+from api.invalidation import publish
+from django.contrib.auth import get_user_model
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils.dateparse import parse_datetime
+from recipe.models import (Ingredient, MeasurementUnit, Recipe,
+                           RecipeIngredient, Tag)
+
+from .export_recipes import images_directory
+
+User = get_user_model()
+
+RECIPE_IMAGES = Recipe._meta.get_field('image').upload_to
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает рецепты из JSON Lines, выгруженных export_recipes: '
+        'теги и ингредиенты сопоставляются с существующими, рецепты '
+        'вставляются пачками.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument(
+            '--images',
+            help='Каталог изображений, по умолчанию <path>_images.',
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--author',
+            help='Email автора для рецептов, чьих авторов нет в базе; '
+                 'без него такие рецепты пропускаются.',
+        )
+
+    def handle(self, *args, **options):
+        self.images = options['images'] or images_directory(options['path'])
+        self.default_author = None
+        if options['author']:
+            self.default_author = User.objects.filter(
+                email=options['author']
+            ).values_list('id', flat=True).first()
+            if self.default_author is None:
+                raise CommandError(f'Нет пользователя {options["author"]}.')
+        # source id -> target id, bounded by the reference tables
+        self.tags = {}
+        self.ingredients = {}
+        self.units = {}
+        self.batch_size = options['batch_size']
+        self.stats = defaultdict(int)
+        self.started = time.perf_counter()
+        with open(options['path'], encoding='utf-8') as source:
+            self.import_records(self.read(source))
+        self.report()
+
+    def read(self, source):
+        for number, line in enumerate(source, 1):
+            if not line.strip():
+                continue
+            try:
+                yield number, json.loads(line)
+            except ValueError as exc:
+                raise CommandError(f'Строка {number}: {exc}')
+
+    def import_records(self, records):
+        """Reference records come first in the file, so each recipe batch
+        finds its tags and ingredients already mapped."""
+        ingredients = []
+        recipes = []
+        for number, record in records:
+            if record['type'] == 'tag':
+                self.import_tag(record)
+            elif record['type'] == 'ingredient':
+                ingredients.append(record)
+                if len(ingredients) >= self.batch_size:
+                    self.import_ingredients(ingredients)
+                    ingredients = []
+            elif record['type'] == 'recipe':
+                if ingredients:
+                    self.import_ingredients(ingredients)
+                    ingredients = []
+                recipes.append((number, record))
+                if len(recipes) >= self.batch_size:
+                    self.import_recipes(recipes)
+                    recipes = []
+                    self.report()
+        if ingredients:
+            self.import_ingredients(ingredients)
+        if recipes:
+            self.import_recipes(recipes)
+
+    def report(self):
+        elapsed = time.perf_counter() - self.started
+        self.stdout.write(
+            f'{self.stats["recipe"]} recipes imported, '
+            f'{self.stats["skipped"]} skipped in {elapsed:.1f}s, '
+            f'{self.stats["recipe"] / elapsed:.0f} recipes/s; '
+            f'{self.stats["tag"]} tags, {self.stats["ingredient"]} '
+            f'ingredients, {self.stats["image"]} images created'
+        )
+
+    def import_tag(self, record):
+        tag = Tag.objects.filter(slug=record['slug']).first() or (
+            Tag.objects.filter(name=record['name']).first()
+        )
+        if tag is None:
+            tag = Tag.objects.create(
+                name=record['name'], slug=record['slug'],
+                color=record['color'],
+            )
+            self.stats['tag'] += 1
+        self.tags[record['id']] = tag.id
+
+    def import_ingredients(self, records):
+        """Map a batch of source ingredients to existing ones by name and
+        unit, bulk-create the rest."""
+        names = {record['name'] for record in records}
+        existing = self.load_ingredients(names)
+        missing = {
+            (record['name'], record['measurement_unit'])
+            for record in records
+            if (record['name'], record['measurement_unit']) not in existing
+        }
+        if missing:
+            for _, unit in missing:
+                if unit not in self.units:
+                    self.units[unit] = MeasurementUnit.objects.get_or_create(
+                        name=unit
+                    )[0].id
+            Ingredient.objects.bulk_create(
+                Ingredient(name=name, measurement_unit_id=self.units[unit])
+                for name, unit in missing
+            )
+            publish('ingredient')
+            self.stats['ingredient'] += len(missing)
+            existing = self.load_ingredients(names)
+        for record in records:
+            self.ingredients[record['id']] = existing[
+                (record['name'], record['measurement_unit'])
+            ]
+
+    def load_ingredients(self, names):
+        """(name, unit) -> id, the oldest duplicate wins."""
+        return {
+            (name, unit): pk
+            for name, unit, pk in Ingredient.objects.filter(
+                name__in=names
+            ).order_by('-id').values_list(
+                'name', 'measurement_unit__name', 'id'
+            )
+        }
+
+    def import_image(self, filename):
+        if not filename:
+            return ''
+        name = f'{RECIPE_IMAGES}{filename}'
+        if not default_storage.exists(name):
+            with open(os.path.join(self.images, filename), 'rb') as image:
+                name = default_storage.save(name, File(image))
+            self.stats['image'] += 1
+        return name
+
+    def has_unknown_references(self, number, record):
+        """Report tags and ingredients the file did not list before the
+        recipe, such a recipe is skipped."""
+        tags = [
+            tag_id for tag_id in record['tags'] if tag_id not in self.tags
+        ]
+        ingredients = [
+            ingredient_id for ingredient_id, _ in record['ingredients']
+            if ingredient_id not in self.ingredients
+        ]
+        if not tags and not ingredients:
+            return False
+        self.stderr.write(
+            f'Строка {number}: рецепт «{record["name"]}» пропущен, '
+            f'в файле нет тегов {tags} и ингредиентов {ingredients}.'
+        )
+        return True
+
+    def import_recipes(self, batch):
+        authors = dict(User.objects.filter(
+            email__in={record['author'] for _, record in batch}
+        ).values_list('email', 'id'))
+        recipes = []
+        records = []
+        for number, record in batch:
+            author = authors.get(record['author'], self.default_author)
+            if author is None or self.has_unknown_references(
+                number, record
+            ):
+                self.stats['skipped'] += 1
+                continue
+            recipes.append(Recipe(
+                author_id=author,
+                name=record['name'],
+                text=record['text'],
+                cooking_time=record['cooking_time'],
+                image=self.import_image(record['image']),
+            ))
+            records.append(record)
+        with transaction.atomic():
+            if connection.features.can_return_ids_from_bulk_insert:
+                Recipe.objects.bulk_create(recipes)
+            else:
+                for recipe in recipes:
+                    recipe.save()
+            for recipe, record in zip(recipes, records):
+                recipe.pub_date = parse_datetime(record['pub_date'])
+            Recipe.objects.bulk_update(recipes, ['pub_date'])
+            Recipe.tags.through.objects.bulk_create(
+                Recipe.tags.through(
+                    recipe_id=recipe.id, tag_id=self.tags[tag_id]
+                )
+                for recipe, record in zip(recipes, records)
+                for tag_id in record['tags']
+            )
+            amounts = defaultdict(int)
+            for recipe, record in zip(recipes, records):
+                for ingredient_id, amount in record['ingredients']:
+                    amounts[
+                        recipe.id, self.ingredients[ingredient_id]
+                    ] += amount
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe_id=recipe_id,
+                    ingredient_id=ingredient_id,
+                    amount=amount,
+                )
+                for (recipe_id, ingredient_id), amount in amounts.items()
+            )
+            # bulk inserts send no signals
+            publish('recipe')
+        self.stats['recipe'] += len(recipes)
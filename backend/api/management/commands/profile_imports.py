@@ -0,0 +1,65 @@
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+
+IMPORTTIME = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+LOAD_APPLICATION = (
+    'from django.core.wsgi import get_wsgi_application\n'
+    'get_wsgi_application()\n'
+    'from django.urls import get_resolver\n'
+    'get_resolver().url_patterns\n'
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Показывает время импорта модулей при загрузке приложения '
+        'воркером (python -X importtime).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=25)
+        parser.add_argument(
+            '--group', action='store_true',
+            help='Суммировать собственное время по пакетам верхнего уровня.'
+        )
+
+    def handle(self, *args, **options):
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', LOAD_APPLICATION],
+            env=os.environ.copy(),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+            check=True,
+        )
+        modules = []
+        for line in result.stderr.splitlines():
+            match = IMPORTTIME.match(line)
+            if match:
+                own, total, _, name = match.groups()
+                modules.append((name, int(own), int(total)))
+        total = sum(own for _, own, _ in modules)
+        self.stdout.write(
+            f'{len(modules)} modules, {total / 1000:.1f} ms in total'
+        )
+        if options['group']:
+            packages = defaultdict(int)
+            for name, own, _ in modules:
+                packages[name.split('.')[0]] += own
+            rows = sorted(
+                packages.items(), key=lambda item: item[1], reverse=True
+            )
+            for name, own in rows[:options['limit']]:
+                self.stdout.write(f'{own / 1000:8.1f} ms  {name}')
+            return
+        modules.sort(key=lambda module: module[2], reverse=True)
+        self.stdout.write('    self  cumulative  module')
+        for name, own, cumulative in modules[:options['limit']]:
+            self.stdout.write(
+                f'{own / 1000:8.1f}  {cumulative / 1000:10.1f}  {name}'
+            )
@@ -0,0 +1,16 @@
+from api.profiling import make_token
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        'Выдает токен для профилирования запроса '
+        '(заголовок X-Profile или параметр ?_profile=).'
+    )
+
+    def handle(self, *args, **options):
+        self.stdout.write(make_token())
+        self.stderr.write(
+            f'Токен действует {settings.PROFILING_TOKEN_MAX_AGE} секунд.'
+        )
@@ -0,0 +1,54 @@
+import os
+import shutil
+
+from api.querylog import load_stats
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Показывает самые тяжелые SQL-запросы по отпечаткам.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=10)
+        parser.add_argument(
+            '--sort', choices=('total', 'count', 'max', 'rows'),
+            default='total',
+        )
+        parser.add_argument(
+            '--by-view', action='store_true',
+            help='Группировать по представлению, а не только по запросу.',
+        )
+        parser.add_argument(
+            '--reset', action='store_true',
+            help='Удалить накопленную статистику.',
+        )
+
+    def handle(self, *args, **options):
+        directory = settings.QUERY_STATS_DIR
+        if options['reset']:
+            if os.path.isdir(directory):
+                shutil.rmtree(directory)
+            return
+        rows = {}
+        for view, fingerprints in load_stats(directory).items():
+            for key, stats in fingerprints.items():
+                group = (view, key) if options['by_view'] else ('', key)
+                merged = rows.setdefault(
+                    group, {'count': 0, 'total': 0.0, 'max': 0.0, 'rows': 0}
+                )
+                merged['count'] += stats['count']
+                merged['total'] += stats['total']
+                merged['max'] = max(merged['max'], stats['max'])
+                merged['rows'] += stats['rows']
+        top = sorted(
+            rows.items(), key=lambda item: item[1][options['sort']],
+            reverse=True,
+        )[:options['limit']]
+        for (view, key), stats in top:
+            self.stdout.write(
+                f'{stats["total"]:.3f}s total, {stats["count"]} calls, '
+                f'{stats["max"] * 1000:.1f}ms max, {stats["rows"]} rows'
+                + (f', {view}' if view else '')
+            )
+            self.stdout.write(f'    {key}')
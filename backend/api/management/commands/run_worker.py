@@ -0,0 +1,36 @@
+import signal
+
+from api.jobs import Worker
+from api.models import Job
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import autodiscover_modules
+
+
+class Command(BaseCommand):
+    help = 'Запускает обработчик фоновых задач.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lane', action='append', dest='lanes',
+            choices=[lane for lane, _ in Job.LANES],
+            help='Очереди в порядке приоритета, по умолчанию все.',
+        )
+        parser.add_argument('--concurrency', type=int, default=1)
+        parser.add_argument('--poll-interval', type=float, default=1)
+        parser.add_argument(
+            '--burst', action='store_true',
+            help='Выйти, когда очередь опустеет.',
+        )
+
+    def handle(self, *args, **options):
+        autodiscover_modules('tasks')
+        worker = Worker(
+            lanes=options['lanes'] or [lane for lane, _ in Job.LANES],
+            concurrency=options['concurrency'],
+            poll_interval=options['poll_interval'],
+            burst=options['burst'],
+        )
+        signal.signal(signal.SIGTERM, worker.stop)
+        signal.signal(signal.SIGINT, worker.stop)
+        self.stdout.write(f'Worker {worker.name}: {", ".join(worker.lanes)}')
+        worker.run()
@@ -0,0 +1,24 @@
+import os
+
+from rest_framework import permissions
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+collectors = {}
+
+
+def register(name, collector):
+    """Expose ``collector()`` under ``name`` on the metrics endpoint."""
+    collectors[name] = collector
+
+
+class MetricsView(APIView):
+    """In-process metrics of the worker that handles the request."""
+    permission_classes = (permissions.IsAdminUser,)
+    pagination_class = None
+
+    def get(self, request):
+        return Response({
+            'pid': os.getpid(),
+            **{name: collector() for name, collector in collectors.items()},
+        })
@@ -0,0 +1,28 @@
+# Generated by Django 2.2.16 on 2026-10-19 08:23
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Invalidation',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('topic', models.CharField(max_length=50, verbose_name='Тема')),
+                ('key', models.CharField(blank=True, max_length=100, verbose_name='Ключ')),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Событие инвалидации',
+                'verbose_name_plural': 'События инвалидации',
+                'ordering': ('id',),
+            },
+        ),
+    ]
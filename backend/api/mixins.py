@@ -0,0 +1,155 @@
+import hashlib
+from itertools import islice
+
+from django.http import StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+
+from .querylog import log_queries
+
+
+class FastReadMixin:
+    """Serve selected read actions through flat ``.values()`` serializers.
+
+    ``fast_serializer_classes`` maps action names to serializers from
+    ``api.fast_serializers``; actions left out use the regular ones.
+    Only the columns behind the fields picked by ``?fields=``/``?omit=``
+    are selected.
+    """
+    fast_serializer_classes = {}
+
+    def get_fast_serializer_class(self):
+        if self.request.method not in SAFE_METHODS:
+            return None
+        return self.fast_serializer_classes.get(self.action)
+
+    def get_serializer(self, *args, **kwargs):
+        serializer_class = self.get_fast_serializer_class()
+        if serializer_class is None:
+            return super().get_serializer(*args, **kwargs)
+        kwargs['context'] = self.get_serializer_context()
+        return serializer_class(*args, **kwargs)
+
+    def filter_queryset(self, queryset):
+        return self.as_rows(super().filter_queryset(queryset))
+
+    def as_rows(self, queryset):
+        serializer_class = self.get_fast_serializer_class()
+        if serializer_class is None:
+            return queryset
+        return queryset.values(*serializer_class.get_values_fields(
+            serializer_class.select_fields(self.request)
+        ))
+
+
+class StreamingListMixin:
+    """Stream unpaginated lists as a JSON array written chunk by chunk.
+
+    Only kicks in when the negotiated renderer can render chunks, the
+    browsable API and paginated views keep the regular ``list``.
+    """
+    stream_chunk_size = 500
+
+    def list(self, request, *args, **kwargs):
+        renderer = request.accepted_renderer
+        if self.paginator is not None or not hasattr(
+            renderer, 'render_chunks'
+        ):
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        return StreamingHttpResponse(
+            renderer.render_chunks(
+                self.iter_chunks(queryset),
+                request.accepted_media_type,
+                self.get_renderer_context(),
+            ),
+            content_type=request.accepted_media_type,
+        )
+
+    def iter_chunks(self, queryset):
+        # the chunks are read after the middleware has returned, so each
+        # one is logged on its own under the view of the request
+        rows = queryset.iterator(chunk_size=self.stream_chunk_size)
+        while True:
+            with log_queries(self.request):
+                chunk = list(islice(rows, self.stream_chunk_size))
+                data = self.get_serializer(chunk, many=True).data
+            yield data
+            if len(chunk) < self.stream_chunk_size:
+                return
+
+
+class ConditionalGetMixin:
+    """Answer unchanged list and retrieve requests with 304.
+
+    ``validator_fields`` are read from the page rows (or the object) and
+    hashed into the ETag before anything is serialized, so they have to
+    cover everything the representation depends on - per-user flags
+    included. ``last_modified_field`` adds Last-Modified to anonymous
+    detail responses, where no per-user state is involved.
+    """
+    validator_fields = ()
+    last_modified_field = None
+
+    def get_validator(self, obj, field):
+        if isinstance(obj, dict):
+            return obj.get(field)
+        return getattr(obj, field)
+
+    def get_etag(self, objects, *extra):
+        digest = hashlib.md5(repr(extra).encode())
+        for obj in objects:
+            digest.update(repr(tuple(
+                self.get_validator(obj, field)
+                for field in self.validator_fields
+            )).encode())
+        return f'"{digest.hexdigest()}"'
+
+    def not_modified(self, etag, last_modified):
+        return get_conditional_response(
+            self.request, etag=etag, last_modified=last_modified
+        )
+
+    def set_validators(self, response, etag, last_modified):
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        patch_vary_headers(response, ('Authorization',))
+        return response
+
+    def conditional_response(self, etag, last_modified, build):
+        response = self.not_modified(etag, last_modified)
+        if response is None:
+            response = build()
+        return self.set_validators(response, etag, last_modified)
+
+    def get_last_modified(self, instance):
+        if not self.last_modified_field or self.request.user.is_authenticated:
+            return None
+        return int(self.get_validator(
+            instance, self.last_modified_field
+        ).timestamp())
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            return super().list(request, *args, **kwargs)
+        etag = self.get_etag(
+            page, request.get_full_path(), self.paginator.page.paginator.count
+        )
+        return self.conditional_response(
+            etag, None, lambda: self.get_paginated_response(
+                self.get_serializer(page, many=True).data
+            )
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        return self.conditional_response(
+            self.get_etag([instance], request.get_full_path()),
+            self.get_last_modified(instance),
+            lambda: Response(self.get_serializer(instance).data),
+        )
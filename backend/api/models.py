@@ -0,0 +1,86 @@
+from django.db import models
+from django.utils import timezone
+
+
+class Job(models.Model):
+    LANE_HIGH = 'high'
+    LANE_DEFAULT = 'default'
+    LANE_LOW = 'low'
+    LANES = (
+        (LANE_HIGH, 'Срочные'),
+        (LANE_DEFAULT, 'Обычные'),
+        (LANE_LOW, 'Фоновые'),
+    )
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (QUEUED, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Выполнена'),
+        (FAILED, 'Ошибка'),
+    )
+
+    name = models.CharField('Задача', max_length=100)
+    payload = models.TextField('Аргументы (JSON)', default='{}')
+    lane = models.CharField(
+        'Очередь',
+        max_length=10,
+        choices=LANES,
+        default=LANE_DEFAULT,
+    )
+    priority = models.SmallIntegerField('Приоритет', default=0)
+    status = models.CharField(
+        'Статус',
+        max_length=10,
+        choices=STATUSES,
+        default=QUEUED,
+    )
+    idempotency_key = models.CharField(
+        'Ключ идемпотентности',
+        max_length=200,
+        unique=True,
+        null=True,
+        blank=True,
+    )
+    attempts = models.PositiveSmallIntegerField('Попыток', default=0)
+    max_attempts = models.PositiveSmallIntegerField(
+        'Максимум попыток', default=5
+    )
+    run_at = models.DateTimeField('Запустить после', default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Фоновая задача'
+        verbose_name_plural = 'Фоновые задачи'
+        ordering = ('-created_at',)
+        indexes = (
+            models.Index(
+                fields=('status', 'lane', 'run_at'),
+                name='api_job_pending_idx',
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.name} #{self.pk} ({self.status})'
+
+
+class Invalidation(models.Model):
+    """Event of the invalidation bus, see api/invalidation.py. The id is
+    the version, workers apply events in id order."""
+    topic = models.CharField('Тема', max_length=50)
+    key = models.CharField('Ключ', max_length=100, blank=True)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        verbose_name = 'Событие инвалидации'
+        verbose_name_plural = 'События инвалидации'
+        ordering = ('id',)
+
+    def __str__(self):
+        return f'{self.topic}:{self.key or "*"} #{self.pk}'
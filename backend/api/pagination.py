@@ -1,6 +1,195 @@
+import hashlib
+import threading
+from collections import Counter
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import (InvalidPage, Page, PageNotAnInteger,
+                                   Paginator)
+from django.db import DatabaseError, connection, transaction
+from django.utils.functional import cached_property
 from rest_framework.pagination import PageNumberPagination
 
+from . import invalidation, metrics
+
 
 class LimitPageNumberPagination(PageNumberPagination):
     page_size = 6
     page_size_query_param = 'limit'
+
+
+class CountStats:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counter = Counter()
+
+    def incr(self, name):
+        with self.lock:
+            self.counter[name] += 1
+
+    def __call__(self):
+        with self.lock:
+            return dict(self.counter)
+
+
+count_stats = CountStats()
+metrics.register('pagination_counts', count_stats)
+
+
+def estimate_rows(model):
+    """Row count of the model table from planner statistics, None when
+    the database has none."""
+    table = model._meta.db_table
+    if connection.vendor == 'postgresql':
+        sql = 'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass'
+    elif connection.vendor == 'sqlite':
+        sql = 'SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1'
+    else:
+        return None
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(sql, [table])
+            row = cursor.fetchone()
+    except DatabaseError:
+        return None
+    if row is None:
+        return None
+    estimate = int(str(row[0]).split()[0])
+    return estimate if estimate >= 0 else None
+
+
+class CountPage(Page):
+    """Page read with the first row of the next one, which tells if
+    there is a next page whatever the count says."""
+
+    def __init__(self, object_list, number, paginator):
+        self.more = len(object_list) > paginator.per_page
+        super().__init__(
+            object_list[:paginator.per_page], number, paginator
+        )
+
+    def has_next(self):
+        return self.more
+
+
+class CountPaginator(Paginator):
+    """Paginator taking its count from ``count_func``.
+
+    Estimated and cached counts may be off in either direction, so the
+    count only goes into the response: pages are sliced without it and
+    page numbers past it come back empty instead of being rejected.
+    """
+
+    def __init__(self, object_list, per_page, count_func, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_func = count_func
+        self.count_exact = True
+
+    @cached_property
+    def count(self):
+        count, self.count_exact = self.count_func(self.object_list)
+        return count
+
+    def validate_number(self, number):
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('Номер страницы не является числом.')
+        if number < 1:
+            raise InvalidPage('Номер страницы меньше 1.')
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        return self.make_page(
+            self.object_list[bottom:bottom + self.per_page + 1], number
+        )
+
+    def make_page(self, rows, number):
+        """Page ``number`` of ``rows`` read from its start with one
+        extra row. The count is corrected where the rows contradict
+        it."""
+        rows = list(rows)
+        # read first, so the count is cached for the other pages too
+        count = self.count
+        seen = (number - 1) * self.per_page + len(rows)
+        if len(rows) > self.per_page:
+            self.count = max(count, seen)
+        elif rows or number == 1:
+            self.count = seen
+        return CountPage(rows, number, self)
+
+
+class EstimatedCountPagination(LimitPageNumberPagination):
+    """Page numbers with cheap counts.
+
+    Unfiltered lists over tables larger than ``ESTIMATE_THRESHOLD`` rows
+    report the planner estimate. Other counts are exact and cached for
+    ``TIMEOUT`` seconds per model and WHERE clause, so requests differing in
+    page, limit or output fields share one entry. Keys carry the
+    invalidation version of the topics in ``TOPICS``, so a write on any
+    worker retires the cached counts of every worker. The
+    ``X-Count-Exact`` header tells the client which kind of count it got.
+    """
+    count_header = 'X-Count-Exact'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.django_paginator_class = partial(
+            CountPaginator, count_func=self.get_count
+        )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_count(self, queryset):
+        options = settings.PAGINATION_COUNT_CACHE
+        count_queryset = queryset.values('pk')
+        query = count_queryset.query
+        cache = caches[options['ALIAS']]
+        if not query.where and not query.distinct:
+            estimate_key = f'page-estimate:1:{queryset.model._meta.label}'
+            estimate = cache.get(estimate_key)
+            if estimate is None:
+                estimate = estimate_rows(queryset.model)
+                if estimate is None:
+                    estimate = -1
+                cache.set(estimate_key, estimate, options['TIMEOUT'])
+            if estimate >= options['ESTIMATE_THRESHOLD']:
+                count_stats.incr('estimated')
+                return estimate, False
+        try:
+            key = self.get_count_key(query, queryset.db)
+        except EmptyResultSet:
+            return 0, True
+        count = cache.get(key)
+        if count is None:
+            count_stats.incr('miss')
+            count = count_queryset.count()
+            cache.set(key, count, options['TIMEOUT'])
+        else:
+            count_stats.incr('hit')
+        return count, True
+
+    def get_count_key(self, query, using):
+        """Cache key built from the model and the compiled WHERE clause
+        only, joins and selected columns do not change the count."""
+        where, params = query.get_compiler(using=using).compile(query.where)
+        filters = repr((
+            query.model._meta.label, where, tuple(params), query.distinct
+        ))
+        topics = settings.PAGINATION_COUNT_CACHE['TOPICS'].get(
+            query.model._meta.label, ()
+        )
+        return 'page-count:{}:{}'.format(
+            invalidation.version(*topics) if topics else 1,
+            hashlib.md5(filters.encode()).hexdigest(),
+        )
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        response[self.count_header] = (
+            'true' if self.page.paginator.count_exact else 'false'
+        )
+        return response
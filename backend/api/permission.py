@@ -17,7 +17,30 @@ class IsAdminOrReadOnly(permissions.BasePermission):
 
 class IsAuthorPermission(permissions.BasePermission):
 
+    def has_permission(self, request, view):
+        return (
+            request.method in permissions.SAFE_METHODS
+            or request.user.is_authenticated
+        )
+
     def has_object_permission(self, request, view, obj):
         return request.method in permissions.SAFE_METHODS or (
             obj.author == request.user
         )
+
+
+class IsUserOrAdminOrReadOnly(permissions.BasePermission):
+    """Anyone may read and sign up, an account is changed or deleted
+    only by its user or an admin."""
+
+    def has_permission(self, request, view):
+        return (
+            request.method in permissions.SAFE_METHODS
+            or view.action == 'create'
+            or request.user.is_authenticated
+        )
+
+    def has_object_permission(self, request, view, obj):
+        return request.method in permissions.SAFE_METHODS or (
+            obj == request.user or request.user.is_superuser
+        )
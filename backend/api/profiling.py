@@ -0,0 +1,168 @@
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.core import signing
+from django.db import connection
+
+SIGNING_SALT = 'api.profiling'
+TOKEN_HEADER = 'HTTP_X_PROFILE'
+TOKEN_PARAM = '_profile'
+
+
+def make_token():
+    return signing.TimestampSigner(salt=SIGNING_SALT).sign('profile')
+
+
+def check_token(token):
+    try:
+        signing.TimestampSigner(salt=SIGNING_SALT).unsign(
+            token, max_age=settings.PROFILING_TOKEN_MAX_AGE
+        )
+    except signing.BadSignature:
+        return False
+    return True
+
+
+def should_profile(request, sample_rate):
+    token = request.META.get(TOKEN_HEADER) or request.GET.get(TOKEN_PARAM)
+    if token:
+        return check_token(token)
+    return sample_rate > 0 and random.random() < sample_rate
+
+
+class StackSampler:
+    """Samples the stack of the calling thread into folded stacks.
+
+    The output is the ``frame;frame;frame count`` format understood by
+    flamegraph.pl, speedscope and similar tools.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.stacks = Counter()
+        self.thread_id = threading.get_ident()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(
+                    f'{code.co_name} ({code.co_filename}:{frame.f_lineno})'
+                )
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def enable(self):
+        self.thread.start()
+
+    def disable(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def dump(self, path):
+        with open(f'{path}.folded', 'w') as file:
+            for stack, count in self.stacks.most_common():
+                file.write(f'{stack} {count}\n')
+
+
+class CProfiler:
+
+    def __init__(self):
+        import cProfile
+        self.profile = cProfile.Profile()
+
+    def enable(self):
+        self.profile.enable()
+
+    def disable(self):
+        self.profile.disable()
+
+    def dump(self, path):
+        self.profile.dump_stats(f'{path}.prof')
+
+
+class ProfilingMiddleware:
+    """Profiles single requests on demand.
+
+    A request is profiled when it carries a token from
+    ``manage.py profiling_token`` in the ``X-Profile`` header or the
+    ``_profile`` query parameter, or when it falls into the
+    ``PROFILING_SAMPLE_RATE`` share of traffic. The profile and the SQL
+    timeline are written to ``PROFILING_DIR``; other requests only pay
+    for a dict lookup and a random() call.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = settings.PROFILING_SAMPLE_RATE
+        self.directory = settings.PROFILING_DIR
+
+    def should_profile(self, request):
+        return should_profile(request, self.sample_rate)
+
+    def get_profiler(self):
+        if settings.PROFILING_MODE == 'sampler':
+            return StackSampler(settings.PROFILING_SAMPLE_INTERVAL)
+        return CProfiler()
+
+    def __call__(self, request):
+        if not self.should_profile(request):
+            return self.get_response(request)
+        queries = []
+        started = time.perf_counter()
+
+        def record_query(execute, sql, params, many, context):
+            query_started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                queries.append({
+                    'start': query_started - started,
+                    'duration': time.perf_counter() - query_started,
+                    'sql': sql,
+                    'many': many,
+                })
+
+        profiler = self.get_profiler()
+        with connection.execute_wrapper(record_query):
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+        duration = time.perf_counter() - started
+        name = '{}-{}-{}-{}'.format(
+            time.strftime('%Y%m%d%H%M%S'),
+            uuid.uuid4().hex[:8],
+            request.method,
+            re.sub(r'[^\w]+', '_', request.path).strip('_')[:100],
+        )
+        path = os.path.join(self.directory, name)
+        os.makedirs(self.directory, exist_ok=True)
+        profiler.dump(path)
+        with open(f'{path}.sql.json', 'w') as file:
+            json.dump(
+                {
+                    'path': request.get_full_path(),
+                    'status': response.status_code,
+                    'duration': duration,
+                    'queries': queries,
+                },
+                file,
+                ensure_ascii=False,
+                indent=2,
+            )
+        response['X-Profile-Id'] = name
+        return response
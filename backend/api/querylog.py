@@ -0,0 +1,147 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+LITERALS = (
+    (re.compile(r'\s+'), ' '),
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'%s'), '?'),
+    (re.compile(r'\bIN \((?:\?, )*\?\)', re.IGNORECASE), 'IN (...)'),
+    (
+        re.compile(
+            r'\bVALUES \((?:\?, )*\?\)(?:, \((?:\?, )*\?\))*',
+            re.IGNORECASE,
+        ),
+        'VALUES (...)',
+    ),
+)
+
+
+@lru_cache(maxsize=4096)
+def fingerprint(sql):
+    """Normalize a statement so that queries differing only in literals,
+    parameters, IN-list length or inserted rows share one fingerprint."""
+    for pattern, replacement in LITERALS:
+        sql = pattern.sub(replacement, sql)
+    return sql.strip()
+
+
+def stack_excerpt(limit=5):
+    frames = [
+        frame for frame in traceback.extract_stack()[:-3]
+        if frame.filename.startswith(settings.BASE_DIR)
+        and 'site-packages' not in frame.filename
+        and frame.filename != __file__
+    ]
+    return ''.join(traceback.format_list(frames[-limit:]))
+
+
+class QueryStats:
+    """Count, total time, max time and rows per fingerprint and view."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}
+        self.flushed = time.monotonic()
+
+    def add(self, view, sql, duration, rows):
+        key = fingerprint(sql)
+        with self.lock:
+            stats = self.views.setdefault(view, {}).setdefault(
+                key, {'count': 0, 'total': 0.0, 'max': 0.0, 'rows': 0}
+            )
+            stats['count'] += 1
+            stats['total'] += duration
+            stats['max'] = max(stats['max'], duration)
+            stats['rows'] += rows
+
+    def flush(self, directory, force=False):
+        now = time.monotonic()
+        if not force and (
+            now - self.flushed < settings.QUERY_STATS_FLUSH_INTERVAL
+        ):
+            return
+        self.flushed = now
+        with self.lock:
+            data = json.dumps(self.views, ensure_ascii=False)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f'{os.getpid()}.json')
+        with open(f'{path}.tmp', 'w') as file:
+            file.write(data)
+        os.replace(f'{path}.tmp', path)
+
+
+def load_stats(directory):
+    """Merge the snapshots written by every worker."""
+    views = {}
+    if not os.path.isdir(directory):
+        return views
+    for name in os.listdir(directory):
+        if not name.endswith('.json'):
+            continue
+        with open(os.path.join(directory, name)) as file:
+            snapshot = json.load(file)
+        for view, fingerprints in snapshot.items():
+            for key, stats in fingerprints.items():
+                merged = views.setdefault(view, {}).setdefault(
+                    key, {'count': 0, 'total': 0.0, 'max': 0.0, 'rows': 0}
+                )
+                merged['count'] += stats['count']
+                merged['total'] += stats['total']
+                merged['max'] = max(merged['max'], stats['max'])
+                merged['rows'] += stats['rows']
+    return views
+
+
+query_stats = QueryStats()
+
+
+@contextmanager
+def log_queries(request):
+    """Feed ORM statements run by this thread inside the block into
+    ``query_stats`` under the view of ``request``."""
+    def record_query(execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            match = getattr(request, 'resolver_match', None)
+            view = match.view_name if match else ''
+            rows = max(context['cursor'].rowcount, 0)
+            query_stats.add(view, sql, duration, rows)
+            if duration >= settings.SLOW_QUERY_THRESHOLD:
+                logger.warning(
+                    'Slow query %.3fs in %s: %s\n%s',
+                    duration, view or request.path,
+                    fingerprint(sql), stack_excerpt(),
+                )
+
+    with connection.execute_wrapper(record_query):
+        yield
+
+
+class QueryLogMiddleware:
+    """Feeds every ORM statement into ``query_stats`` and logs the ones
+    slower than ``SLOW_QUERY_THRESHOLD`` with a stack excerpt."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with log_queries(request):
+            response = self.get_response(request)
+        query_stats.flush(settings.QUERY_STATS_DIR)
+        return response
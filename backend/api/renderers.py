@@ -0,0 +1,58 @@
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+LINE_SEPARATOR = '\u2028'.encode()
+PARAGRAPH_SEPARATOR = '\u2029'.encode()
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer on top of orjson, falls back to stdlib json.
+
+    Output matches the stock renderer byte for byte: types orjson would
+    format differently (dates, decimals, lazy strings) go through DRF's
+    encoder, U+2028 and U+2029 are escaped like DRF does, indented output
+    is left to the stock renderer. Floats are the exception, orjson
+    writes exponents without the sign and padding of ``repr``, e.g.
+    ``1e16`` for ``1e+16``; only ``/api/metrics/`` returns any.
+    """
+    options = (
+        orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if orjson is not None else 0
+    )
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        renderer_context = renderer_context or {}
+        if orjson is None or self.get_indent(
+            accepted_media_type, renderer_context
+        ):
+            return super().render(
+                data, accepted_media_type, renderer_context
+            )
+        # valid JSON but not valid JavaScript, DRF escapes them as well
+        return orjson.dumps(
+            data,
+            default=self.encoder_class().default,
+            option=self.options,
+        ).replace(
+            LINE_SEPARATOR, b'\\u2028'
+        ).replace(PARAGRAPH_SEPARATOR, b'\\u2029')
+
+    def render_chunks(self, chunks, accepted_media_type=None,
+                      renderer_context=None):
+        """Render an iterable of lists as one JSON array, chunk by chunk."""
+        yield b'['
+        separator = b''
+        for chunk in chunks:
+            if not chunk:
+                continue
+            yield separator + self.render(
+                chunk, accepted_media_type, renderer_context
+            )[1:-1]
+            separator = b','
+        yield b']'
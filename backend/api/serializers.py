@@ -1,9 +1,11 @@
 import django.contrib.auth.password_validation as validators
 from django.contrib.auth import authenticate, get_user_model
 from django.contrib.auth.hashers import make_password
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 from drf_base64.fields import Base64ImageField
-from recipe.models import Ingredient, Recipe, RecipeIngredient, Tag
+from recipe.models import (Ingredient, MeasurementUnit, Recipe,
+                           RecipeIngredient, Tag)
 from rest_framework import serializers
 from user.models import Subscribe
 
@@ -88,10 +90,14 @@ class TagSerializer(serializers.ModelSerializer):
 
 
 class IngredientSerializer(serializers.ModelSerializer):
+    measurement_unit = serializers.SlugRelatedField(
+        slug_field='name',
+        queryset=MeasurementUnit.objects.all(),
+    )
 
     class Meta:
         model = Ingredient
-        fields = '__all__'
+        fields = ('id', 'name', 'measurement_unit')
 
 
 class IngredientsEditSerializer(serializers.ModelSerializer):
@@ -167,7 +173,9 @@ class RecipeReadSerializer(serializers.ModelSerializer):
         )
 
     def get_ingredients(self, obj):
-        all_ingredients = RecipeIngredient.objects.filter(recipe=obj)
+        all_ingredients = RecipeIngredient.objects.filter(
+            recipe=obj
+        ).select_related('ingredient__measurement_unit')
         return RecipeIngredientSerializer(all_ingredients, many=True).data
 
 
@@ -201,18 +209,22 @@ class RecipeAddAndEditSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(
                 'Блюд без ингредиентов не бывает. Добавьте хотя бы 1!'
             )
-        ingredients_add = []
+        existing = set(Ingredient.objects.filter(
+            id__in=[elem['id'] for elem in ingredients]
+        ).values_list('id', flat=True))
+        ingredients_add = set()
         for elem in ingredients:
             if int(elem.get('amount')) < 1:
                 raise serializers.ValidationError(
                     'Количество ингредиента должно быть больше 1!'
                 )
-            ingredient = get_object_or_404(Ingredient, id=elem['id'])
-            if ingredient in ingredients_add:
+            if elem['id'] not in existing:
+                raise Http404
+            if elem['id'] in ingredients_add:
                 raise serializers.ValidationError(
                     'У вас два одинаковых ингредиента.'
                 )
-            ingredients_add.append(ingredient)
+            ingredients_add.add(elem['id'])
         return ingredients
 
     def create(self, validated_data):
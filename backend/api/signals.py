@@ -0,0 +1,39 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from recipe.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from user.models import Subscribe
+
+from .invalidation import publish
+
+User = get_user_model()
+
+# model -> topic and the field holding the key of its events
+TOPICS = {
+    Recipe: ('recipe', 'id'),
+    Tag: ('tag', 'id'),
+    Ingredient: ('ingredient', 'id'),
+    Subscribe: ('subscribe', 'follower_id'),
+    Favorite: ('favorite', 'user_id'),
+    ShoppingCart: ('shopping_cart', 'user_id'),
+}
+
+
+def publish_change(sender, instance, using, **kwargs):
+    topic, field = TOPICS[sender]
+    publish(topic, getattr(instance, field), using)
+
+
+for model in TOPICS:
+    post_save.connect(publish_change, sender=model)
+    post_delete.connect(publish_change, sender=model)
+
+
+def publish_account(sender, instance, using, created=True, **kwargs):
+    # users are saved on every login, the lists only change on sign-ups
+    # and deletions
+    if created:
+        publish('user', instance.id, using)
+
+
+post_save.connect(publish_account, sender=User)
+post_delete.connect(publish_account, sender=User)
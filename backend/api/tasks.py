@@ -0,0 +1,32 @@
+from django.conf import settings
+from recipe import trending
+from user import deletion
+
+from . import invalidation
+from .jobs import job
+from .models import Job
+
+
+@job(
+    'decay_trending',
+    lane=Job.LANE_LOW,
+    concurrency=1,
+    every=settings.TRENDING['DECAY_INTERVAL'],
+)
+def decay_trending():
+    trending.decay()
+
+
+@job('delete_user', lane=Job.LANE_LOW)
+def delete_user(user_id):
+    deletion.delete_user(user_id)
+
+
+@job(
+    'prune_invalidations',
+    lane=Job.LANE_LOW,
+    concurrency=1,
+    every=settings.INVALIDATION['PRUNE_INTERVAL'],
+)
+def prune_invalidations():
+    invalidation.prune()
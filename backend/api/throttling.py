@@ -0,0 +1,235 @@
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import JsonResponse
+from rest_framework import status
+from rest_framework.throttling import BaseThrottle
+
+
+def request_cost(request):
+    """Tokens a request takes, ``THROTTLING['COSTS']`` by URL name.
+    A list narrowed by its search parameter costs one token."""
+    options = settings.THROTTLING
+    match = request.resolver_match
+    if match is None or options['SEARCHES'].get(
+        match.url_name
+    ) in request.GET:
+        return 1
+    return options['COSTS'].get(match.url_name, 1)
+
+
+class ThrottleStats:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.decisions = Counter()
+        self.rejected = Counter()
+        self.in_flight = 0
+
+    def record(self, decision, url_name=None):
+        with self.lock:
+            self.decisions[decision] += 1
+            if url_name is not None:
+                self.rejected[url_name] += 1
+
+    def __call__(self):
+        with self.lock:
+            return {
+                'decisions': dict(self.decisions),
+                'rejected': dict(self.rejected),
+                'in_flight': self.in_flight,
+            }
+
+
+stats = ThrottleStats()
+
+
+class TokenBuckets:
+    """Per-client token buckets of this process, least recently used
+    ones are dropped past ``maxsize``: a dropped bucket starts full."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        self.buckets = OrderedDict()
+
+    def take(self, ident, cost, rate, burst):
+        """Take ``cost`` tokens, return 0 or the seconds until they are
+        available."""
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated = self.buckets.pop(ident, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            wait = 0
+            if tokens >= cost:
+                tokens -= cost
+            else:
+                wait = (cost - tokens) / rate
+            self.buckets[ident] = (tokens, now)
+            while len(self.buckets) > self.maxsize:
+                self.buckets.popitem(last=False)
+        return wait
+
+
+buckets = TokenBuckets(settings.THROTTLING['LOCAL_MAXSIZE'])
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Token bucket per client, requests take ``request_cost`` tokens.
+
+    The bucket of this process answers first, so a flood is rejected
+    without a round trip. Since every worker has its own, the shared
+    cache also counts tokens per refill window with atomic ``incr``,
+    which caps a client across workers at the same ``RATE``.
+    """
+    def allow_request(self, request, view):
+        options = settings.THROTTLING
+        if not options['ENABLED']:
+            return True
+        ident = self.get_client(request)
+        cost = request_cost(request)
+        url_name = getattr(request.resolver_match, 'url_name', None)
+        self.delay = buckets.take(
+            ident, cost, options['RATE'], options['BURST']
+        )
+        if self.delay:
+            stats.record('throttled_local', url_name)
+            return False
+        if options['ALIAS']:
+            self.delay = self.take_shared(ident, cost, options)
+            if self.delay:
+                stats.record('throttled_shared', url_name)
+                return False
+        stats.record('allowed')
+        return True
+
+    def get_client(self, request):
+        if request.user and request.user.is_authenticated:
+            return f'user:{request.user.pk}'
+        return f'ip:{self.get_ident(request)}'
+
+    def take_shared(self, ident, cost, options):
+        window = options['BURST'] / options['RATE']
+        now = time.time()
+        slot = int(now // window)
+        key = f'throttle:{ident}:{slot}'
+        cache = caches[options['ALIAS']]
+        cache.add(key, 0, window * 2)
+        try:
+            used = cache.incr(key, cost)
+        except ValueError:
+            # expired between add and incr
+            return 0
+        if used <= options['BURST'] + options['RATE'] * window:
+            return 0
+        return (slot + 1) * window - now
+
+    def wait(self):
+        return self.delay
+
+
+class InFlightLimiter:
+    """Expensive requests in flight in this process, overall and per
+    client."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clients = Counter()
+
+    def acquire(self, ident):
+        """Return None when admitted, else the status to answer with."""
+        options = settings.THROTTLING
+        with self.lock:
+            if self.clients[ident] >= options['MAX_IN_FLIGHT_PER_CLIENT']:
+                return status.HTTP_429_TOO_MANY_REQUESTS
+            if stats.in_flight >= options['MAX_IN_FLIGHT']:
+                return status.HTTP_503_SERVICE_UNAVAILABLE
+            self.clients[ident] += 1
+            stats.in_flight += 1
+        return None
+
+    def release(self, ident):
+        with self.lock:
+            self.clients[ident] -= 1
+            if not self.clients[ident]:
+                del self.clients[ident]
+            stats.in_flight -= 1
+
+
+limiter = InFlightLimiter()
+
+
+class Release:
+    """Closable that gives the slot back once, when the response is
+    sent, so a streamed response holds it until its last chunk."""
+
+    def __init__(self, ident):
+        self.ident = ident
+        self.released = False
+
+    def close(self):
+        if not self.released:
+            self.released = True
+            limiter.release(self.ident)
+
+
+class ConcurrencyLimitMiddleware:
+    """Sheds expensive requests, those costing more than one token,
+    beyond ``MAX_IN_FLIGHT`` per worker (503) or
+    ``MAX_IN_FLIGHT_PER_CLIENT`` per client (429), with Retry-After.
+
+    Runs before authentication, so clients are told apart by their
+    Authorization header or address.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.throttle_release = None
+        try:
+            response = self.get_response(request)
+        except Exception:
+            if request.throttle_release is not None:
+                request.throttle_release.close()
+            raise
+        if request.throttle_release is not None:
+            # the server closes the response once it is sent
+            response._closable_objects.append(request.throttle_release)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.throttle_release, response = admit(request)
+        return response
+
+
+def admit(request):
+    """Take an in-flight slot for an expensive request.
+
+    Return the ``Release`` of the slot (None for cheap requests) and
+    None, or None and the response rejecting the request.
+    """
+    if not settings.THROTTLING['ENABLED'] or request_cost(request) <= 1:
+        return None, None
+    ident = request.META.get('HTTP_AUTHORIZATION') or (
+        BaseThrottle().get_ident(request)
+    )
+    rejected = limiter.acquire(ident)
+    if rejected is None:
+        return Release(ident), None
+    stats.record(
+        'rejected_client'
+        if rejected == status.HTTP_429_TOO_MANY_REQUESTS
+        else 'rejected_worker',
+        request.resolver_match.url_name,
+    )
+    response = JsonResponse(
+        {'detail': 'Слишком много одновременных запросов.'},
+        status=rejected,
+        json_dumps_params={'ensure_ascii': False},
+    )
+    response['Retry-After'] = str(settings.THROTTLING['RETRY_AFTER'])
+    return None, response
@@ -1,9 +1,11 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
+from .metrics import MetricsView
 from .views import (AddAndDeleteFavoriteRecipe, AddAndDeleteFollow,
                     AddAndDeleteShoppingCart, IngredientViewSet, RecipeViewSet,
                     TagViewSet, UserViewSet)
+from .warmup import HealthView
 
 app_name = 'api'
 
@@ -28,6 +30,8 @@ urlpatterns = [
          AddAndDeleteShoppingCart.as_view(),
          name='shopping_cart'
          ),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
+    path('health/', HealthView.as_view(), name='health'),
     path('', include(router.urls)),
     path('', include('djoser.urls')),
     path('auth/', include('djoser.urls.authtoken'))
@@ -1,18 +1,30 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.hashers import make_password
-from django.db import models
-from django.db.models import Count, Sum
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models import Case, Count, Sum, When
 from django.db.models.expressions import Exists, OuterRef, Value
 from django.http import HttpResponse
 from django.shortcuts import get_object_or_404
-from recipe.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from recipe import trending
+from recipe.models import (Favorite, Ingredient, MeasurementUnit, Recipe,
+                           RecipeIngredient, ShoppingCart, Tag)
 from rest_framework import generics, permissions, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import SAFE_METHODS
 from rest_framework.response import Response
-
-from .filters import IngredientFilter, RecipeFilter
-from .permission import IsAdminOrReadOnly, IsAuthorPermission
+from user import deletion
+from user.models import Subscribe
+
+from .fast_serializers import (FollowsFastSerializer, RecipeReadFastSerializer,
+                               UserListFastSerializer)
+from .filters import IndexedSearchFilter, IngredientFilter, RecipeFilter
+from .jobs import enqueue
+from .mixins import ConditionalGetMixin, FastReadMixin, StreamingListMixin
+from .pagination import EstimatedCountPagination
+from .permission import (IsAdminOrReadOnly, IsAuthorPermission,
+                         IsUserOrAdminOrReadOnly)
 from .serializers import (FollowsSerializer, IngredientSerializer,
                           RecipeAddAndEditSerializer, RecipeInfoSerializer,
                           RecipeReadSerializer, TagSerializer,
@@ -22,9 +34,17 @@ from .serializers import (FollowsSerializer, IngredientSerializer,
 User = get_user_model()
 
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(FastReadMixin, viewsets.ModelViewSet):
     queryset = User.objects.all()
-    permission_classes = (permissions.AllowAny,)
+    permission_classes = (IsUserOrAdminOrReadOnly,)
+    pagination_class = EstimatedCountPagination
+    filter_backends = (IndexedSearchFilter,)
+    search_fields = ('username', 'first_name', 'last_name', 'email')
+    fast_serializer_classes = {
+        'list': UserListFastSerializer,
+        'retrieve': UserListFastSerializer,
+        'subscriptions': FollowsFastSerializer,
+    }
 
     def get_serializer_class(self):
         if self.request.method in SAFE_METHODS:
@@ -35,6 +55,21 @@ class UserViewSet(viewsets.ModelViewSet):
         password = make_password(self.request.data['password'])
         serializer.save(password=password)
 
+    def destroy(self, request, *args, **kwargs):
+        """Users with many recipes are deactivated at once and deleted
+        in chunks by a background job, the response is 202 then."""
+        instance = self.get_object()
+        if not deletion.is_large(instance):
+            self.perform_destroy(instance)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        deletion.deactivate(instance)
+        enqueue(
+            'delete_user',
+            {'user_id': instance.id},
+            key=f'delete_user:{instance.id}',
+        )
+        return Response(status=status.HTTP_202_ACCEPTED)
+
     @action(
         detail=False,
         methods=['get', ],
@@ -81,9 +116,11 @@ class UserViewSet(viewsets.ModelViewSet):
             is_subscribed=Value(
                 value=True,
                 output_field=models.BooleanField()),
-        )
-        pages = self.paginate_queryset(queryset)
-        serializer = FollowsSerializer(
+        ).order_by('id')
+        pages = self.paginate_queryset(self.as_rows(queryset))
+        serializer = (
+            self.get_fast_serializer_class() or FollowsSerializer
+        )(
             pages,
             many=True,
             context={'request': request}
@@ -116,6 +153,22 @@ class AddAndDeleteFollow(generics.CreateAPIView, generics.DestroyAPIView):
         self.request.user.follower.filter(following=instance).delete()
 
 
+def add_once(model, user, recipe):
+    """Add the recipe to a list of the user, return False when it is
+    there already. The insert itself decides, so concurrent requests
+    cannot both report an addition."""
+    try:
+        if connection.in_atomic_block:
+            # a failed insert must not break the outer transaction
+            with transaction.atomic():
+                model.objects.create(user=user, recipe=recipe)
+        else:
+            model.objects.create(user=user, recipe=recipe)
+    except IntegrityError:
+        return False
+    return True
+
+
 class AddAndDeleteFavoriteRecipe(
     generics.CreateAPIView,
     generics.DestroyAPIView
@@ -131,13 +184,16 @@ class AddAndDeleteFavoriteRecipe(
     def create(self, request, *args, **kwargs):
         recipe_id = self.kwargs['recipe_id']
         recipe = get_object_or_404(Recipe, id=recipe_id)
-        favorite, created = Favorite.objects.get_or_create(user=request.user)
-        favorite.recipe.add(recipe)
+        if add_once(Favorite, request.user, recipe):
+            trending.record(recipe.id, settings.TRENDING['FAVORITE_WEIGHT'])
         serializer = self.get_serializer(recipe)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def perform_destroy(self, instance):
-        self.request.user.favorite_recipe.recipe.remove(instance)
+        Favorite.objects.filter(
+            user=self.request.user,
+            recipe=instance
+        ).delete()
 
 
 class AddAndDeleteShoppingCart(
@@ -155,40 +211,59 @@ class AddAndDeleteShoppingCart(
     def create(self, request, *args, **kwargs):
         recipe_id = self.kwargs['recipe_id']
         recipe = get_object_or_404(Recipe, id=recipe_id)
-        shopping, created = ShoppingCart.objects.get_or_create(
-            user=request.user
-        )
-        shopping.recipe.add(recipe)
+        if add_once(ShoppingCart, request.user, recipe):
+            trending.record(
+                recipe.id, settings.TRENDING['SHOPPING_CART_WEIGHT']
+            )
         serializer = self.get_serializer(recipe)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def perform_destroy(self, instance):
-        self.request.user.shopping_list.recipe.remove(instance)
+        ShoppingCart.objects.filter(
+            user=self.request.user,
+            recipe=instance
+        ).delete()
 
 
-class TagViewSet(viewsets.ModelViewSet):
+class TagViewSet(StreamingListMixin, viewsets.ModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (IsAdminOrReadOnly,)
     pagination_class = None
 
 
-class IngredientViewSet(viewsets.ModelViewSet):
-    queryset = Ingredient.objects.all()
+class IngredientViewSet(StreamingListMixin, viewsets.ModelViewSet):
+    queryset = Ingredient.objects.select_related('measurement_unit')
     serializer_class = IngredientSerializer
     permission_classes = (IsAdminOrReadOnly,)
     pagination_class = None
     filterset_class = IngredientFilter
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(
+    ConditionalGetMixin,
+    FastReadMixin,
+    viewsets.ModelViewSet
+):
     serializer_class = RecipeReadSerializer
     permission_classes = (IsAuthorPermission,)
+    pagination_class = EstimatedCountPagination
     filterset_class = RecipeFilter
+    fast_serializer_classes = {
+        'list': RecipeReadFastSerializer,
+        'retrieve': RecipeReadFastSerializer,
+        'batch': RecipeReadFastSerializer,
+        'trending': RecipeReadFastSerializer,
+    }
+    validator_fields = (
+        'id', 'updated_at',
+        'is_favorited', 'is_in_shopping_cart', 'is_subscribed',
+    )
+    last_modified_field = 'updated_at'
 
     def get_queryset(self):
         if self.request.user.is_authenticated:
-            return Recipe.objects.all().annotate(
+            queryset = Recipe.objects.all().annotate(
                 is_favorited=Exists(Favorite.objects.filter(
                     user=self.request.user,
                     recipe=OuterRef('id'))
@@ -196,10 +271,14 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
                     user=self.request.user,
                     recipe=OuterRef('id'))
+                ),
+                is_subscribed=Exists(Subscribe.objects.filter(
+                    follower=self.request.user,
+                    following=OuterRef('author'))
                 )
             ).select_related('author')
         else:
-            return Recipe.objects.all().annotate(
+            queryset = Recipe.objects.all().annotate(
                 is_favorited=Value(
                     value=False,
                     output_field=models.BooleanField()
@@ -207,8 +286,19 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 is_in_shopping_cart=Value(
                     value=False,
                     output_field=models.BooleanField()
+                ),
+                is_subscribed=Value(
+                    value=False,
+                    output_field=models.BooleanField()
                 )
             ).select_related('author')
+        if self.action == 'trending':
+            ids = trending.top_ids()
+            queryset = queryset.filter(id__in=ids).order_by(Case(
+                *(When(id=pk, then=rank) for rank, pk in enumerate(ids)),
+                output_field=models.IntegerField(),
+            )) if ids else queryset.none()
+        return queryset
 
     def get_serializer_class(self):
         if self.request.method in SAFE_METHODS:
@@ -218,29 +308,98 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    def get_batch_ids(self):
+        ids = []
+        for value in self.request.query_params.get('ids', '').split(','):
+            if not value.strip():
+                continue
+            try:
+                ids.append(int(value))
+            except ValueError:
+                raise ValidationError(
+                    {'ids': f'Некорректный id рецепта: {value}.'}
+                )
+        ids = list(dict.fromkeys(ids))
+        if len(ids) > settings.RECIPE_BATCH_MAX_SIZE:
+            raise ValidationError({'ids': (
+                'Можно запросить не больше '
+                f'{settings.RECIPE_BATCH_MAX_SIZE} рецептов.'
+            )})
+        return ids
+
+    @action(
+        detail=False,
+        methods=['get'],
+    )
+    def batch(self, request):
+        """Recipes from ``?ids=3,1,2`` in the given order, unknown ids
+        are skipped. The page is loaded like a list page: one query for
+        the rows and one per relation."""
+        ids = self.get_batch_ids()
+        rows = {
+            row['id']: row
+            for row in self.as_rows(self.get_queryset().filter(id__in=ids))
+        }
+        rows = [rows[pk] for pk in ids if pk in rows]
+        return self.conditional_response(
+            self.get_etag(rows, request.get_full_path()),
+            None,
+            lambda: Response(self.get_serializer(rows, many=True).data),
+        )
+
     @action(
         detail=False,
         methods=['get'],
     )
+    def trending(self, request):
+        """Most favorited and carted recipes of late, best first. Takes
+        the same filters as the list."""
+        return self.list(request)
+
+    def merge_units(self, shopping_cart):
+        """Add up amounts of one ingredient in compatible units.
+
+        Amounts in a single unit are kept as they are, mixed ones are
+        converted to the base unit.
+        """
+        units = MeasurementUnit.objects.in_bulk()
+        totals = {}
+        for row in shopping_cart:
+            unit = units[row['ingredient__measurement_unit']]
+            base = units.get(unit.base_id, unit)
+            totals.setdefault(
+                (row['ingredient__name'], base), []
+            ).append((unit, row['amount']))
+        for (name, base), amounts in totals.items():
+            if len(amounts) == 1:
+                unit, amount = amounts[0]
+                yield name, amount, unit
+            else:
+                yield name, sum(
+                    amount * (unit.factor if unit.base_id else 1)
+                    for unit, amount in amounts
+                ), base
+
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=[permissions.IsAuthenticated],
+    )
     def download_shopping_cart(self, request):
-        shopping_cart = request.user.shopping_list.recipe.values(
-            'ingredients__name',
-            'ingredients__measurement_unit'
-        ).annotate(amount=Sum('recipe__amount')).order_by('ingredients__name')
+        shopping_cart = RecipeIngredient.objects.filter(
+            recipe__shopping_cart__user=request.user
+        ).values(
+            'ingredient__name',
+            'ingredient__measurement_unit'
+        ).annotate(amount=Sum('amount')).order_by('ingredient__name')
         content = 'Cписок покупок пуст.'
         if shopping_cart:
             content = ''
-            for index, recipe_ingredient in enumerate(
-                    shopping_cart,
+            for index, (name, amount, unit) in enumerate(
+                    self.merge_units(shopping_cart),
                     start=1
             ):
-                content += (
-                    f'{index}.) '
-                    f'{recipe_ingredient["ingredients__name"]} '
-                    f'{recipe_ingredient["amount"]} '
-                    f'{recipe_ingredient["ingredients__measurement_unit"]}'
-                    f'\n'
-                )
+                content += f'{index}.) {name} {amount} {unit}\n'
         return HttpResponse(
             content,
             content_type='text/plain'
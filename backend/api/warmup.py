@@ -0,0 +1,163 @@
+import inspect
+import logging
+import os
+import threading
+import time
+from importlib import import_module
+from urllib.parse import quote, urlsplit
+from wsgiref.util import setup_testing_defaults
+
+from django.conf import settings
+from django.contrib.auth.hashers import get_hashers
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import DatabaseError, connections
+from django.urls import get_resolver
+from django.utils.module_loading import import_string
+from rest_framework import permissions, serializers, status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class WarmupState:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.steps = {}
+        self.errors = {}
+        self.started = None
+        self.finished = None
+
+    @property
+    def ready(self):
+        return self.finished is not None or not settings.WARMUP['ENABLED']
+
+    def __call__(self):
+        with self.lock:
+            return {
+                'ready': self.ready,
+                'seconds': (
+                    round(self.finished - self.started, 3)
+                    if self.finished is not None else None
+                ),
+                'steps': dict(self.steps),
+                'errors': dict(self.errors),
+            }
+
+
+state = WarmupState()
+metrics.register('warmup', state)
+
+
+def run():
+    """Run ``WARMUP['STEPS']`` once per process.
+
+    Called after the application is loaded and before the worker takes
+    requests. A failing step is logged and skipped, warm-up only saves
+    latency and never keeps a worker from starting.
+    """
+    with state.lock:
+        if state.started is not None or not settings.WARMUP['ENABLED']:
+            return
+        state.started = time.perf_counter()
+    for path in settings.WARMUP['STEPS']:
+        started = time.perf_counter()
+        try:
+            import_string(path)()
+        except Exception as exc:
+            logger.warning('Warm-up step %s failed: %r', path, exc)
+            with state.lock:
+                state.errors[path] = repr(exc)
+        with state.lock:
+            state.steps[path] = round(time.perf_counter() - started, 3)
+    with state.lock:
+        state.finished = time.perf_counter()
+    logger.info(
+        'Worker %s warmed up in %.3fs',
+        os.getpid(), state.finished - state.started,
+    )
+
+
+def connect_databases():
+    for connection in connections.all():
+        connection.ensure_connection()
+
+
+def import_modules():
+    """Modules the code imports on first use, e.g. Pillow for uploads."""
+    for name in settings.WARMUP['IMPORTS']:
+        import_module(name)
+
+
+def load_url_resolver():
+    get_resolver().url_patterns
+    get_resolver().reverse_dict
+
+
+def load_password_hashers():
+    from .hashers import hash_pool
+    get_hashers()
+    hash_pool.start()
+
+
+def load_serializers():
+    """Build the fields of every serializer in ``api.serializers``."""
+    module = import_module('api.serializers')
+    for serializer_class in vars(module).values():
+        if (
+            inspect.isclass(serializer_class)
+            and issubclass(serializer_class, serializers.Serializer)
+            and serializer_class.__module__ == module.__name__
+        ):
+            serializer_class(context={}).fields
+
+
+def request_paths():
+    """GET ``WARMUP['PATHS']`` through the whole stack, filling the
+    shared and in-process caches along the way."""
+    handler = WSGIHandler()
+    for path in settings.WARMUP['PATHS']:
+        url = urlsplit(path)
+        environ = {
+            'PATH_INFO': url.path,
+            'QUERY_STRING': quote(url.query, safe='=&%'),
+            'HTTP_ACCEPT': 'application/json',
+        }
+        setup_testing_defaults(environ)
+        statuses = []
+        response = handler(
+            environ,
+            lambda code, headers, exc_info=None: statuses.append(code),
+        )
+        try:
+            for _ in response:
+                pass
+        finally:
+            response.close()
+        if not statuses[0].startswith('200'):
+            raise RuntimeError(f'{path}: {statuses[0]}')
+
+
+class HealthView(APIView):
+    """Readiness of the worker that handles the request: warmed up and
+    able to reach the database."""
+    authentication_classes = ()
+    permission_classes = (permissions.AllowAny,)
+
+    def get(self, request):
+        if not state.ready:
+            return Response(
+                {'status': 'starting', 'pid': os.getpid()},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            )
+        try:
+            connections['default'].ensure_connection()
+        except DatabaseError:
+            return Response(
+                {'status': 'database unavailable', 'pid': os.getpid()},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            )
+        return Response({'status': 'ready', 'pid': os.getpid()})
@@ -0,0 +1,19 @@
+"""
+ASGI config for backend project.
+
+Hot read endpoints are served by ``api.asgi.AsyncReadApplication``,
+everything else by the WSGI application. Run it with
+``gunicorn backend.asgi:application -k uvicorn.workers.UvicornWorker``.
+"""
+
+import os
+
+from django.core.wsgi import get_wsgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+
+wsgi_application = get_wsgi_application()
+
+from api.asgi import AsyncReadApplication  # noqa: E402
+
+application = AsyncReadApplication(wsgi_application)
@@ -43,7 +43,7 @@ INSTALLED_APPS = [
     'djoser',
     'api.apps.ApiConfig',
     'user',
-    'recipe',
+    'recipe.apps.RecipeConfig',
 ]
 
 MIDDLEWARE = [
@@ -54,6 +54,9 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.querylog.QueryLogMiddleware',
+    'api.throttling.ConcurrencyLimitMiddleware',
+    'api.profiling.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'backend.urls'
@@ -82,7 +85,7 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': os.getenv('DB_ENGINE', default='django.db.backends.postgresql'),
+        'ENGINE': os.getenv('DB_ENGINE', default='api.db.postgresql'),
         'NAME': os.getenv('DB_NAME', default='postgres'),
         'USER': os.getenv('POSTGRES_USER', default='postgres'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', default='153794862'),
@@ -91,6 +94,28 @@ DATABASES = {
     }
 }
 
+# Per-process connection pool of the api.db.postgresql engine,
+# see api/db/pool.py
+DATABASE_POOL = {
+    # at least gunicorn --threads plus ASYNC_DB_THREADS under ASGI
+    'SIZE': int(os.getenv('DB_POOL_SIZE', default=8)),
+    'TIMEOUT': int(os.getenv('DB_POOL_TIMEOUT', default=10)),
+    'MAX_AGE': 30 * 60,
+    # idle connections older than this are pinged on checkout
+    'CHECK_AFTER': 1,
+}
+
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', default=''),
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -110,6 +135,22 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+PASSWORD_HASHERS = [
+    'api.hashers.PooledPBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+]
+
+# Password hashing pool, see api/hashers.py
+PASSWORD_HASHING = {
+    'ITERATIONS': int(os.getenv('PASSWORD_HASH_ITERATIONS', default=150000)),
+    # 0 hashes in the request thread
+    'WORKERS': int(os.getenv('PASSWORD_HASH_WORKERS', default=1)),
+    'QUEUE': int(os.getenv('PASSWORD_HASH_QUEUE', default=4)),
+    'TIMEOUT': 5,
+}
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/2.2/topics/i18n/
@@ -143,12 +184,145 @@ REST_FRAMEWORK = {
         'rest_framework.authentication.TokenAuthentication',
 
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend',
         'rest_framework.filters.SearchFilter',
     ],
+    'DEFAULT_THROTTLE_CLASSES': [
+        'api.throttling.TokenBucketThrottle',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'api.pagination.LimitPageNumberPagination',
     'PAGE_SIZE': 6,
+    # nginx in front sets X-Forwarded-For
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES', default=1)),
 }
 
 AUTH_USER_MODEL = 'user.User'
+
+# Request profiling, see api/profiling.py
+PROFILING_DIR = os.getenv(
+    'PROFILING_DIR', default=os.path.join(BASE_DIR, 'profiles')
+)
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', default=0))
+# cprofile writes .prof files, sampler writes folded stacks for flamegraphs
+PROFILING_MODE = os.getenv('PROFILING_MODE', default='cprofile')
+PROFILING_SAMPLE_INTERVAL = 0.005
+PROFILING_TOKEN_MAX_AGE = 60 * 60
+
+# SQL fingerprint statistics, see api/querylog.py
+QUERY_STATS_DIR = os.getenv(
+    'QUERY_STATS_DIR', default=os.path.join(BASE_DIR, 'query_stats')
+)
+QUERY_STATS_FLUSH_INTERVAL = 10
+SLOW_QUERY_THRESHOLD = float(os.getenv('SLOW_QUERY_THRESHOLD', default=0.5))
+
+# Background jobs, see api/jobs.py
+JOBS_LOCK_TIMEOUT = 10 * 60
+JOBS_HEARTBEAT_INTERVAL = 60
+JOBS_RETRY_BACKOFF = 5
+JOBS_RETRY_BACKOFF_MAX = 60 * 60
+
+# Deleting a user with more recipes moves to a background job,
+# see user/deletion.py
+CASCADE_DELETE = {
+    'SYNC_LIMIT': 50,
+    'CHUNK_SIZE': 500,
+}
+
+# Rendered recipe cards: in-process LRU in front of the shared cache
+RECIPE_CARD_CACHE = {
+    'ALIAS': 'default',
+    'LOCAL_MAXSIZE': int(os.getenv('RECIPE_CARD_CACHE_SIZE', default=1000)),
+    'TIMEOUT': 60 * 60,
+}
+
+# Cross-worker invalidation bus, see api/invalidation.py
+INVALIDATION = {
+    'ENABLED': os.getenv('INVALIDATION_ENABLED', default='1') == '1',
+    'POLL_INTERVAL': float(os.getenv('INVALIDATION_POLL_INTERVAL', default=0.5)),
+    # how long a missing version may still be committing
+    'GAP_TIMEOUT': 1,
+    # more keys of a topic in one transaction make one event for the topic
+    'MAX_KEYS': 100,
+    'BATCH_SIZE': 1000,
+    'RETENTION': 60 * 60,
+    'PRUNE_INTERVAL': 10 * 60,
+}
+
+# Page counts, see api/pagination.py
+PAGINATION_COUNT_CACHE = {
+    'ALIAS': 'default',
+    'TIMEOUT': int(os.getenv('PAGINATION_COUNT_TIMEOUT', default=10)),
+    # unfiltered lists over bigger tables get the planner estimate
+    'ESTIMATE_THRESHOLD': 10000,
+    # invalidation topics changing the counts of lists of a model
+    'TOPICS': {
+        'recipe.Recipe': ('recipe', 'tag', 'favorite', 'shopping_cart'),
+        'user.User': ('user',),
+        'user.Subscribe': ('subscribe',),
+    },
+}
+
+# Trending recipes, see recipe/trending.py
+TRENDING = {
+    'FAVORITE_WEIGHT': 1.0,
+    'SHOPPING_CART_WEIGHT': 2.0,
+    # seconds for a score to lose half its weight
+    'HALF_LIFE': 3 * 24 * 60 * 60,
+    'DECAY_INTERVAL': 60 * 60,
+    # decayed scores below this are dropped
+    'MIN_SCORE': 0.01,
+    'TOP_K': 200,
+    'CACHE_TIMEOUT': 60,
+}
+
+# Per-client token buckets and in-flight limits, see api/throttling.py
+THROTTLING = {
+    'ENABLED': os.getenv('THROTTLING_ENABLED', default='1') == '1',
+    # shared store that caps a client across workers, None for none
+    'ALIAS': 'default',
+    # tokens per second and bucket size per client
+    'RATE': float(os.getenv('THROTTLE_RATE', default=10)),
+    'BURST': int(os.getenv('THROTTLE_BURST', default=100)),
+    'LOCAL_MAXSIZE': 10000,
+    # tokens a request takes by URL name, 1 for the rest
+    'COSTS': {
+        'recipes-download-shopping-cart': 20,
+        'users-subscriptions': 5,
+        'ingredients-list': 10,
+    },
+    # lists narrowed by these parameters cost 1
+    'SEARCHES': {'ingredients-list': 'name'},
+    # requests costing more than 1 token in flight per worker process
+    'MAX_IN_FLIGHT': int(os.getenv('THROTTLE_MAX_IN_FLIGHT', default=2)),
+    'MAX_IN_FLIGHT_PER_CLIENT': 1,
+    'RETRY_AFTER': 1,
+}
+
+# Upper bound for ids in one /api/recipes/batch/ request
+RECIPE_BATCH_MAX_SIZE = 100
+
+# ORM threads per worker for the async read endpoints, see api/asgi.py
+ASYNC_READS = {
+    'DB_THREADS': int(os.getenv('ASYNC_DB_THREADS', default=8)),
+}
+
+# Per-worker warm-up before the first request, see api/warmup.py
+WARMUP = {
+    'ENABLED': os.getenv('WARMUP_ENABLED', default='1') == '1',
+    'STEPS': (
+        'api.warmup.import_modules',
+        'api.warmup.load_url_resolver',
+        'api.warmup.load_password_hashers',
+        'api.warmup.load_serializers',
+        'api.warmup.request_paths',
+        'api.warmup.connect_databases',
+    ),
+    # modules the code imports on first use
+    'IMPORTS': ('PIL.Image',),
+    'PATHS': ('/api/tags/', '/api/recipes/', '/api/ingredients/?name=а'),
+}
@@ -5,11 +5,17 @@ import psycopg2
 con = psycopg2.connect(
     "dbname=postgres user=postgres password=153794862 host=db")
 cur = con.cursor()
+unit_sql = """
+INSERT INTO recipe_measurementunit (name, factor) VALUES(%s, 1)
+ON CONFLICT (name) DO NOTHING
+"""
 insert_sql = """
-INSERT INTO recipe_ingredient (name, measurement_unit) VALUES(%s, %s)
+INSERT INTO recipe_ingredient (name, measurement_unit_id)
+SELECT %s, id FROM recipe_measurementunit WHERE name = %s
 """
 with open('data/ingredients.json', 'r', encoding='utf-8') as json_file:
     record_dict = json.load(json_file)
     for record in record_dict:
+        cur.execute(unit_sql, [record['measurement_unit']])
         cur.execute(insert_sql, [record['name'], record['measurement_unit']])
     con.commit()
@@ -0,0 +1,6 @@
+def post_worker_init(worker):
+    """Warm the worker up before it accepts its first request and start
+    applying cache invalidations."""
+    from api import invalidation, warmup
+    warmup.run()
+    invalidation.listener.start()
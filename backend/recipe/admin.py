@@ -1,11 +1,64 @@
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
+from django.db.models import (Func, IntegerField, OuterRef, Prefetch, Q,
+                              Subquery)
 
-from .models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                     ShoppingCart, Tag)
+from .models import (Favorite, Ingredient, MeasurementUnit, Recipe,
+                     RecipeIngredient, ShoppingCart, Tag)
 
 EMPTY_MSG = '-пусто-'
 
 
+class InputFilter(admin.SimpleListFilter):
+    """List filter with a text input instead of a list of all values."""
+    template = 'admin/input_filter.html'
+
+    def lookups(self, request, model_admin):
+        return ((None, None),)
+
+    def choices(self, changelist):
+        all_choice = next(super().choices(changelist))
+        all_choice['query_parts'] = (
+            (name, value)
+            for name, value in changelist.get_filters_params().items()
+            if name != self.parameter_name
+        )
+        yield all_choice
+
+
+class AuthorFilter(InputFilter):
+    title = 'автору (email или username)'
+    parameter_name = 'author'
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(
+                Q(author__email=self.value())
+                | Q(author__username=self.value())
+            )
+        return queryset
+
+
+class RecipeChangeList(ChangeList):
+    """Counts favorites for the rows of the page only, with a correlated
+    subquery, so the paginator counts plain recipe rows and nothing is
+    grouped. Sorting by the count would compute it for every recipe, so
+    the column is not sortable."""
+
+    def get_results(self, request):
+        super().get_results(request)
+        self.result_list = self.result_list.annotate(
+            favorite_count=Subquery(
+                Favorite.objects.filter(
+                    recipe=OuterRef('pk')
+                ).order_by().annotate(
+                    count=Func('id', function='COUNT')
+                ).values('count'),
+                output_field=IntegerField(),
+            )
+        )
+
+
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
     list_display = (
@@ -14,13 +67,26 @@ class TagAdmin(admin.ModelAdmin):
     empty_value_display = EMPTY_MSG
 
 
+@admin.register(MeasurementUnit)
+class MeasurementUnitAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'base', 'factor',)
+    list_select_related = ('base',)
+    search_fields = ('^name',)
+    empty_value_display = EMPTY_MSG
+
+
 @admin.register(Ingredient)
 class IngredientAdmin(admin.ModelAdmin):
     list_display = ('id', 'name', 'measurement_unit',)
-    search_fields = ('name', 'measurement_unit',)
-    list_filter = ('name', 'measurement_unit',)
+    search_fields = ('^name',)
+    list_filter = ('measurement_unit',)
     empty_value_display = EMPTY_MSG
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related(
+            'measurement_unit'
+        )
+
 
 class RecipeIngredientAdmin(admin.TabularInline):
     model = RecipeIngredient
@@ -33,12 +99,30 @@ class RecipeAdmin(admin.ModelAdmin):
         'id', 'author', 'name', 'text',
         'cooking_time', 'get_tags', 'get_ingredients',
         'pub_date', 'get_favorite_count')
-    search_fields = (
-        'name', 'cooking_time',
-        'author__email', 'ingredients__name')
-    list_filter = ('author', 'name', 'tags',)
+    # authors are looked up by AuthorFilter, so the search stays a single
+    # prefix match on the UPPER(name) index
+    search_fields = ('^name',)
+    list_filter = (AuthorFilter, 'tags',)
+    autocomplete_fields = ('author',)
     inlines = (RecipeIngredientAdmin,)
     empty_value_display = EMPTY_MSG
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related(
+            'author'
+        ).prefetch_related(
+            'tags',
+            Prefetch(
+                'recipe',
+                queryset=RecipeIngredient.objects.select_related(
+                    'ingredient__measurement_unit'
+                )
+            ),
+        )
+
+    def get_changelist(self, request, **kwargs):
+        return RecipeChangeList
 
     def get_tags(self, obj):
         list_ = [_.name for _ in obj.tags.all()]
@@ -46,15 +130,17 @@ class RecipeAdmin(admin.ModelAdmin):
 
     def get_ingredients(self, obj):
         return '\n '.join([
-            f'{item["ingredient__name"]} - {item["amount"]}'
-            f' {item["ingredient__measurement_unit"]}.'
-            for item in obj.recipe.values(
-                'ingredient__name',
-                'amount', 'ingredient__measurement_unit')])
+            f'{item.ingredient.name} - {item.amount}'
+            f' {item.ingredient.measurement_unit}.'
+            for item in obj.recipe.all()])
 
     def get_favorite_count(self, obj):
-        return obj.favorite_recipe.count()
+        return obj.favorite_count
 
 
-admin.site.register(Favorite)
-admin.site.register(ShoppingCart)
+@admin.register(Favorite, ShoppingCart)
+class UserRecipeAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'recipe')
+    list_select_related = ('user', 'recipe')
+    autocomplete_fields = ('user', 'recipe')
+    show_full_result_count = False
@@ -0,0 +1,36 @@
+# Generated by Django 2.2.16 on 2026-10-19 10:13
+
+from django.db import migrations
+
+BATCH_SIZE = 1000
+
+
+def copy_relations(apps, old_name, new_name):
+    old_model = apps.get_model('recipe', old_name)
+    new_model = apps.get_model('recipe', new_name)
+    rows = old_model.recipe.through.objects.values_list(
+        f'{old_name.lower()}__user_id', 'recipe_id'
+    ).iterator()
+    batch = []
+    for user_id, recipe_id in rows:
+        batch.append(new_model(user_id=user_id, recipe_id=recipe_id))
+        if len(batch) >= BATCH_SIZE:
+            new_model.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    new_model.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def forwards(apps, schema_editor):
+    copy_relations(apps, 'Favorite', 'FavoriteRecipe')
+    copy_relations(apps, 'ShoppingCart', 'ShoppingCartRecipe')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0006_auto_20261019_1012'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, migrations.RunPython.noop),
+    ]
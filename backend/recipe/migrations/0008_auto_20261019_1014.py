@@ -0,0 +1,29 @@
+# Generated by Django 2.2.16 on 2026-10-19 10:14
+
+from django.conf import settings
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipe', '0007_auto_20261019_1013'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='Favorite',
+        ),
+        migrations.DeleteModel(
+            name='ShoppingCart',
+        ),
+        migrations.RenameModel(
+            old_name='FavoriteRecipe',
+            new_name='Favorite',
+        ),
+        migrations.RenameModel(
+            old_name='ShoppingCartRecipe',
+            new_name='ShoppingCart',
+        ),
+    ]
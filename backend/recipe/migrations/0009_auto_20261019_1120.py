@@ -0,0 +1,29 @@
+# Generated by Django 2.2.16 on 2026-10-19 11:20
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def remove_duplicates(apps, schema_editor):
+    RecipeIngredient = apps.get_model('recipe', 'RecipeIngredient')
+    duplicates = RecipeIngredient.objects.values(
+        'recipe', 'ingredient'
+    ).annotate(
+        first_id=Min('id'), total=Count('id')
+    ).filter(total__gt=1)
+    for duplicate in duplicates.iterator():
+        RecipeIngredient.objects.filter(
+            recipe=duplicate['recipe'],
+            ingredient=duplicate['ingredient'],
+        ).exclude(id=duplicate['first_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0008_auto_20261019_1014'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+    ]
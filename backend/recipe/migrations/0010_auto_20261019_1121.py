@@ -0,0 +1,40 @@
+# Generated by Django 2.2.16 on 2026-10-19 11:21
+
+from django.db import migrations, models
+
+# Matches the UPPER("name"::text) LIKE 'X%' that istartswith compiles to.
+INGREDIENT_NAME_INDEX = (
+    'CREATE INDEX recipe_ingredient_name_upper_like '
+    'ON recipe_ingredient (UPPER(name::text) text_pattern_ops)'
+)
+
+
+def create_name_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(INGREDIENT_NAME_INDEX)
+
+
+def drop_name_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'DROP INDEX IF EXISTS recipe_ingredient_name_upper_like'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0009_auto_20261019_1120'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-pub_date'], name='recipe_pub_date_desc_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='recipeingredient',
+            constraint=models.UniqueConstraint(fields=('recipe', 'ingredient'), name='unique_recipe_ingredient'),
+        ),
+        migrations.RunPython(create_name_index, drop_name_index),
+    ]
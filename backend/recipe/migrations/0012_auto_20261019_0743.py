@@ -0,0 +1,56 @@
+# Generated by Django 2.2.16 on 2026-10-19 07:43
+
+from collections import Counter
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def seed_scores(apps, schema_editor):
+    """Start from undecayed totals, the decay job ages them from here."""
+    RecipeScore = apps.get_model('recipe', 'RecipeScore')
+    scores = Counter()
+    for model, weight in (
+        ('Favorite', settings.TRENDING['FAVORITE_WEIGHT']),
+        ('ShoppingCart', settings.TRENDING['SHOPPING_CART_WEIGHT']),
+    ):
+        counts = apps.get_model('recipe', model).objects.values(
+            'recipe_id'
+        ).annotate(count=Count('id')).values_list('recipe_id', 'count')
+        for recipe_id, count in counts:
+            scores[recipe_id] += count * weight
+    RecipeScore.objects.bulk_create(
+        (
+            RecipeScore(recipe_id=recipe_id, score=score)
+            for recipe_id, score in scores.items()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0011_recipe_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeScore',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='score', serialize=False, to='recipe.Recipe', verbose_name='Рецепт')),
+                ('score', models.FloatField(default=0, verbose_name='Популярность')),
+            ],
+            options={
+                'verbose_name': 'Популярность рецепта',
+                'verbose_name_plural': 'Популярность рецептов',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='recipescore',
+            index=models.Index(fields=['-score'], name='recipe_score_desc_idx'),
+        ),
+        migrations.RunPython(seed_scores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 2.2.16 on 2026-10-19 08:10
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0012_auto_20261019_0743'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MeasurementUnit',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='Название')),
+                ('factor', models.PositiveIntegerField(default=1, help_text='Сколько базовых единиц в одной этой.', validators=[django.core.validators.MinValueValidator(1)], verbose_name='Множитель')),
+                ('base', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='derived', to='recipe.MeasurementUnit', verbose_name='Базовая единица')),
+            ],
+            options={
+                'verbose_name': 'Единица измерения',
+                'verbose_name_plural': 'Единицы измерения',
+                'ordering': ('name',),
+            },
+        ),
+        migrations.AddField(
+            model_name='ingredient',
+            name='unit',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='recipe.MeasurementUnit'),
+        ),
+    ]
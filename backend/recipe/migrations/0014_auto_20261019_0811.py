@@ -0,0 +1,55 @@
+# Generated by Django 2.2.16 on 2026-10-19 08:11
+
+from django.db import migrations
+
+# name: (base unit, base units in one)
+CONVERSIONS = {
+    'кг': ('г', 1000),
+    'л': ('мл', 1000),
+    'стакан': ('мл', 250),
+    'ст. л.': ('мл', 15),
+    'ч. л.': ('мл', 5),
+}
+
+
+def forwards(apps, schema_editor):
+    Ingredient = apps.get_model('recipe', 'Ingredient')
+    MeasurementUnit = apps.get_model('recipe', 'MeasurementUnit')
+    names = set(Ingredient.objects.values_list(
+        'measurement_unit', flat=True
+    ).distinct())
+    names.update(CONVERSIONS)
+    names.update(base for base, _ in CONVERSIONS.values())
+    MeasurementUnit.objects.bulk_create(
+        MeasurementUnit(name=name) for name in sorted(names)
+    )
+    units = dict(MeasurementUnit.objects.values_list('name', 'id'))
+    for name, (base, factor) in CONVERSIONS.items():
+        if name in units:
+            MeasurementUnit.objects.filter(id=units[name]).update(
+                base_id=units[base], factor=factor
+            )
+    for name, unit_id in units.items():
+        Ingredient.objects.filter(measurement_unit=name).update(
+            unit_id=unit_id
+        )
+
+
+def backwards(apps, schema_editor):
+    Ingredient = apps.get_model('recipe', 'Ingredient')
+    MeasurementUnit = apps.get_model('recipe', 'MeasurementUnit')
+    for unit_id, name in MeasurementUnit.objects.values_list('id', 'name'):
+        Ingredient.objects.filter(unit_id=unit_id).update(
+            measurement_unit=name
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0013_auto_20261019_0810'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
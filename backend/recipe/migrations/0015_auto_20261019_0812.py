@@ -0,0 +1,34 @@
+# Generated by Django 2.2.16 on 2026-10-19 08:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0014_auto_20261019_0811'),
+    ]
+
+    operations = [
+        # lets the text column come back empty on rollback
+        migrations.AlterField(
+            model_name='ingredient',
+            name='measurement_unit',
+            field=models.CharField(default='', max_length=200),
+        ),
+        migrations.RemoveField(
+            model_name='ingredient',
+            name='measurement_unit',
+        ),
+        migrations.RenameField(
+            model_name='ingredient',
+            old_name='unit',
+            new_name='measurement_unit',
+        ),
+        migrations.AlterField(
+            model_name='ingredient',
+            name='measurement_unit',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='ingredients', to='recipe.MeasurementUnit', verbose_name='Единица измерения'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+from django.db import migrations
+
+# Matches the UPPER("name"::text) LIKE 'X%' of the admin ``^name`` search.
+RECIPE_NAME_INDEX = (
+    'CREATE INDEX recipe_recipe_name_upper_like '
+    'ON recipe_recipe (UPPER(name::text) text_pattern_ops)'
+)
+
+
+def create_name_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(RECIPE_NAME_INDEX)
+
+
+def drop_name_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'DROP INDEX IF EXISTS recipe_recipe_name_upper_like'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0015_auto_20261019_0812'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_name_index, drop_name_index),
+    ]
@@ -29,14 +29,49 @@ class Tag(models.Model):
         return self.name
 
 
+class MeasurementUnit(models.Model):
+    """Unit dictionary, amounts in ``factor`` units of ``base`` can be
+    added to amounts in the base unit."""
+    name = models.CharField(
+        'Название',
+        max_length=50,
+        unique=True,
+    )
+    base = models.ForeignKey(
+        'self',
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name='derived',
+        verbose_name='Базовая единица',
+    )
+    factor = models.PositiveIntegerField(
+        'Множитель',
+        default=1,
+        validators=[MinValueValidator(1), ],
+        help_text='Сколько базовых единиц в одной этой.',
+    )
+
+    class Meta:
+        verbose_name = 'Единица измерения'
+        verbose_name_plural = 'Единицы измерения'
+        ordering = ('name', )
+
+    def __str__(self):
+        return self.name
+
+
 class Ingredient(models.Model):
     name = models.CharField(
         max_length=200,
         verbose_name='ingredient name',
 
     )
-    measurement_unit = models.CharField(
-        max_length=200
+    measurement_unit = models.ForeignKey(
+        MeasurementUnit,
+        on_delete=models.PROTECT,
+        related_name='ingredients',
+        verbose_name='Единица измерения',
     )
 
     def __str__(self):
@@ -75,9 +110,19 @@ class Recipe(models.Model):
         'Дата публикации',
         auto_now_add=True
     )
+    updated_at = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True
+    )
 
     class Meta:
         ordering = ('-pub_date', )
+        indexes = (
+            models.Index(
+                fields=('-pub_date',),
+                name='recipe_pub_date_desc_idx',
+            ),
+        )
 
 
 class RecipeIngredient(models.Model):
@@ -95,30 +140,78 @@ class RecipeIngredient(models.Model):
         validators=[MinValueValidator(1), ]
     )
 
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(
+                fields=('recipe', 'ingredient'),
+                name='unique_recipe_ingredient',
+            ),
+        )
+
 
 class Favorite(models.Model):
-    user = models.OneToOneField(
+    user = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
-        related_name='favorite_recipe',
+        related_name='favorites',
         verbose_name='Пользователь'
     )
-    recipe = models.ManyToManyField(
+    recipe = models.ForeignKey(
         Recipe,
-        related_name='favorite_recipe',
+        on_delete=models.CASCADE,
+        related_name='favorites',
         verbose_name='Рецепт в избранном'
     )
 
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_favorite',
+            ),
+        )
+
 
 class ShoppingCart(models.Model):
-    user = models.OneToOneField(
+    user = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
-        related_name='shopping_list',
+        related_name='shopping_cart',
         verbose_name='Пользователь'
     )
-    recipe = models.ManyToManyField(
+    recipe = models.ForeignKey(
         Recipe,
-        related_name='shopping_list',
+        on_delete=models.CASCADE,
+        related_name='shopping_cart',
         verbose_name='В покупки'
     )
+
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_shopping_cart',
+            ),
+        )
+
+
+class RecipeScore(models.Model):
+    """Time-decayed popularity of a recipe, see ``recipe.trending``."""
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='score',
+        verbose_name='Рецепт'
+    )
+    score = models.FloatField('Популярность', default=0)
+
+    class Meta:
+        verbose_name = 'Популярность рецепта'
+        verbose_name_plural = 'Популярность рецептов'
+        indexes = (
+            models.Index(
+                fields=('-score',),
+                name='recipe_score_desc_idx',
+            ),
+        )
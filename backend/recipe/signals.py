@@ -0,0 +1,60 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_init, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Ingredient, MeasurementUnit, Recipe, Tag
+
+User = get_user_model()
+
+# Author fields that are part of the recipe representation.
+AUTHOR_FIELDS = {'email', 'username', 'first_name', 'last_name'}
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def touch_tag_recipes(sender, instance, **kwargs):
+    Recipe.objects.filter(tags=instance).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(pre_delete, sender=Ingredient)
+def touch_ingredient_recipes(sender, instance, **kwargs):
+    Recipe.objects.filter(
+        ingredients=instance
+    ).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=MeasurementUnit)
+@receiver(pre_delete, sender=MeasurementUnit)
+def touch_unit_recipes(sender, instance, **kwargs):
+    Recipe.objects.filter(
+        ingredients__measurement_unit=instance
+    ).update(updated_at=timezone.now())
+
+
+def author_values(instance):
+    # deferred fields are left out instead of being loaded
+    return {
+        field: instance.__dict__.get(field) for field in AUTHOR_FIELDS
+    }
+
+
+@receiver(post_init, sender=User)
+def remember_author_values(sender, instance, **kwargs):
+    instance._author_values = author_values(instance)
+
+
+@receiver(post_save, sender=User)
+def touch_author_recipes(sender, instance, created, update_fields,
+                         **kwargs):
+    """Touch the recipes of an author whose shown fields changed, saves
+    of the password or last_login leave them alone."""
+    values = author_values(instance)
+    changed = values != instance._author_values
+    instance._author_values = values
+    if created or not changed or (
+        update_fields and not AUTHOR_FIELDS & set(update_fields)
+    ):
+        return
+    Recipe.objects.filter(author=instance).update(updated_at=timezone.now())
@@ -0,0 +1,2019 @@
+import asyncio
+import base64
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from functools import partial
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
+
+from api import invalidation, jobs, profiling, querylog, throttling, warmup
+from api.asgi import AsyncReadApplication
+from api.cache import TwoTierCache
+from api.db import pool
+from api.fast_serializers import card_key_prefix, recipe_cards
+from api.models import Invalidation, Job
+from api.renderers import FastJSONRenderer
+from api.serializers import IngredientSerializer
+from api.urls import router
+from api.views import IngredientViewSet, RecipeViewSet, UserViewSet
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.wsgi import get_wsgi_application
+from django.db import DatabaseError, connection, connections, transaction
+from django.db.backends.sqlite3 import base as sqlite_base
+from django.test import (Client, RequestFactory, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.urls import get_resolver
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from user.models import Subscribe
+
+from . import trending
+from .models import (Favorite, Ingredient, MeasurementUnit, Recipe,
+                     RecipeIngredient, RecipeScore, ShoppingCart, Tag)
+
+User = get_user_model()
+
+
+class QueryPlanMixin:
+    """Checks that a queryset is answered from an index.
+
+    On PostgreSQL sequential scans are disabled for the check, so the
+    planner only falls back to one when no usable index exists - the
+    same plan it picks for large tables.
+    """
+
+    def assert_no_seq_scan(self, queryset):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            plan = queryset.explain()
+            self.assertNotIn('Seq Scan', plan, plan)
+            return
+        plan = queryset.explain()
+        for line in plan.splitlines():
+            if 'SCAN' in line:
+                self.assertIn('USING', line, plan)
+
+
+class RecipeQueryPlanTest(QueryPlanMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            email='cook@foodgram.ru', username='cook'
+        )
+        cls.tag = Tag.objects.create(
+            name='Завтрак', slug='breakfast', color='#E26C2D'
+        )
+        unit = MeasurementUnit.objects.get(name='г')
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {i}', measurement_unit=unit)
+            for i in range(50)
+        )
+        cls.ingredients = list(Ingredient.objects.all())
+        Recipe.objects.bulk_create(
+            Recipe(
+                name=f'Рецепт {i}', text='...', cooking_time=10,
+                image='static/recipe/image.png', author=cls.user,
+            )
+            for i in range(50)
+        )
+        recipes = list(Recipe.objects.all())
+        cls.recipe = recipes[0]
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredient)
+            for recipe, ingredient in zip(recipes, cls.ingredients)
+        )
+        Favorite.objects.create(user=cls.user, recipe=cls.recipe)
+        ShoppingCart.objects.create(user=cls.user, recipe=cls.recipe)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def test_recipe_list_ordering(self):
+        self.assert_no_seq_scan(Recipe.objects.all()[:6])
+
+    def test_recipe_ingredients(self):
+        self.assert_no_seq_scan(
+            RecipeIngredient.objects.filter(recipe=self.recipe)
+        )
+
+    def test_recipe_ingredient_pair(self):
+        self.assert_no_seq_scan(RecipeIngredient.objects.filter(
+            recipe=self.recipe, ingredient=self.ingredients[0]
+        ))
+
+    def test_favorite_flag(self):
+        self.assert_no_seq_scan(Favorite.objects.filter(
+            user=self.user, recipe=self.recipe
+        ))
+
+    def test_shopping_cart_flag(self):
+        self.assert_no_seq_scan(ShoppingCart.objects.filter(
+            user=self.user, recipe=self.recipe
+        ))
+
+    @skipUnless(
+        connection.vendor == 'postgresql',
+        'Функциональный индекс по UPPER(name) есть только в PostgreSQL.'
+    )
+    def test_ingredient_name_prefix(self):
+        self.assert_no_seq_scan(
+            Ingredient.objects.filter(name__istartswith='ингр')
+        )
+
+    @skipUnless(
+        connection.vendor == 'postgresql',
+        'Функциональный индекс по UPPER(name) есть только в PostgreSQL.'
+    )
+    def test_admin_recipe_search(self):
+        model_admin = admin.site._registry[Recipe]
+        request = RequestFactory().get('/admin/recipe/recipe/')
+        queryset, _ = model_admin.get_search_results(
+            request, Recipe.objects.all(), 'рецепт'
+        )
+        self.assert_no_seq_scan(queryset)
+
+
+class RecipeReadApiTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            email='cook@foodgram.ru', username='cook'
+        )
+        tag = Tag.objects.create(
+            name='Завтрак', slug='breakfast', color='#E26C2D'
+        )
+        ingredient = Ingredient.objects.create(
+            name='Соль',
+            measurement_unit=MeasurementUnit.objects.get(name='г'),
+        )
+        cls.recipe = Recipe.objects.create(
+            name='Рецепт', text='...', cooking_time=10,
+            image='static/recipe/image.png', author=cls.user,
+        )
+        cls.recipe.tags.add(tag)
+        RecipeIngredient.objects.create(
+            recipe=cls.recipe, ingredient=ingredient, amount=5
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_fields(self):
+        response = self.client.get(
+            '/api/recipes/', {'fields': 'id,name,tags'}
+        )
+        self.assertEqual(
+            set(response.json()['results'][0]), {'id', 'name', 'tags'}
+        )
+
+    def test_omit(self):
+        response = self.client.get(
+            f'/api/recipes/{self.recipe.id}/',
+            {'omit': 'text,ingredients,author'},
+        )
+        data = response.json()
+        self.assertNotIn('text', data)
+        self.assertNotIn('ingredients', data)
+        self.assertNotIn('author', data)
+        self.assertEqual(data['tags'][0]['slug'], 'breakfast')
+
+    def count_queries(self, params):
+        cache.clear()
+        recipe_cards.clear()
+        with CaptureQueriesContext(connection) as context:
+            self.client.get('/api/recipes/', params)
+        return len(context)
+
+    def test_dropped_relations_are_not_loaded(self):
+        self.assertEqual(
+            self.count_queries({}) - self.count_queries({'fields': 'id'}),
+            2,
+        )
+
+    def test_batch_keeps_order(self):
+        other = Recipe.objects.create(
+            name='Второй', text='...', cooking_time=5,
+            image='static/recipe/image.png', author=self.user,
+        )
+        response = self.client.get(
+            '/api/recipes/batch/',
+            {'ids': f'{other.id},0,{self.recipe.id}'},
+        )
+        self.assertEqual(
+            [recipe['id'] for recipe in response.json()],
+            [other.id, self.recipe.id],
+        )
+        detail = self.client.get(f'/api/recipes/{self.recipe.id}/')
+        self.assertEqual(response.json()[1], detail.json())
+
+    def test_batch_rejects_bad_ids(self):
+        response = self.client.get('/api/recipes/batch/', {'ids': '1,x'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_author_filter_does_not_load_author(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(
+                '/api/recipes/', {'author': self.user.id, 'fields': 'id'}
+            )
+        self.assertEqual(
+            [recipe['id'] for recipe in response.json()['results']],
+            [self.recipe.id],
+        )
+        self.assertFalse([
+            query for query in context.captured_queries
+            if query['sql'].startswith('SELECT')
+            and 'FROM "user_user"' in query['sql']
+        ])
+        response = self.client.get('/api/recipes/', {'author': 0})
+        self.assertEqual(response.json()['results'], [])
+        response = self.client.get('/api/recipes/', {'author': 'x'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_tags_filter(self):
+        response = self.client.get('/api/recipes/', {'tags': 'breakfast'})
+        self.assertEqual(len(response.json()['results']), 1)
+        response = self.client.get('/api/recipes/', {'tags': 'dinner'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ConditionalGetTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            email='cook@foodgram.ru', username='cook'
+        )
+        cls.tag = Tag.objects.create(
+            name='Завтрак', slug='breakfast', color='#E26C2D'
+        )
+        cls.ingredient = Ingredient.objects.create(
+            name='Соль',
+            measurement_unit=MeasurementUnit.objects.get(name='г'),
+        )
+        cls.recipe = Recipe.objects.create(
+            name='Рецепт', text='...', cooking_time=10,
+            image='static/recipe/image.png', author=cls.user,
+        )
+        cls.recipe.tags.add(cls.tag)
+        RecipeIngredient.objects.create(
+            recipe=cls.recipe, ingredient=cls.ingredient, amount=5
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.detail = f'/api/recipes/{self.recipe.id}/'
+
+    def etags(self):
+        return (
+            self.client.get('/api/recipes/')['ETag'],
+            self.client.get(self.detail)['ETag'],
+        )
+
+    def test_if_none_match(self):
+        for path in ('/api/recipes/', self.detail):
+            etag = self.client.get(path)['ETag']
+            response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response['ETag'], etag)
+            response = self.client.get(path, HTTP_IF_NONE_MATCH='"other"')
+            self.assertEqual(response.status_code, 200)
+
+    def test_if_modified_since(self):
+        client = APIClient()
+        response = client.get(self.detail)
+        last_modified = response['Last-Modified']
+        response = client.get(
+            self.detail, HTTP_IF_MODIFIED_SINCE=last_modified
+        )
+        self.assertEqual(response.status_code, 304)
+        Recipe.objects.filter(id=self.recipe.id).update(
+            updated_at=self.recipe.updated_at + timedelta(seconds=5)
+        )
+        response = client.get(
+            self.detail, HTTP_IF_MODIFIED_SINCE=last_modified
+        )
+        self.assertEqual(response.status_code, 200)
+        # per-user flags make Last-Modified useless for users
+        self.assertFalse(self.client.get(self.detail).has_header(
+            'Last-Modified'
+        ))
+
+    def test_etag_follows_changes(self):
+        edits = {
+            'recipe': lambda: self.client.patch(
+                self.detail, {'name': 'Другой'}, format='json'
+            ),
+            'tag': lambda: Tag.objects.get(id=self.tag.id).save(),
+            'ingredient': lambda: Ingredient.objects.get(
+                id=self.ingredient.id
+            ).save(),
+            'author': self.rename_author,
+        }
+        for name, edit in edits.items():
+            with self.subTest(name):
+                before = self.etags()
+                edit()
+                after = self.etags()
+                self.assertNotEqual(before[0], after[0])
+                self.assertNotEqual(before[1], after[1])
+
+    def rename_author(self):
+        user = User.objects.get(id=self.user.id)
+        user.first_name = 'Повар'
+        user.save()
+
+    @override_settings(PASSWORD_HASHING={
+        'ITERATIONS': 1000, 'WORKERS': 0, 'QUEUE': 0, 'TIMEOUT': 0,
+    })
+    def test_password_and_login_keep_etag(self):
+        before = self.etags()
+        user = User.objects.get(id=self.user.id)
+        user.set_password('password')
+        user.save()
+        user.last_login = timezone.now()
+        user.save()
+        self.assertEqual(self.etags(), before)
+
+
+class CountPaginationTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            email='reader@foodgram.ru', username='reader'
+        )
+        cls.author = User.objects.create(
+            email='cook@foodgram.ru', username='cook'
+        )
+
+    def setUp(self):
+        cache.clear()
+        recipe_cards.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_recipe(self, name):
+        return Recipe.objects.create(
+            name=name, text='...', cooking_time=10,
+            image='static/recipe/image.png', author=self.author,
+        )
+
+    def test_rows_past_cached_count(self):
+        first = self.create_recipe('Первый')
+        data = self.client.get('/api/recipes/', {'limit': 1}).json()
+        self.assertEqual((data['count'], data['next']), (1, None))
+        # no invalidation event is applied, the count stays cached
+        second = self.create_recipe('Второй')
+        data = self.client.get('/api/recipes/', {'limit': 1}).json()
+        self.assertEqual(
+            [recipe['id'] for recipe in data['results']], [second.id]
+        )
+        self.assertEqual(data['count'], 2)
+        self.assertIsNotNone(data['next'])
+        data = self.client.get(
+            '/api/recipes/', {'limit': 1, 'page': 2}
+        ).json()
+        self.assertEqual(
+            [recipe['id'] for recipe in data['results']], [first.id]
+        )
+        self.assertEqual((data['count'], data['next']), (2, None))
+        data = self.client.get(
+            '/api/recipes/', {'limit': 1, 'page': 3}
+        ).json()
+        self.assertEqual(data['results'], [])
+
+    def test_subscription_after_cached_count(self):
+        data = self.client.get('/api/users/subscriptions/').json()
+        self.assertEqual(data['count'], 0)
+        Subscribe.objects.create(follower=self.user, following=self.author)
+        data = self.client.get('/api/users/subscriptions/').json()
+        self.assertEqual(data['count'], 1)
+        self.assertEqual(
+            [user['id'] for user in data['results']], [self.author.id]
+        )
+
+
+class FastSerializerParityTest(TestCase):
+    """The ``.values()`` serializers answer exactly like the DRF ones."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            email='cook@foodgram.ru', username='cook',
+            first_name='Имя', last_name='Фамилия',
+        )
+        cls.authors = [
+            User.objects.create(
+                email=f'author{i}@foodgram.ru', username=f'author{i}',
+                first_name=f'Автор {i}', last_name='Фамилия',
+            )
+            for i in range(2)
+        ]
+        tags = [
+            Tag.objects.create(
+                name=f'Тег {i}', slug=f'tag-{i}', color=f'#E26C2{i}'
+            )
+            for i in range(2)
+        ]
+        unit = MeasurementUnit.objects.get(name='г')
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {i}', measurement_unit=unit
+            )
+            for i in range(3)
+        ]
+        cls.recipes = []
+        for number, author in enumerate(cls.authors * 2):
+            recipe = Recipe.objects.create(
+                name=f'Рецепт {number}', text='...', cooking_time=number + 1,
+                image='static/recipe/image.png', author=author,
+            )
+            recipe.tags.set(tags[:number % 2 + 1])
+            for ingredient in ingredients[number % 2:]:
+                RecipeIngredient.objects.create(
+                    recipe=recipe, ingredient=ingredient, amount=number + 1
+                )
+            trending.record(recipe.id, number + 1)
+            cls.recipes.append(recipe)
+        # flags are true for the first author and their recipes only
+        Subscribe.objects.create(follower=cls.user, following=cls.authors[0])
+        Favorite.objects.create(user=cls.user, recipe=cls.recipes[0])
+        ShoppingCart.objects.create(user=cls.user, recipe=cls.recipes[2])
+
+    def get(self, client, path, params, fast):
+        cache.clear()
+        recipe_cards.clear()
+        patches = [] if fast else [
+            mock.patch.object(view, 'fast_serializer_classes', {})
+            for view in (RecipeViewSet, UserViewSet)
+        ]
+        for patch in patches:
+            patch.start()
+        try:
+            response = client.get(path, params)
+        finally:
+            for patch in patches:
+                patch.stop()
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_same_output(self):
+        author = self.authors[0].id
+        anonymous = APIClient()
+        authenticated = APIClient()
+        authenticated.force_authenticate(self.user)
+        for client, path, params in (
+            (anonymous, '/api/recipes/', {}),
+            (authenticated, '/api/recipes/', {}),
+            (anonymous, f'/api/recipes/{self.recipes[0].id}/', {}),
+            (authenticated, f'/api/recipes/{self.recipes[0].id}/', {}),
+            (authenticated, f'/api/recipes/{self.recipes[1].id}/', {}),
+            (anonymous, '/api/recipes/trending/', {}),
+            (authenticated, '/api/recipes/trending/', {}),
+            (anonymous, '/api/users/', {}),
+            (authenticated, '/api/users/', {}),
+            (anonymous, f'/api/users/{author}/', {}),
+            (authenticated, f'/api/users/{author}/', {}),
+            (authenticated, '/api/users/subscriptions/', {}),
+            (
+                authenticated, '/api/users/subscriptions/',
+                {'recipes_limit': 1},
+            ),
+        ):
+            with self.subTest(
+                path, params=params, user=client is authenticated
+            ):
+                self.assertEqual(
+                    self.get(client, path, params, fast=True),
+                    self.get(client, path, params, fast=False),
+                )
+        # batch has no DRF counterpart, its items are detail responses
+        self.assertEqual(
+            self.get(authenticated, '/api/recipes/batch/', {
+                'ids': ','.join(str(recipe.id) for recipe in self.recipes),
+            }, fast=True),
+            [
+                self.get(
+                    authenticated, f'/api/recipes/{recipe.id}/', {},
+                    fast=False,
+                )
+                for recipe in self.recipes
+            ],
+        )
+
+    def test_flags_are_covered(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        recipes = self.get(client, '/api/recipes/', {}, fast=True)['results']
+        self.assertEqual(
+            {(recipe['is_favorited'], recipe['is_in_shopping_cart'],
+              recipe['author']['is_subscribed']) for recipe in recipes},
+            {(True, False, True), (False, True, True),
+             (False, False, False)},
+        )
+
+
+class FastJSONRendererTest(TestCase):
+
+    def assert_same(self, data, **context):
+        renderer_context = {'indent': context.get('indent')}
+        self.assertEqual(
+            FastJSONRenderer().render(
+                data, 'application/json', renderer_context
+            ),
+            JSONRenderer().render(
+                data, 'application/json', renderer_context
+            ),
+        )
+
+    def test_line_separators(self):
+        self.assert_same({'name': 'Суп\u2028с\u2029хлебом', 'id': 1})
+
+    def test_dates_and_decimals(self):
+        now = timezone.now()
+        self.assert_same({
+            'datetime': now,
+            'date': now.date(),
+            'time': now.time(),
+            'decimal': Decimal('1.50'),
+            'lazy': gettext_lazy('Имя'),
+            'nested': [{'id': 1, 'flag': True, 'empty': None}],
+        })
+
+    def test_indented(self):
+        self.assert_same({'name': 'Суп\u2028', 'tags': [1, 2]}, indent=4)
+
+    def test_streamed_list(self):
+        unit = MeasurementUnit.objects.get(name='г')
+        for i in range(5):
+            Ingredient.objects.create(
+                name=f'Ингредиент\u2028{i}', measurement_unit=unit
+            )
+        with mock.patch.object(IngredientViewSet, 'stream_chunk_size', 2):
+            response = APIClient().get('/api/ingredients/')
+        self.assertTrue(response.streaming)
+        self.assertEqual(
+            b''.join(response.streaming_content),
+            JSONRenderer().render(IngredientSerializer(
+                Ingredient.objects.select_related('measurement_unit'),
+                many=True,
+            ).data),
+        )
+        Ingredient.objects.all().delete()
+        response = APIClient().get('/api/ingredients/')
+        self.assertEqual(b''.join(response.streaming_content), b'[]')
+
+
+class TwoTierCacheTest(TestCase):
+
+    def test_hits_are_counted_across_threads(self):
+        cards = TwoTierCache(local_maxsize=10)
+        cards.set_many({'local': 1})
+
+        def read():
+            for _ in range(1000):
+                cards.get_many(['local', 'missing'])
+
+        threads = [threading.Thread(target=read) for _ in range(8)]
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        self.addCleanup(sys.setswitchinterval, interval)
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(cards.stats(), {
+            'local': 8000, 'shared': 0, 'miss': 8000,
+            'local_size': 1, 'local_maxsize': 10, 'hit_rate': 0.5,
+        })
+
+
+class RecipeAdminTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            email='admin@foodgram.ru', username='admin', password=None
+        )
+        recipes = [
+            Recipe.objects.create(
+                name=f'Рецепт {i}', text='...', cooking_time=10,
+                image='static/recipe/image.png', author=cls.admin,
+            )
+            for i in range(3)
+        ]
+        for i in range(2):
+            user = User.objects.create(
+                email=f'user{i}@foodgram.ru', username=f'user{i}'
+            )
+            for recipe in recipes[:2 - i]:
+                Favorite.objects.create(user=user, recipe=recipe)
+        cls.recipes = recipes
+
+    def test_changelist_counts_favorites_per_page(self):
+        client = Client()
+        client.force_login(self.admin)
+        with CaptureQueriesContext(connection) as context:
+            response = client.get('/admin/recipe/recipe/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            {
+                recipe.id: recipe.favorite_count
+                for recipe in response.context['cl'].result_list
+            },
+            {
+                self.recipes[0].id: 2,
+                self.recipes[1].id: 1,
+                self.recipes[2].id: 0,
+            },
+        )
+        recipe_queries = [
+            query['sql'] for query in context.captured_queries
+            if 'FROM "recipe_recipe"' in query['sql']
+        ]
+        self.assertTrue(recipe_queries)
+        for sql in recipe_queries:
+            self.assertNotIn('GROUP BY', sql)
+
+
+@override_settings(JOBS_RETRY_BACKOFF=5, JOBS_RETRY_BACKOFF_MAX=60)
+class JobQueueTest(TestCase):
+
+    def setUp(self):
+        self.calls = []
+        registry = {
+            name: jobs.JobSpec(
+                partial(self.run_job, name), lane, 2, concurrency, None
+            )
+            for name, lane, concurrency in (
+                ('plain', Job.LANE_DEFAULT, None),
+                ('urgent', Job.LANE_HIGH, None),
+                ('single', Job.LANE_DEFAULT, 1),
+            )
+        }
+        patcher = mock.patch.object(jobs, 'registry', registry)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.worker = jobs.Worker(
+            [Job.LANE_HIGH, Job.LANE_DEFAULT, Job.LANE_LOW]
+        )
+
+    def run_job(self, name, fail=False):
+        self.calls.append(name)
+        if fail:
+            raise ValueError('fail')
+
+    def run_next(self):
+        claimed = self.worker.claim()
+        if claimed is not None:
+            self.worker.execute(claimed)
+            claimed.refresh_from_db()
+        return claimed
+
+    def test_idempotency_key(self):
+        first = jobs.enqueue('plain', key='plain:1')
+        self.assertEqual(jobs.enqueue('plain', key='plain:1'), first)
+        jobs.enqueue('plain')
+        self.assertEqual(Job.objects.count(), 2)
+
+    def test_lanes_and_priority(self):
+        low = jobs.enqueue('plain', lane=Job.LANE_LOW)
+        default = jobs.enqueue('plain')
+        urgent = jobs.enqueue('urgent')
+        important = jobs.enqueue('plain', priority=10)
+        later = jobs.enqueue('urgent', delay=timedelta(hours=1))
+        self.assertEqual(
+            [self.run_next().id for _ in range(4)],
+            [urgent.id, important.id, default.id, low.id],
+        )
+        self.assertIsNone(self.run_next())
+        later.refresh_from_db()
+        self.assertEqual(later.status, Job.QUEUED)
+
+    def test_retries_with_backoff(self):
+        queued = jobs.enqueue('plain', {'fail': True})
+        started = timezone.now()
+        failed = self.run_next()
+        self.assertEqual(
+            (failed.status, failed.attempts), (Job.QUEUED, 1)
+        )
+        self.assertIn('ValueError', failed.last_error)
+        self.assertGreaterEqual(
+            failed.run_at, started + timedelta(seconds=5)
+        )
+        # due again, the second attempt is the last one
+        Job.objects.filter(id=queued.id).update(run_at=timezone.now())
+        failed = self.run_next()
+        self.assertEqual((failed.status, failed.attempts), (Job.FAILED, 2))
+        self.assertEqual(self.calls, ['plain', 'plain'])
+        for attempts, delay in ((1, 5), (2, 10), (3, 20), (10, 60)):
+            self.assertGreaterEqual(
+                jobs.backoff(attempts).total_seconds(), delay
+            )
+            self.assertLessEqual(
+                jobs.backoff(attempts).total_seconds(), delay * 1.1
+            )
+
+    def test_concurrency_cap(self):
+        first = jobs.enqueue('single')
+        second = jobs.enqueue('single')
+        plain = jobs.enqueue('plain')
+        self.assertEqual(self.worker.claim().id, first.id)
+        # the other single job waits while the first one runs
+        self.assertEqual(self.worker.claim().id, plain.id)
+        self.assertIsNone(self.worker.claim())
+        # the UPDATE checks the cap itself, not only the candidate scan
+        self.assertFalse(self.worker.claim_one(second.id, 'single'))
+        Job.objects.filter(id=first.id).update(status=Job.DONE)
+        self.assertTrue(self.worker.claim_one(second.id, 'single'))
+
+    @override_settings(JOBS_LOCK_TIMEOUT=60)
+    def test_stale_jobs_are_requeued(self):
+        dead = jobs.enqueue('plain')
+        alive = jobs.enqueue('plain')
+        self.worker.claim()
+        Job.objects.filter(id=alive.id).update(
+            status=Job.RUNNING, locked_by='other:1'
+        )
+        Job.objects.update(locked_at=timezone.now() - timedelta(hours=1))
+        # the heartbeat of this worker keeps its own job locked
+        self.assertEqual(self.worker.touch_running(), 1)
+        self.worker.requeue_stale()
+        dead.refresh_from_db()
+        alive.refresh_from_db()
+        self.assertEqual(dead.status, Job.RUNNING)
+        self.assertEqual(
+            (alive.status, alive.locked_by), (Job.QUEUED, '')
+        )
+
+    @override_settings(JOBS_LOCK_TIMEOUT=60)
+    def test_stale_jobs_use_up_attempts(self):
+        used_up = jobs.enqueue('plain')
+        left = jobs.enqueue('plain')
+        Job.objects.update(
+            status=Job.RUNNING, locked_by='other:1',
+            locked_at=timezone.now() - timedelta(hours=1), attempts=1,
+        )
+        Job.objects.filter(id=used_up.id).update(attempts=2)
+        started = timezone.now()
+        self.worker.requeue_stale()
+        used_up.refresh_from_db()
+        left.refresh_from_db()
+        self.assertEqual(used_up.status, Job.FAILED)
+        self.assertIn('Блокировка истекла', used_up.last_error)
+        self.assertIsNotNone(used_up.finished_at)
+        self.assertEqual((left.status, left.locked_by), (Job.QUEUED, ''))
+        self.assertGreaterEqual(left.run_at, started + timedelta(seconds=5))
+
+    def test_failed_keyed_job_is_queued_again(self):
+        failing = jobs.enqueue('plain', {'fail': True}, key='plain:1')
+        self.run_next()
+        Job.objects.filter(id=failing.id).update(run_at=timezone.now())
+        self.assertEqual(self.run_next().status, Job.FAILED)
+        again = jobs.enqueue('plain', key='plain:1')
+        self.assertEqual(again.id, failing.id)
+        self.assertEqual(
+            (again.status, again.attempts, again.payload),
+            (Job.QUEUED, 0, '{}'),
+        )
+        self.assertEqual(self.run_next().status, Job.DONE)
+        # done jobs keep their key
+        self.assertEqual(
+            jobs.enqueue('plain', key='plain:1').status, Job.DONE
+        )
+
+
+class TrendingTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            email='cook@foodgram.ru', username='cook'
+        )
+        cls.tag = Tag.objects.create(
+            name='Завтрак', slug='breakfast', color='#E26C2D'
+        )
+        Recipe.objects.bulk_create(
+            Recipe(
+                name=f'Рецепт {i}', text='...', cooking_time=10,
+                image='static/recipe/image.png', author=cls.user,
+            )
+            for i in range(3)
+        )
+        cls.first, cls.second, cls.third = Recipe.objects.order_by('id')
+        cls.second.tags.add(cls.tag)
+        cls.third.tags.add(cls.tag)
+
+    def setUp(self):
+        cache.clear()
+        # user ids come back after rollbacks, so do their buckets
+        throttling.buckets.buckets.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def trending_ids(self, **params):
+        cache.delete(trending.TOP_CACHE_KEY)
+        response = self.client.get('/api/recipes/trending/', params)
+        return [recipe['id'] for recipe in response.json()['results']]
+
+    def test_events_update_score(self):
+        self.client.post(f'/api/recipes/{self.first.id}/favorite/')
+        self.client.post(f'/api/recipes/{self.first.id}/favorite/')
+        self.client.post(f'/api/recipes/{self.third.id}/shopping_cart/')
+        self.client.post(f'/api/recipes/{self.third.id}/shopping_cart/')
+        # only the request that inserted the row counts
+        self.assertEqual(self.score(self.first), 1.0)
+        self.assertEqual(self.score(self.third), 2.0)
+        self.assertEqual(
+            self.trending_ids(), [self.third.id, self.first.id]
+        )
+        # removals fade out with the decay instead of being subtracted
+        self.client.delete(f'/api/recipes/{self.third.id}/shopping_cart/')
+        self.assertEqual(
+            self.trending_ids(), [self.third.id, self.first.id]
+        )
+
+    def score(self, recipe):
+        return RecipeScore.objects.get(recipe=recipe).score
+
+    @override_settings(TRENDING={
+        **settings.TRENDING, 'HALF_LIFE': 60 * 60, 'DECAY_INTERVAL': 60 * 60,
+    })
+    def test_removal_after_decay(self):
+        other = APIClient()
+        other.force_authenticate(User.objects.create(
+            email='guest@foodgram.ru', username='guest'
+        ))
+        other.post(f'/api/recipes/{self.first.id}/favorite/')
+        trending.decay()
+        self.assertEqual(self.score(self.first), 0.5)
+        self.client.post(f'/api/recipes/{self.first.id}/favorite/')
+        # the old favorite must not take the weight of the new one along
+        other.delete(f'/api/recipes/{self.first.id}/favorite/')
+        self.assertEqual(self.score(self.first), 1.5)
+
+    def test_tag_filter(self):
+        for recipe in (self.first, self.second, self.third):
+            trending.record(recipe.id, recipe.id)
+        self.assertEqual(
+            self.trending_ids(tags='breakfast'),
+            [self.third.id, self.second.id],
+        )
+
+    def test_decay_drops_old_scores(self):
+        trending.record(self.first.id, 1)
+        trending.record(self.second.id, 0.01)
+        trending.decay()
+        self.assertEqual(
+            list(RecipeScore.objects.values_list('recipe_id', flat=True)),
+            [self.first.id],
+        )
+
+
+class ShoppingCartDownloadTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            email='cook@foodgram.ru', username='cook'
+        )
+        units = dict(MeasurementUnit.objects.values_list('name', 'id'))
+        Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit_id=units[unit])
+            for name, unit in (
+                ('Сахар', 'г'), ('Сахар', 'кг'), ('Соль', 'ч. л.'),
+            )
+        )
+        sugar, sugar_kg, salt = Ingredient.objects.order_by('id')
+        Recipe.objects.bulk_create(
+            Recipe(
+                name=f'Рецепт {i}', text='...', cooking_time=10,
+                image='static/recipe/image.png', author=cls.user,
+            )
+            for i in range(2)
+        )
+        first, second = Recipe.objects.order_by('id')
+        RecipeIngredient.objects.bulk_create((
+            RecipeIngredient(recipe=first, ingredient=sugar, amount=500),
+            RecipeIngredient(recipe=second, ingredient=sugar_kg, amount=2),
+            RecipeIngredient(recipe=first, ingredient=salt, amount=1),
+            RecipeIngredient(recipe=second, ingredient=salt, amount=2),
+        ))
+        ShoppingCart.objects.bulk_create(
+            ShoppingCart(user=cls.user, recipe=recipe)
+            for recipe in (first, second)
+        )
+
+    def test_compatible_units_are_merged(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get('/api/recipes/download_shopping_cart/')
+        self.assertEqual(
+            response.content.decode(),
+            '1.) Сахар 2500 г\n2.) Соль 3 ч. л.\n',
+        )
+
+
+class AsyncReadTest(TransactionTestCase):
+    """ASGI read endpoints answer byte for byte like the WSGI views."""
+
+    def setUp(self):
+        user = User.objects.create(email='cook@foodgram.ru', username='cook')
+        self.token = Token.objects.create(user=user).key
+        tag = Tag.objects.create(
+            name='Завтрак', slug='breakfast', color='#E26C2D'
+        )
+        ingredient = Ingredient.objects.create(
+            name='Соль',
+            measurement_unit=MeasurementUnit.objects.get_or_create(
+                name='г'
+            )[0],
+        )
+        self.recipe = Recipe.objects.create(
+            name='Рецепт', text='...', cooking_time=10,
+            image='static/recipe/image.png', author=user,
+        )
+        self.recipe.tags.add(tag)
+        RecipeIngredient.objects.create(
+            recipe=self.recipe, ingredient=ingredient, amount=5
+        )
+        Favorite.objects.create(user=user, recipe=self.recipe)
+        self.application = AsyncReadApplication(get_wsgi_application())
+        self.addCleanup(self.application.executor.shutdown)
+        cache.clear()
+        recipe_cards.clear()
+        # user ids come back after rollbacks, so do their buckets
+        throttling.buckets.buckets.clear()
+
+    def request(self, method, path, query='', token=None):
+        headers = [(b'host', b'testserver')]
+        if token:
+            headers.append((b'authorization', f'Token {token}'.encode()))
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b''}
+
+        async def send(message):
+            messages.append(message)
+
+        asyncio.run(self.application({
+            'type': 'http',
+            'http_version': '1.1',
+            'method': method,
+            'path': path,
+            'query_string': query.encode(),
+            'headers': headers,
+        }, receive, send))
+        self.headers = {
+            name.decode().lower(): value.decode()
+            for name, value in messages[0]['headers']
+        }
+        return messages[0]['status'], messages[1]['body']
+
+    def test_same_as_wsgi(self):
+        for path, query in (
+            ('/api/recipes/', ''),
+            ('/api/recipes/', 'limit=1&page=last'),
+            ('/api/recipes/', 'page=5'),
+            ('/api/recipes/', 'is_favorited=1&fields=id,tags'),
+            (f'/api/recipes/{self.recipe.id}/', ''),
+            ('/api/recipes/0/', ''),
+            ('/api/tags/', ''),
+            ('/api/ingredients/', 'name=Со'),
+        ):
+            for token in (None, self.token, 'wrong'):
+                with self.subTest(path=path, query=query, token=token):
+                    response = self.client.get(
+                        f'{path}?{query}',
+                        **({'HTTP_AUTHORIZATION': f'Token {token}'}
+                           if token else {}),
+                    )
+                    content = (
+                        b''.join(response.streaming_content)
+                        if response.streaming else response.content
+                    )
+                    self.assertEqual(
+                        self.request('GET', path, query, token),
+                        (response.status_code, content),
+                    )
+
+    def test_writes_go_to_wsgi(self):
+        status, _ = self.request(
+            'DELETE', f'/api/recipes/{self.recipe.id}/', token=self.token
+        )
+        self.assertEqual(status, 204)
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_in_flight_limit(self):
+        status, _ = self.request('GET', '/api/ingredients/')
+        self.assertEqual(status, 200)
+        self.assertEqual(throttling.stats()['in_flight'], 0)
+        with self.settings(THROTTLING={
+            **settings.THROTTLING, 'MAX_IN_FLIGHT': 0,
+        }):
+            status, _ = self.request('GET', '/api/ingredients/')
+            self.assertEqual(status, 503)
+            self.assertIn('retry-after', self.headers)
+            # a search costs one token and is not limited
+            status, _ = self.request('GET', '/api/ingredients/', 'name=Со')
+            self.assertEqual(status, 200)
+
+    def test_token_buckets(self):
+        with self.settings(THROTTLING={
+            **settings.THROTTLING, 'BURST': 1, 'RATE': 0.001,
+        }):
+            self.assertEqual(self.request('GET', '/api/tags/')[0], 200)
+            self.assertEqual(self.request('GET', '/api/tags/')[0], 429)
+
+    def test_profiled_requests_go_to_wsgi(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with self.settings(PROFILING_DIR=directory):
+            self.application = AsyncReadApplication(get_wsgi_application())
+            self.addCleanup(self.application.executor.shutdown)
+            status, _ = self.request(
+                'GET', '/api/tags/', f'_profile={profiling.make_token()}'
+            )
+            self.assertEqual(status, 200)
+            self.assertIn('x-profile-id', self.headers)
+            with self.settings(PROFILING_SAMPLE_RATE=1):
+                self.request('GET', '/api/tags/')
+                self.assertIn('x-profile-id', self.headers)
+        self.assertEqual(len(os.listdir(directory)), 4)
+
+
+class HealthTest(TestCase):
+
+    def test_ready_after_warmup(self):
+        with mock.patch.object(warmup, 'state', warmup.WarmupState()):
+            response = self.client.get('/api/health/')
+            self.assertEqual(response.status_code, 503)
+            with self.settings(WARMUP={
+                'ENABLED': True,
+                'STEPS': (
+                    'api.warmup.load_url_resolver',
+                    'api.warmup.load_serializers',
+                    'api.warmup.missing',
+                ),
+            }), self.assertLogs('api.warmup', 'WARNING'):
+                warmup.run()
+            response = self.client.get('/api/health/')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(list(warmup.state()['errors']), [
+                'api.warmup.missing'
+            ])
+
+
+class ThrottlingTest(TestCase):
+
+    def setUp(self):
+        options = override_settings(THROTTLING={
+            **settings.THROTTLING, 'ALIAS': None, 'RATE': 1, 'BURST': 20,
+        })
+        options.enable()
+        self.addCleanup(options.disable)
+        for name, value in (
+            ('buckets', throttling.TokenBuckets(100)),
+            ('stats', throttling.ThrottleStats()),
+            ('limiter', throttling.InFlightLimiter()),
+        ):
+            patcher = mock.patch.object(throttling, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def get(self, path, **extra):
+        response = self.client.get(path, **extra)
+        if response.streaming:
+            # the in-flight slot is released once the response is sent
+            b''.join(response.streaming_content)
+        return response
+
+    def test_expensive_requests_take_more_tokens(self):
+        for _ in range(2):
+            response = self.get('/api/ingredients/')
+            self.assertEqual(response.status_code, 200)
+        response = self.get('/api/ingredients/?name=с')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(throttling.stats(), {
+            'decisions': {'allowed': 2, 'throttled_local': 1},
+            'rejected': {'ingredients-list': 1},
+            'in_flight': 0,
+        })
+
+    def test_shared_store_caps_client_across_workers(self):
+        with self.settings(THROTTLING={
+            **settings.THROTTLING, 'ALIAS': 'default',
+        }):
+            cache.clear()
+            for _ in range(4):
+                self.get('/api/ingredients/')
+                throttling.buckets.buckets.clear()
+            response = self.get('/api/ingredients/')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(
+            throttling.stats()['decisions']['throttled_shared'], 1
+        )
+
+    def test_in_flight_limit(self):
+        throttling.limiter.acquire('127.0.0.1')
+        response = self.get('/api/ingredients/')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '1')
+        throttling.limiter.acquire('other')
+        response = self.get(
+            '/api/ingredients/', HTTP_AUTHORIZATION='Token 1'
+        )
+        self.assertEqual(response.status_code, 503)
+        throttling.limiter.release('other')
+        response = self.get(
+            '/api/ingredients/', HTTP_AUTHORIZATION='Token 1'
+        )
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(throttling.stats()['in_flight'], 1)
+
+
+class RecipeExportImportTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        media = override_settings(
+            MEDIA_ROOT=os.path.join(self.directory, 'media')
+        )
+        media.enable()
+        self.addCleanup(media.disable)
+        self.user = User.objects.create(
+            email='cook@foodgram.ru', username='cook'
+        )
+        tag = Tag.objects.create(
+            name='Завтрак', slug='breakfast', color='#E26C2D'
+        )
+        ingredient = Ingredient.objects.create(
+            name='Соль',
+            measurement_unit=MeasurementUnit.objects.get(name='г'),
+        )
+        for i in range(2):
+            recipe = Recipe.objects.create(
+                name=f'Рецепт {i}', text='...', cooking_time=10,
+                image=default_storage.save(
+                    f'static/recipe/{i}.png', ContentFile(b'image')
+                ),
+                author=self.user,
+            )
+            recipe.tags.add(tag)
+            RecipeIngredient.objects.create(
+                recipe=recipe, ingredient=ingredient, amount=i + 1
+            )
+        self.pub_dates = list(
+            Recipe.objects.order_by('name').values_list('pub_date', flat=True)
+        )
+
+    def test_round_trip(self):
+        path = os.path.join(self.directory, 'recipes.jsonl')
+        call_command('export_recipes', path, stdout=StringIO())
+        self.assertEqual(
+            len(os.listdir(os.path.join(self.directory, 'recipes_images'))),
+            1,
+        )
+        Recipe.objects.all().delete()
+        Tag.objects.all().delete()
+        Tag.objects.create(name='Обед', slug='lunch', color='#49B64E')
+        call_command(
+            'import_recipes', path, batch_size=1, stdout=StringIO()
+        )
+        recipes = Recipe.objects.order_by('name')
+        self.assertEqual(
+            list(recipes.values_list('pub_date', flat=True)), self.pub_dates
+        )
+        self.assertEqual(
+            list(recipes.values_list(
+                'tags__slug', 'recipe__ingredient__name', 'recipe__amount'
+            )),
+            [('breakfast', 'Соль', 1), ('breakfast', 'Соль', 2)],
+        )
+        first, second = recipes
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(first.image.read(), b'image')
+
+    def test_unknown_references_are_skipped(self):
+        path = os.path.join(self.directory, 'recipes.jsonl')
+        call_command('export_recipes', path, stdout=StringIO())
+        with open(path, encoding='utf-8') as source:
+            lines = source.read().splitlines()
+        recipe = json.loads(lines[-1])
+        recipe['ingredients'] = [[0, 1]]
+        lines[-1] = json.dumps(recipe, ensure_ascii=False)
+        with open(path, 'w', encoding='utf-8') as source:
+            source.write('\n'.join(lines))
+        Recipe.objects.all().delete()
+        stdout, stderr = StringIO(), StringIO()
+        call_command('import_recipes', path, stdout=stdout, stderr=stderr)
+        self.assertEqual(Recipe.objects.count(), 1)
+        self.assertIn(f'Строка {len(lines)}:', stderr.getvalue())
+        self.assertIn('1 skipped', stdout.getvalue())
+
+
+class MediaGcTest(TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        media = override_settings(MEDIA_ROOT=directory)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.used = default_storage.save(
+            'static/recipe/used.png', ContentFile(b'image')
+        )
+        self.orphan = default_storage.save(
+            'static/recipe/orphan.png', ContentFile(b'image')
+        )
+        Recipe.objects.create(
+            name='Рецепт', text='...', cooking_time=10, image=self.used,
+            author=User.objects.create(
+                email='cook@foodgram.ru', username='cook'
+            ),
+        )
+
+    def test_young_files_are_kept(self):
+        call_command('gc_media', stdout=StringIO())
+        self.assertTrue(default_storage.exists(self.orphan))
+
+    def test_orphans_are_deleted(self):
+        call_command('gc_media', min_age=0, dry_run=True, stdout=StringIO())
+        self.assertTrue(default_storage.exists(self.orphan))
+        call_command('gc_media', min_age=0, batch_size=1, stdout=StringIO())
+        self.assertFalse(default_storage.exists(self.orphan))
+        self.assertTrue(default_storage.exists(self.used))
+
+
+class InvalidationBusTest(TransactionTestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(
+            email='cook@foodgram.ru', username='cook'
+        )
+        # ids go on from the previous test, the listener starts here
+        Invalidation.objects.create(topic='test')
+        self.listener = invalidation.Listener()
+        self.listener.poll()
+        self.received = []
+        for topic in ('tag', 'recipe'):
+            handler = partial(self.receive, topic)
+            invalidation.subscribe(topic, handler)
+            self.addCleanup(invalidation.handlers[topic].remove, handler)
+
+    def receive(self, topic, keys):
+        self.received.append((topic, keys))
+
+    def create_tag(self, number):
+        return Tag.objects.create(
+            name=f'Тег {number}', slug=f'tag-{number}',
+            color=f'#E26C2{number}',
+        )
+
+    def test_events_are_sent_on_commit(self):
+        with transaction.atomic():
+            tag = self.create_tag(0)
+            tag.save()
+            recipe = Recipe.objects.create(
+                name='Рецепт', text='...', cooking_time=10,
+                image='static/recipe/image.png', author=self.user,
+            )
+            self.assertFalse(Invalidation.objects.filter(
+                id__gt=self.listener.version
+            ).exists())
+        self.assertEqual(self.listener.poll(), 2)
+        self.assertCountEqual(self.received, [
+            ('tag', {str(tag.id)}), ('recipe', {str(recipe.id)}),
+        ])
+        self.assertEqual(
+            self.listener.versions['tag'] + 1,
+            self.listener.versions['recipe'],
+        )
+        self.assertEqual(self.listener.poll(), 0)
+        stats = self.listener()
+        self.assertEqual(stats['applied'], 2)
+        self.assertLess(stats['lag_seconds']['max'], 60)
+
+    def test_rolled_back_changes_are_not_sent(self):
+        with self.assertRaises(DatabaseError), transaction.atomic():
+            self.create_tag(0)
+            raise DatabaseError
+        self.assertEqual(self.listener.poll(), 0)
+
+    def test_savepoint_rollback_keeps_earlier_events(self):
+        with transaction.atomic():
+            tag = self.create_tag(0)
+            with self.assertRaises(DatabaseError), transaction.atomic():
+                self.create_tag(1)
+                raise DatabaseError
+        self.listener.poll()
+        self.assertIn(str(tag.id), self.received[0][1])
+
+    @override_settings(INVALIDATION={
+        **settings.INVALIDATION, 'MAX_KEYS': 2,
+    })
+    def test_many_keys_become_one_event(self):
+        with transaction.atomic():
+            for number in range(3):
+                self.create_tag(number)
+        self.assertEqual(self.listener.poll(), 1)
+        self.assertEqual(self.received, [('tag', None)])
+
+    def test_gap_holds_later_versions_back(self):
+        Invalidation.objects.create(
+            id=self.listener.version + 2, topic='tag', key='1'
+        )
+        self.assertEqual(self.listener.poll(), 0)
+        with override_settings(INVALIDATION={
+            **settings.INVALIDATION, 'GAP_TIMEOUT': 0,
+        }):
+            self.assertEqual(self.listener.poll(), 1)
+        self.assertEqual(self.listener()['skipped'], 1)
+
+    @override_settings(INVALIDATION={
+        **settings.INVALIDATION, 'POLL_INTERVAL': 0.05,
+    })
+    def test_listener_applies_within_poll_interval(self):
+        listener = invalidation.Listener()
+        listener.start()
+        self.addCleanup(listener.stop)
+        while listener.version is None:
+            time.sleep(0.01)
+        self.create_tag(0)
+        deadline = time.monotonic() + 5
+        while 'tag' not in listener.versions:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+        self.assertLess(listener()['lag_seconds']['last'], 1)
+
+    def test_page_counts_follow_versions(self):
+        client = APIClient()
+        for number in range(3):
+            Recipe.objects.create(
+                name=f'Рецепт {number}', text='...', cooking_time=10,
+                image='static/recipe/image.png', author=self.user,
+            )
+
+        def count():
+            return client.get('/api/recipes/', {'limit': 1}).json()['count']
+
+        with mock.patch.object(invalidation, 'listener', self.listener):
+            self.listener.poll()
+            self.assertEqual(count(), 3)
+            Recipe.objects.first().delete()
+            # other workers keep their count until the event arrives
+            self.assertEqual(count(), 3)
+            self.listener.poll()
+            self.assertEqual(count(), 2)
+
+    def test_user_and_subscription_counts_follow_versions(self):
+        cache.clear()
+        client = APIClient()
+        client.force_authenticate(self.user)
+        authors = [
+            User.objects.create(
+                email=f'author{number}@foodgram.ru',
+                username=f'author{number}',
+            )
+            for number in range(3)
+        ]
+
+        def count(path):
+            return client.get(path, {'limit': 1}).json()['count']
+
+        with mock.patch.object(invalidation, 'listener', self.listener):
+            self.listener.poll()
+            self.assertEqual(count('/api/users/'), 4)
+            authors[0].delete()
+            self.assertEqual(count('/api/users/'), 4)
+            self.listener.poll()
+            self.assertEqual(count('/api/users/'), 3)
+            # logins save the user, the lists stay as they are
+            self.user.last_login = timezone.now()
+            self.user.save()
+            self.assertEqual(self.listener.poll(), 0)
+
+            Subscribe.objects.create(follower=self.user, following=authors[1])
+            self.listener.poll()
+            self.assertEqual(count('/api/users/subscriptions/'), 1)
+            Subscribe.objects.create(follower=self.user, following=authors[2])
+            self.listener.poll()
+            self.assertEqual(count('/api/users/subscriptions/'), 2)
+
+    def test_recipe_cards_follow_events(self):
+        recipe_cards.clear()
+        self.addCleanup(recipe_cards.clear)
+        recipe = Recipe.objects.create(
+            name='Рецепт', text='...', cooking_time=10,
+            image='static/recipe/image.png', author=self.user,
+        )
+        other = card_key_prefix(0) + '1.0'
+        recipe_cards.local.set_many({
+            card_key_prefix(recipe.id) + '1.0': 'old', other: 'other',
+        })
+        self.listener.poll()
+        self.assertEqual(list(recipe_cards.local.data), [other])
+        self.create_tag(0)
+        self.listener.poll()
+        self.assertEqual(recipe_cards.local.data, {})
+
+    def test_prune_keeps_the_last_version(self):
+        for key in ('1', '2'):
+            Invalidation.objects.create(
+                topic='tag', key=key,
+                created_at=timezone.now() - timedelta(days=1),
+            )
+        self.assertEqual(invalidation.prune(), 1)
+        self.assertEqual(Invalidation.objects.last().key, '2')
+
+
+class PooledSQLiteWrapper(
+    pool.PooledDatabaseWrapperMixin, sqlite_base.DatabaseWrapper
+):
+    pass
+
+
+class ConnectionPoolTest(TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'pool.sqlite3')
+
+    def connect(self):
+        return sqlite3.connect(self.path, check_same_thread=False)
+
+    def make_pool(self, check_after=60):
+        return pool.ConnectionPool(
+            size=1, timeout=5, max_age=60, check_after=check_after
+        )
+
+    def test_reuses_connections(self):
+        connection_pool = self.make_pool()
+        first, created = connection_pool.checkout(self.connect)
+        connection_pool.checkin(first, created)
+        second, created = connection_pool.checkout(self.connect)
+        self.assertIs(second, first)
+        self.assertEqual(connection_pool.stats()['connects'], 1)
+
+    def test_waits_for_free_connection(self):
+        connection_pool = self.make_pool()
+        taken, created = connection_pool.checkout(self.connect)
+        timer = threading.Timer(
+            0.05, connection_pool.checkin, (taken, created)
+        )
+        timer.start()
+        self.assertIs(connection_pool.checkout(self.connect)[0], taken)
+        timer.join()
+        self.assertEqual(connection_pool.stats()['waits'], 1)
+        connection_pool.timeout = 0.01
+        with self.assertRaises(pool.PoolTimeoutError):
+            connection_pool.checkout(self.connect)
+
+    def test_replaces_broken_connection(self):
+        connection_pool = self.make_pool(check_after=0)
+        broken, created = connection_pool.checkout(self.connect)
+        connection_pool.checkin(broken, created)
+        broken.close()
+        fresh, _ = connection_pool.checkout(self.connect)
+        self.assertIsNot(fresh, broken)
+        self.assertEqual(fresh.execute('SELECT 1').fetchone(), (1,))
+        self.assertEqual(connection_pool.stats()['reconnects'], 1)
+
+    def test_database_wrapper_returns_connection_on_close(self):
+        wrapper = PooledSQLiteWrapper(
+            {**connections['default'].settings_dict, 'NAME': self.path},
+            alias='pool-test',
+        )
+        self.addCleanup(pool.pools.pop, ('pool-test', os.getpid()))
+        for _ in range(2):
+            with wrapper.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            wrapper.close()
+        stats = pool.stats()['pool-test']
+        self.assertEqual(
+            (stats['checkouts'], stats['connects'], stats['in_use']),
+            (2, 1, 0),
+        )
+
+
+@override_settings(
+    THROTTLING={**settings.THROTTLING, 'ENABLED': False},
+    WARMUP={**settings.WARMUP, 'ENABLED': False},
+    PASSWORD_HASHING={
+        'ITERATIONS': 1000, 'WORKERS': 0, 'QUEUE': 0, 'TIMEOUT': 0,
+    },
+)
+class QueryCountTest(TestCase):
+    """Query budgets for every route of ``api/urls.py``.
+
+    Counts are taken on a cold cache. Lists are also requested with a
+    small and a large page, and the two counts must match: a relation
+    loaded per row shows up as a difference.
+    """
+    # url name, method, path, data, anonymous and authenticated budget;
+    # None where the route answers 401 or 403. Writes also insert their
+    # invalidation events on commit, which TestCase never reaches.
+    routes = (
+        ('users-list', 'get', '/api/users/', None, 6, 7),
+        (
+            'users-list', 'get', '/api/users/',
+            {'search': 'author1'}, 6, 7,
+        ),
+        ('users-detail', 'get', '/api/users/{author}/', None, 1, 2),
+        ('users-me', 'get', '/api/users/me/', None, None, 0),
+        (
+            'users-subscriptions', 'get', '/api/users/subscriptions/',
+            {'recipes_limit': 2}, None, 3,
+        ),
+        ('tags-list', 'get', '/api/tags/', None, 1, 1),
+        ('tags-detail', 'get', '/api/tags/{tag}/', None, 1, 1),
+        ('ingredients-list', 'get', '/api/ingredients/', None, 1, 1),
+        (
+            'ingredients-list', 'get', '/api/ingredients/',
+            {'name': 'Ингредиент 1'}, 1, 1,
+        ),
+        (
+            'ingredients-detail', 'get', '/api/ingredients/{ingredient}/',
+            None, 1, 1,
+        ),
+        ('recipes-list', 'get', '/api/recipes/', None, 8, 8),
+        (
+            'recipes-list', 'get', '/api/recipes/',
+            {'tags': ['tag-0', 'tag-1'], 'author': '{author}'}, 5, 5,
+        ),
+        (
+            'recipes-list', 'get', '/api/recipes/',
+            {'is_favorited': 1, 'is_in_shopping_cart': 1}, 2, 5,
+        ),
+        ('recipes-detail', 'get', '/api/recipes/{recipe}/', None, 4, 4),
+        (
+            'recipes-batch', 'get', '/api/recipes/batch/',
+            {'ids': '{recipes}'}, 3, 3,
+        ),
+        ('recipes-trending', 'get', '/api/recipes/trending/', None, 6, 6),
+        (
+            'recipes-download-shopping-cart', 'get',
+            '/api/recipes/download_shopping_cart/', None, None, 2,
+        ),
+        ('metrics', 'get', '/api/metrics/', None, None, None),
+        ('health', 'get', '/api/health/', None, 0, 0),
+        (
+            'login', 'post', '/api/auth/token/login/',
+            {'email': 'cook@foodgram.ru', 'password': 'secret-pass'}, 6, 6,
+        ),
+        ('users-list', 'post', '/api/users/', {
+            'email': 'new@foodgram.ru', 'username': 'new',
+            'first_name': 'Имя', 'last_name': 'Фамилия',
+            'password': 'secret-pass',
+        }, 3, 3),
+        ('users-set-password', 'post', '/api/users/set_password/', {
+            'current_password': 'secret-pass',
+            'new_password': 'other-secret-pass',
+        }, None, 3),
+        ('follow', 'post', '/api/users/{stranger}/subscribe/', None, None, 5),
+        (
+            'follow', 'delete', '/api/users/{stranger}/subscribe/', None,
+            None, 3,
+        ),
+        (
+            'favorite', 'post', '/api/recipes/{other_recipe}/favorite/',
+            None, None, 7,
+        ),
+        (
+            'favorite', 'delete', '/api/recipes/{other_recipe}/favorite/',
+            None, None, 4,
+        ),
+        (
+            'shopping_cart', 'post',
+            '/api/recipes/{other_recipe}/shopping_cart/', None, None, 5,
+        ),
+        (
+            'shopping_cart', 'delete',
+            '/api/recipes/{other_recipe}/shopping_cart/', None, None, 4,
+        ),
+        ('recipes-list', 'post', '/api/recipes/', '{new_recipe}', None, 11),
+        (
+            'recipes-detail', 'patch', '/api/recipes/{own_recipe}/',
+            {'name': 'Новое название'}, None, 6,
+        ),
+        (
+            'recipes-detail', 'delete', '/api/recipes/{own_recipe}/', None,
+            None, 8,
+        ),
+        ('users-detail', 'delete', '/api/users/{stranger}/', None, None, None),
+        ('logout', 'post', '/api/auth/token/logout/', None, None, 1),
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tags = [
+            Tag.objects.create(
+                name=f'Тег {i}', slug=f'tag-{i}', color=f'#00000{i}'
+            )
+            for i in range(3)
+        ]
+        unit = MeasurementUnit.objects.get(name='г')
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {i}', measurement_unit=unit)
+            for i in range(20)
+        )
+        cls.ingredients = list(Ingredient.objects.order_by('id'))
+        cls.user = User.objects.create_user(
+            email='cook@foodgram.ru', username='cook',
+            password='secret-pass',
+        )
+        cls.authors = [
+            User.objects.create(
+                email=f'author{i}@foodgram.ru', username=f'author{i}'
+            )
+            for i in range(13)
+        ]
+        for number, author in enumerate([cls.user] + cls.authors):
+            for i in range(3):
+                recipe = Recipe.objects.create(
+                    name=f'Рецепт {number}-{i}', text='...',
+                    cooking_time=10, image='static/recipe/image.png',
+                    author=author,
+                )
+                recipe.tags.set(cls.tags[i:i + 2])
+                RecipeIngredient.objects.bulk_create(
+                    RecipeIngredient(
+                        recipe=recipe, ingredient=ingredient, amount=i + 1
+                    )
+                    for ingredient in cls.ingredients[number:number + 3]
+                )
+        cls.recipes = list(Recipe.objects.order_by('id'))
+        for recipe in cls.recipes[3:15]:
+            Favorite.objects.create(user=cls.user, recipe=recipe)
+            ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+            trending.record(recipe.id, 1)
+        # the last author is left for the subscribe and delete routes
+        Subscribe.objects.bulk_create(
+            Subscribe(follower=cls.user, following=author)
+            for author in cls.authors[:-1]
+        )
+        image = BytesIO()
+        Image.new('RGB', (2, 2)).save(image, 'PNG')
+        cls.ids = {
+            'author': cls.authors[0].id,
+            'stranger': cls.authors[-1].id,
+            'tag': cls.tags[0].id,
+            'ingredient': cls.ingredients[0].id,
+            'recipe': cls.recipes[3].id,
+            'recipes': ','.join(str(recipe.id) for recipe in cls.recipes[:6]),
+            'own_recipe': cls.recipes[0].id,
+            'other_recipe': cls.recipes[20].id,
+            'new_recipe': {
+                'name': 'Новый рецепт', 'text': '...', 'cooking_time': 5,
+                'image': 'data:image/png;base64,' + base64.b64encode(
+                    image.getvalue()
+                ).decode(),
+                'tags': [cls.tags[0].id, cls.tags[1].id],
+                'ingredients': [
+                    {'id': ingredient.id, 'amount': 10}
+                    for ingredient in cls.ingredients[:3]
+                ],
+            },
+        }
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        media = override_settings(MEDIA_ROOT=directory)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def fill(self, value):
+        """Put fixture ids into ``{name}`` placeholders."""
+        if isinstance(value, dict):
+            return {key: self.fill(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self.fill(item) for item in value]
+        if isinstance(value, str) and value.startswith('{'):
+            return self.ids[value[1:-1]]
+        if isinstance(value, str):
+            return value.format(**self.ids)
+        return value
+
+    def count(self, method, path, data=None, user=None):
+        client = APIClient()
+        if user is not None:
+            client.force_authenticate(user)
+        cache.clear()
+        recipe_cards.clear()
+        with CaptureQueriesContext(connection) as context:
+            if method == 'get':
+                response = client.get(path, data)
+            else:
+                response = getattr(client, method)(path, data, format='json')
+            if response.streaming:
+                b''.join(response.streaming_content)
+        return response.status_code, len(context)
+
+    def test_every_route_has_a_budget(self):
+        names = {
+            pattern.name for pattern in get_resolver('api.urls').url_patterns
+            if getattr(pattern, 'name', None)
+        } | {
+            pattern.name for pattern in router.urls if pattern.name
+        } | {'login', 'logout'}
+        names.discard('api-root')
+        self.assertEqual(names - {route[0] for route in self.routes}, set())
+
+    def assert_budgets(self, user):
+        index = 4 if user is None else 5
+        for route in self.routes:
+            name, method, path, data, budget = route[:4] + (route[index],)
+            with self.subTest(name, method=method, data=data):
+                status_code, queries = self.count(
+                    method, self.fill(path), self.fill(data), user
+                )
+                if budget is None:
+                    self.assertIn(status_code, (401, 403))
+                    continue
+                self.assertLess(status_code, 400)
+                self.assertLessEqual(queries, budget)
+
+    def assert_constant(self, path, small, large, user=None):
+        with self.subTest(path, small=small, user=user):
+            self.assertEqual(
+                self.count('get', path, self.fill(small), user),
+                self.count('get', path, self.fill(large), user),
+            )
+
+    def test_counts_do_not_grow_with_page_size(self):
+        recipe_ids = [recipe.id for recipe in self.recipes]
+        for user in (None, self.user):
+            for path, params in (
+                ('/api/users/', {}),
+                ('/api/users/', {'search': 'author'}),
+                ('/api/recipes/', {}),
+                ('/api/recipes/', {'tags': ['tag-0', 'tag-1']}),
+                ('/api/recipes/', {'author': '{author}'}),
+                ('/api/recipes/trending/', {}),
+            ):
+                self.assert_constant(
+                    path, {**params, 'limit': 2}, {**params, 'limit': 12},
+                    user,
+                )
+            self.assert_constant(
+                '/api/recipes/',
+                {'is_favorited': 1, 'is_in_shopping_cart': 1, 'limit': 2},
+                {'is_favorited': 1, 'is_in_shopping_cart': 1, 'limit': 12},
+                user,
+            )
+            self.assert_constant(
+                '/api/recipes/batch/',
+                {'ids': ','.join(map(str, recipe_ids[:2]))},
+                {'ids': ','.join(map(str, recipe_ids[:30]))},
+                user,
+            )
+            self.assert_constant(
+                '/api/ingredients/',
+                {'name': 'Ингредиент 1'}, {'name': 'Ингредиент'}, user,
+            )
+        self.assert_constant(
+            '/api/users/subscriptions/',
+            {'limit': 2, 'recipes_limit': 1},
+            {'limit': 12, 'recipes_limit': 3},
+            self.user,
+        )
+
+    def test_counts_do_not_grow_with_rows(self):
+        before = [
+            self.count('get', path, user=self.user)
+            for path in ('/api/tags/', '/api/recipes/download_shopping_cart/')
+        ]
+        Tag.objects.bulk_create(
+            Tag(name=f'Еще тег {i}', slug=f'more-{i}', color=f'#10000{i}')
+            for i in range(5)
+        )
+        ShoppingCart.objects.bulk_create(
+            ShoppingCart(user=self.user, recipe=recipe)
+            for recipe in self.recipes[15:30]
+        )
+        after = [
+            self.count('get', path, user=self.user)
+            for path in ('/api/tags/', '/api/recipes/download_shopping_cart/')
+        ]
+        self.assertEqual(before, after)
+
+    def test_recipe_write_does_not_grow_with_ingredients(self):
+        counts = []
+        for size in (1, 6):
+            data = {
+                **self.ids['new_recipe'],
+                'ingredients': [
+                    {'id': ingredient.id, 'amount': 10}
+                    for ingredient in self.ingredients[:size]
+                ],
+            }
+            counts.append(
+                self.count('post', '/api/recipes/', data, self.user)
+            )
+        self.assertEqual(counts[0], counts[1])
+
+    def test_anonymous_budgets(self):
+        self.assert_budgets(None)
+
+    def test_account_deletion_budget(self):
+        # the table only sees the DELETE rejected, the owner gets through
+        stranger = self.authors[-1]
+        status_code, queries = self.count(
+            'delete', f'/api/users/{stranger.id}/', user=stranger
+        )
+        self.assertEqual(status_code, 204)
+        self.assertLessEqual(queries, 18)
+
+    def test_authenticated_budgets(self):
+        self.assert_budgets(self.user)
+
+
+class QueryLogTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        stats = mock.patch.object(
+            querylog, 'query_stats', querylog.QueryStats()
+        )
+        stats.start()
+        self.addCleanup(stats.stop)
+        self.tag = Tag.objects.create(
+            name='Завтрак', color='#E26C2D', slug='breakfast'
+        )
+
+    def test_fingerprint(self):
+        for statements in (
+            (
+                "SELECT * FROM t WHERE name = 'a' AND id = 1",
+                "SELECT * FROM t WHERE name = 'it''s' AND id = 22.5",
+                'SELECT * FROM t WHERE name = %s AND id = %s',
+            ),
+            (
+                'SELECT * FROM t WHERE id IN (1)',
+                'SELECT * FROM t WHERE id IN (%s, %s, %s)',
+            ),
+            (
+                'INSERT INTO t (a, b) VALUES (%s, %s)',
+                'INSERT INTO t (a, b) VALUES (%s, %s), (%s, %s), (%s, %s)',
+                "INSERT INTO t (a, b) VALUES (1, 'x'), (2, 'y')",
+            ),
+            (
+                'SELECT *\n  FROM t\tWHERE id = 1 ',
+                'SELECT * FROM t WHERE id = 2',
+            ),
+        ):
+            with self.subTest(statements[0]):
+                self.assertEqual(
+                    len(set(map(querylog.fingerprint, statements))), 1
+                )
+        self.assertNotEqual(
+            querylog.fingerprint('SELECT * FROM t'),
+            querylog.fingerprint('SELECT * FROM u'),
+        )
+
+    @override_settings(QUERY_STATS_FLUSH_INTERVAL=0)
+    def test_queries_are_aggregated_per_view(self):
+        client = Client()
+        with self.settings(QUERY_STATS_DIR=self.directory):
+            for _ in range(2):
+                cache.clear()
+                client.get(f'/api/tags/{self.tag.id}/')
+            cache.clear()
+            client.get('/api/users/')
+        views = querylog.query_stats.views
+        self.assertIn('api:users-list', views)
+        detail = views['api:tags-detail']
+        self.assertEqual(
+            [stats['count'] for stats in detail.values()], [2]
+        )
+        self.assertEqual(querylog.load_stats(self.directory), views)
+
+    def test_streamed_lists_are_logged(self):
+        response = Client().get('/api/tags/')
+        self.assertTrue(response.streaming)
+        self.assertEqual(querylog.query_stats.views, {})
+        b''.join(response.streaming_content)
+        self.assertEqual([
+            stats['count']
+            for stats in querylog.query_stats.views['api:tags-list'].values()
+        ], [1])
+
+    def test_load_stats_merges_workers(self):
+        for pid, stats in (
+            (1, {'count': 2, 'total': 0.5, 'max': 0.25, 'rows': 4}),
+            (2, {'count': 1, 'total': 1.0, 'max': 1.0, 'rows': 1}),
+        ):
+            with open(os.path.join(self.directory, f'{pid}.json'), 'w') as f:
+                json.dump({'api:tags-list': {'SELECT ?': stats}}, f)
+        with open(os.path.join(self.directory, '3.json.tmp'), 'w') as f:
+            f.write('{')
+        self.assertEqual(querylog.load_stats(self.directory), {
+            'api:tags-list': {
+                'SELECT ?': {'count': 3, 'total': 1.5, 'max': 1.0, 'rows': 5},
+            },
+        })
+        self.assertEqual(
+            querylog.load_stats(os.path.join(self.directory, 'missing')), {}
+        )
+
+
+class ProfilingMiddlewareTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        profiles = override_settings(
+            PROFILING_DIR=self.directory, PROFILING_SAMPLE_RATE=0
+        )
+        profiles.enable()
+        self.addCleanup(profiles.disable)
+
+    def get(self, data=None, **extra):
+        # the middleware reads its settings once, so every request gets a
+        # fresh handler
+        return Client().get('/api/tags/', data, **extra)
+
+    def assert_profiled(self, response, extension='prof'):
+        self.assertEqual(response.status_code, 200)
+        name = response['X-Profile-Id']
+        self.assertTrue(os.path.isfile(
+            os.path.join(self.directory, f'{name}.{extension}')
+        ))
+        with open(os.path.join(self.directory, f'{name}.sql.json')) as file:
+            timeline = json.load(file)
+        self.assertEqual(timeline['status'], 200)
+        self.assertTrue(timeline['path'].startswith('/api/tags/'))
+        return name
+
+    def assert_not_profiled(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('X-Profile-Id'))
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_header_and_parameter(self):
+        names = {
+            self.assert_profiled(
+                self.get(HTTP_X_PROFILE=profiling.make_token())
+            ),
+            self.assert_profiled(
+                self.get({'_profile': profiling.make_token()})
+            ),
+        }
+        self.assertEqual(len(os.listdir(self.directory)), 4)
+        self.assertEqual(len(names), 2)
+
+    def test_bad_tokens_are_ignored(self):
+        token = profiling.make_token()
+        with mock.patch(
+            'django.core.signing.time.time',
+            return_value=time.time() - settings.PROFILING_TOKEN_MAX_AGE - 1,
+        ):
+            expired = profiling.make_token()
+        tampered = token[:-1] + ('A' if token[-1] != 'A' else 'B')
+        for bad in (expired, tampered, 'profile'):
+            with self.subTest(bad):
+                self.assert_not_profiled(self.get(HTTP_X_PROFILE=bad))
+                self.assert_not_profiled(self.get({'_profile': bad}))
+
+    def test_unprofiled_requests(self):
+        self.assert_not_profiled(self.get())
+
+    def test_sampling(self):
+        with mock.patch('api.profiling.random.random', return_value=0.3):
+            with self.settings(PROFILING_SAMPLE_RATE=0.2):
+                self.assert_not_profiled(self.get())
+            with self.settings(PROFILING_SAMPLE_RATE=0.5):
+                self.assert_profiled(self.get())
+
+    @override_settings(PROFILING_MODE='sampler', PROFILING_SAMPLE_RATE=1)
+    def test_stack_sampler(self):
+        self.assert_profiled(self.get(), 'folded')
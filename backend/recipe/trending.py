@@ -0,0 +1,55 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+
+from .models import RecipeScore
+
+TOP_CACHE_KEY = 'trending:top:1'
+
+
+def record(recipe_id, weight):
+    """Add ``weight`` to the recipe score.
+
+    Removals are not recorded: the weight of an event has been decayed
+    since it was added and its age is not known, so subtracting it would
+    eat into the weight of other events. It fades out with them instead.
+    """
+    updated = RecipeScore.objects.filter(recipe_id=recipe_id).update(
+        score=F('score') + weight
+    )
+    if not updated:
+        RecipeScore.objects.bulk_create(
+            [RecipeScore(recipe_id=recipe_id, score=0)],
+            ignore_conflicts=True,
+        )
+        RecipeScore.objects.filter(recipe_id=recipe_id).update(
+            score=F('score') + weight
+        )
+
+
+def decay():
+    """Age all scores by one ``DECAY_INTERVAL`` and drop negligible ones.
+
+    Recent events weigh more because older ones have been decayed more
+    times, no per-event history is kept.
+    """
+    options = settings.TRENDING
+    factor = 0.5 ** (options['DECAY_INTERVAL'] / options['HALF_LIFE'])
+    RecipeScore.objects.update(score=F('score') * factor)
+    RecipeScore.objects.filter(score__lt=options['MIN_SCORE']).delete()
+    cache.delete(TOP_CACHE_KEY)
+
+
+def top_ids():
+    """Ids of the ``TOP_K`` best scored recipes, best first.
+
+    The list is read from the score index and shared through the cache
+    for ``CACHE_TIMEOUT`` seconds, so new events show up with that lag.
+    """
+    ids = cache.get(TOP_CACHE_KEY)
+    if ids is None:
+        ids = list(RecipeScore.objects.filter(score__gt=0).order_by(
+            '-score', 'recipe_id'
+        ).values_list('recipe_id', flat=True)[:settings.TRENDING['TOP_K']])
+        cache.set(TOP_CACHE_KEY, ids, settings.TRENDING['CACHE_TIMEOUT'])
+    return ids
@@ -11,9 +11,14 @@ class UserAdmin(admin.ModelAdmin):
     list_display = (
         'id', 'username', 'email',
         'first_name', 'last_name',)
-    search_fields = ('email', 'username', 'first_name', 'last_name')
-    list_filter = ('email', 'first_name')
+    search_fields = ('=email', '^username', '^first_name', '^last_name')
     empty_value_display = '-пусто-'
+    show_full_result_count = False
 
 
-admin.site.register(Subscribe)
+@admin.register(Subscribe)
+class SubscribeAdmin(admin.ModelAdmin):
+    list_display = ('id', 'follower', 'following')
+    list_select_related = ('follower', 'following')
+    autocomplete_fields = ('follower', 'following')
+    show_full_result_count = False
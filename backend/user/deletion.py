@@ -0,0 +1,50 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from recipe.models import Favorite, Recipe, ShoppingCart
+from rest_framework.authtoken.models import Token
+
+from .models import Subscribe
+
+User = get_user_model()
+
+
+def is_large(user):
+    """Whether deleting the user cascades to more rows than a request
+    should delete, counted without scanning past the limit."""
+    limit = settings.CASCADE_DELETE['SYNC_LIMIT']
+    return Recipe.objects.filter(author=user)[:limit + 1].count() > limit
+
+
+def deactivate(user):
+    """Hide the user from logins until the background delete is done."""
+    User.objects.filter(id=user.id).update(is_active=False)
+    Token.objects.filter(user=user).delete()
+
+
+def delete_in_chunks(queryset, chunk_size):
+    """Delete ``queryset`` ``chunk_size`` rows at a time, each chunk with
+    its cascade in its own transaction, so no lock is held for long and
+    a retry continues where the last attempt stopped."""
+    deleted = 0
+    while True:
+        with transaction.atomic():
+            ids = list(queryset.values_list('id', flat=True)[:chunk_size])
+            if not ids:
+                return deleted
+            deleted += queryset.model.objects.filter(id__in=ids).delete()[0]
+
+
+def delete_user(user_id):
+    """Delete the user and everything that references them."""
+    chunk_size = settings.CASCADE_DELETE['CHUNK_SIZE']
+    deleted = 0
+    for queryset in (
+        Recipe.objects.filter(author_id=user_id),
+        Favorite.objects.filter(user_id=user_id),
+        ShoppingCart.objects.filter(user_id=user_id),
+        Subscribe.objects.filter(follower_id=user_id),
+        Subscribe.objects.filter(following_id=user_id),
+    ):
+        deleted += delete_in_chunks(queryset, chunk_size)
+    return deleted + User.objects.filter(id=user_id).delete()[0]
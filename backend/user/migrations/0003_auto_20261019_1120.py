@@ -0,0 +1,29 @@
+# Generated by Django 2.2.16 on 2026-10-19 11:20
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def remove_duplicates(apps, schema_editor):
+    Subscribe = apps.get_model('user', 'Subscribe')
+    duplicates = Subscribe.objects.values(
+        'follower', 'following'
+    ).annotate(
+        first_id=Min('id'), total=Count('id')
+    ).filter(total__gt=1)
+    for duplicate in duplicates.iterator():
+        Subscribe.objects.filter(
+            follower=duplicate['follower'],
+            following=duplicate['following'],
+        ).exclude(id=duplicate['first_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0002_auto_20220826_1900'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+    ]
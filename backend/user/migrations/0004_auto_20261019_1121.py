@@ -0,0 +1,17 @@
+# Generated by Django 2.2.16 on 2026-10-19 11:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0003_auto_20261019_1120'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='subscribe',
+            constraint=models.UniqueConstraint(fields=('follower', 'following'), name='unique_subscribe'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 2.2.16 on 2026-10-19 12:40
+
+from django.db import migrations
+
+# Expressions match the UPPER("column"::text) LIKE UPPER(...) that
+# istartswith and icontains compile to on PostgreSQL.
+SEARCH_FIELDS = ('username', 'first_name', 'last_name', 'email')
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for field in SEARCH_FIELDS:
+        schema_editor.execute(
+            f'CREATE INDEX user_user_{field}_upper_like '
+            f'ON user_user (UPPER({field}::text) text_pattern_ops)'
+        )
+        schema_editor.execute(
+            f'CREATE INDEX user_user_{field}_upper_trgm '
+            f'ON user_user USING gin (UPPER({field}::text) gin_trgm_ops)'
+        )
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for field in SEARCH_FIELDS:
+        schema_editor.execute(
+            f'DROP INDEX IF EXISTS user_user_{field}_upper_like'
+        )
+        schema_editor.execute(
+            f'DROP INDEX IF EXISTS user_user_{field}_upper_trgm'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0004_auto_20261019_1121'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -40,3 +40,11 @@ class Subscribe(models.Model):
         on_delete=models.CASCADE,
         related_name='following',
     )
+
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(
+                fields=('follower', 'following'),
+                name='unique_subscribe',
+            ),
+        )
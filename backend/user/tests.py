@@ -0,0 +1,193 @@
+from unittest import skipUnless
+
+from api.filters import search
+from api.hashers import HashingBusy, hash_pool
+from api.models import Job
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import connection
+from django.test import TestCase, override_settings
+from recipe.models import Favorite, Recipe, RecipeIngredient
+from recipe.tests import QueryPlanMixin
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from . import deletion
+from .models import Subscribe
+
+User = get_user_model()
+
+
+class SubscribeQueryPlanTest(QueryPlanMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.bulk_create(
+            User(email=f'user{i}@foodgram.ru', username=f'user{i}')
+            for i in range(20)
+        )
+        cls.users = list(User.objects.all())
+        Subscribe.objects.bulk_create(
+            Subscribe(follower=cls.users[0], following=user)
+            for user in cls.users[1:]
+        )
+
+    def test_subscription_flag(self):
+        self.assert_no_seq_scan(Subscribe.objects.filter(
+            follower=self.users[0], following=self.users[1]
+        ))
+
+    def test_subscriptions_of_user(self):
+        self.assert_no_seq_scan(
+            Subscribe.objects.filter(follower=self.users[0])
+        )
+
+
+class UserSearchTest(QueryPlanMixin, TestCase):
+    fields = ('username', 'first_name', 'last_name', 'email')
+
+    @classmethod
+    def setUpTestData(cls):
+        for username, first_name, last_name in (
+            ('ivan', 'Ivan', 'Petrov'),
+            ('petr', 'Petr', 'Ivanov'),
+            ('cook', 'Maria', 'Smirnova'),
+        ):
+            User.objects.create(
+                email=f'{username}@foodgram.ru', username=username,
+                first_name=first_name, last_name=last_name,
+            )
+
+    def search(self, term):
+        response = APIClient().get('/api/users/', {'search': term})
+        self.assertEqual(response.status_code, 200)
+        return [user['username'] for user in response.json()['results']]
+
+    def test_prefix_of_any_field(self):
+        self.assertEqual(self.search('iva'), ['ivan', 'petr'])
+        self.assertEqual(self.search('SMIR'), ['cook'])
+        self.assertEqual(self.search('cook@'), ['cook'])
+
+    def test_every_term_matches(self):
+        self.assertEqual(self.search('ivan petrov'), ['ivan'])
+        self.assertEqual(self.search('maria petrov'), [])
+
+    def test_without_search_lists_everyone(self):
+        self.assertEqual(self.search(''), ['ivan', 'petr', 'cook'])
+
+    @skipUnless(
+        connection.vendor == 'postgresql',
+        'Индексы для поиска пользователей есть только в PostgreSQL.'
+    )
+    def test_search_is_indexed(self):
+        for term in ('iv', 'ivanov'):
+            self.assert_no_seq_scan(
+                search(User.objects.all(), self.fields, [term])
+            )
+
+
+@override_settings(PASSWORD_HASHING={
+    'ITERATIONS': 1000, 'WORKERS': 0, 'QUEUE': 0, 'TIMEOUT': 0,
+})
+class PasswordHashingTest(TestCase):
+
+    def test_login_upgrades_hash(self):
+        user = User.objects.create(
+            email='cook@foodgram.ru',
+            username='cook',
+            password=make_password('secret-pass', hasher='pbkdf2_sha1'),
+        )
+        response = APIClient().post('/api/auth/token/login/', {
+            'email': 'cook@foodgram.ru', 'password': 'secret-pass',
+        })
+        self.assertEqual(response.status_code, 200)
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith('pbkdf2_sha256$1000$'))
+
+    def test_full_pool_rejects(self):
+        with self.settings(PASSWORD_HASHING={
+            'ITERATIONS': 1000, 'WORKERS': 1, 'QUEUE': 0, 'TIMEOUT': 0,
+        }):
+            executor, slots = hash_pool.get_executor()
+            slots.acquire()
+            try:
+                with self.assertRaises(HashingBusy):
+                    make_password('secret-pass')
+            finally:
+                slots.release()
+                hash_pool.reset(executor)
+
+
+@override_settings(CASCADE_DELETE={'SYNC_LIMIT': 1, 'CHUNK_SIZE': 1})
+class UserDeletionTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cook = User.objects.create(
+            email='cook@foodgram.ru', username='cook'
+        )
+        cls.reader = User.objects.create(
+            email='reader@foodgram.ru', username='reader'
+        )
+        recipes = [
+            Recipe.objects.create(
+                name=f'Рецепт {i}', text='...', cooking_time=10,
+                author=cls.cook,
+            )
+            for i in range(2)
+        ]
+        Favorite.objects.create(user=cls.reader, recipe=recipes[0])
+        Favorite.objects.create(user=cls.cook, recipe=recipes[1])
+        Subscribe.objects.create(follower=cls.reader, following=cls.cook)
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def test_only_the_user_or_an_admin_deletes(self):
+        path = f'/api/users/{self.cook.id}/'
+        self.assertEqual(APIClient().delete(path).status_code, 401)
+        self.assertEqual(
+            self.client_for(self.reader).delete(path).status_code, 403
+        )
+        self.assertTrue(User.objects.get(id=self.cook.id).is_active)
+        self.assertFalse(Job.objects.exists())
+        admin = User.objects.create(
+            email='admin@foodgram.ru', username='admin', is_superuser=True
+        )
+        self.assertEqual(
+            self.client_for(admin).delete(
+                f'/api/users/{self.reader.id}/'
+            ).status_code,
+            204,
+        )
+
+    def test_small_cascade_is_deleted_inline(self):
+        Recipe.objects.filter(author=self.cook).first().delete()
+        response = self.client_for(self.cook).delete(
+            f'/api/users/{self.cook.id}/'
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(User.objects.filter(id=self.cook.id).exists())
+        self.assertFalse(Job.objects.exists())
+
+    def test_large_cascade_is_deleted_by_job(self):
+        Token.objects.create(user=self.cook)
+        client = self.client_for(self.cook)
+        response = client.delete(f'/api/users/{self.cook.id}/')
+        self.assertEqual(response.status_code, 202)
+        self.assertFalse(User.objects.get(id=self.cook.id).is_active)
+        self.assertFalse(Token.objects.filter(user=self.cook).exists())
+        job = Job.objects.get()
+        self.assertEqual(job.idempotency_key, f'delete_user:{self.cook.id}')
+        client.delete(f'/api/users/{self.cook.id}/')
+        self.assertEqual(Job.objects.count(), 1)
+
+        deletion.delete_user(self.cook.id)
+        self.assertFalse(User.objects.filter(id=self.cook.id).exists())
+        self.assertFalse(Recipe.objects.exists())
+        self.assertFalse(RecipeIngredient.objects.exists())
+        self.assertFalse(Favorite.objects.exists())
+        self.assertFalse(Subscribe.objects.exists())
+        self.assertTrue(User.objects.filter(id=self.reader.id).exists())